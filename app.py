@@ -1,15 +1,21 @@
 import os
+import copy
 import json
 import time
+import hashlib
 import logging
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, redirect, url_for, flash, session, send_from_directory
 from dotenv import load_dotenv
-import alpaca_trade_api as tradeapi
-from utils.backtest_engine import BacktestEngine
-from utils.data_fetcher import DataFetcher
 from utils.strategy_parser import StrategyParser
-from utils.auth_utils import register_user, verify_user, login_user, logout_user
-from utils.trade_manager import save_paper_trade, get_user_portfolio
+from utils.auth_utils import register_user, verify_user, login_user, logout_user, start_code_sweeper
+from utils import leaderboard, strategy_store, live_strategies
+from utils.content_cache import get_content_cache, send_document
+from utils import event_broker
+from utils import admission
+from utils import metrics
+from utils.admission import admit
+from utils.services import api, data_fetcher, backtest_engine, matching_engine, screener
+from utils.trade_manager import save_paper_trade, get_user_portfolio, get_portfolio_version, get_order, list_orders, start_compactor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,42 +23,79 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your_default_secret_key')
 
-# Ensure directories exist
-os.makedirs('data/saved_strategies', exist_ok=True)
-os.makedirs('data', exist_ok=True)
-os.chmod('data/saved_strategies', 0o755)  # Read/write/execute for owner, read/execute for others
+# Routes are registered on a blueprint so importing this module has no side
+# effects; the Alpaca client, pandas and the engines built on them are only
+# created when a request first needs them (see utils/services.py)
+main = Blueprint('main', __name__)
 
-# Initialize Alpaca API
-ALPACA_API_KEY = os.getenv('APCA_API_KEY_ID')
-ALPACA_SECRET_KEY = os.getenv('APCA_API_SECRET_KEY')
-api = tradeapi.REST(ALPACA_API_KEY, ALPACA_SECRET_KEY, base_url='https://paper-api.alpaca.markets')
+def create_app():
+    """
+    Create and configure the AlgoBlocks Flask app
+    
+    Returns:
+        Flask: The configured app
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your_default_secret_key')
+    
+    # Ensure directories exist
+    os.makedirs(strategy_store.STRATEGY_DIR, exist_ok=True)
+    os.makedirs('data', exist_ok=True)
+    os.chmod(strategy_store.STRATEGY_DIR, 0o755)  # Read/write/execute for owner, read/execute for others
+    
+    # Parse and compress the tutorial documents once, before gunicorn forks workers
+    get_content_cache().preload([TUTORIAL_CONTENT, TUTORIAL_TERMS])
+    
+    app.register_blueprint(main)
+    # Per-route latency, status and in-flight counts for /metrics
+    metrics.init_app(app)
+    
+    # Under gunicorn the services are started in each worker after fork instead
+    if os.getenv('ALGOBLOCKS_START_SERVICES', '1') == '1':
+        start_background_services()
+    return app
 
-# Initialize services
-data_fetcher = DataFetcher(api)
-backtest_engine = BacktestEngine(data_fetcher)
+def start_background_services():
+    """
+    Start the order matcher, journal compactor, leaderboard and event refreshers, the live strategy runner, the verification code sweeper and the metrics flusher for this process
+
+    Services that poll Alpaca (bar matching, leaderboard marks, the market
+    clock, live strategies) run in whichever process holds their lease, so
+    upstream traffic stays the same however many workers are started.
+    """
+    matching_engine.start()
+    # Fold paper-trading journal tails into portfolio snapshots in the background
+    start_compactor()
+    leaderboard.start_refresher(data_fetcher)
+    # One clock refresh and one portfolio change check feed every open event stream
+    event_broker.start_watchers(lambda: api.get_clock())
+    # Saved strategies running live are evaluated by whichever process holds the runner lease
+    live_strategies.start_runner()
+    # Expired verification codes are deleted on a timer, not only when someone registers
+    start_code_sweeper()
+    # Save this process's metrics so a scrape of any worker covers all of them
+    metrics.start_flusher()
 
 # --- AUTH ROUTES ---
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if 'user_email' in session:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
         success, message = login_user(email, password)
         if success:
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         else:
             flash(message, 'danger')
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     if 'user_email' in session:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
@@ -60,69 +103,72 @@ def register():
         success, message = register_user(email, password, username)
         if success:
             flash('Registration successful! Please check your email for verification.', 'success')
-            return redirect(url_for('verify'))
+            return redirect(url_for('main.verify'))
         else:
             flash(message, 'danger')
     return render_template('register.html')
 
-@app.route('/verify', methods=['GET', 'POST'])
+@main.route('/verify', methods=['GET', 'POST'])
 def verify():
     if 'user_email' in session:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if request.method == 'POST':
         email = request.form.get('email')
         code = request.form.get('code')
         success, message = verify_user(email, code)
         if success:
             flash('Email verified! You can now log in.', 'success')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         else:
             flash(message, 'danger')
     return render_template('verify.html')
 
-@app.route('/logout')
+@main.route('/logout')
 def logout():
     logout_user()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 # --- MAIN ROUTES ---
-@app.route('/')
+@main.route('/')
 def index():
     if 'user_email' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('index.html')
 
-@app.route('/portfolio')
+@main.route('/portfolio')
 def portfolio():
     if 'user_email' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     email = session['user_email']
     portfolio_data = get_user_portfolio(email)
     if not portfolio_data:
         flash('Error loading portfolio.', 'danger')
-        return redirect(url_for('index'))
-    return render_template('portfolio.html', portfolio=portfolio_data)
+        return redirect(url_for('main.index'))
+    return render_template('portfolio.html', portfolio=portfolio_data,
+                           portfolio_etag=portfolio_etag(email, portfolio_data['version']))
 
-@app.route('/tutorial')
+@main.route('/tutorial')
 def tutorial():
     if 'user_email' not in session:
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('tutorial.html')
 
 # --- TUTORIAL API ROUTES ---
-@app.route('/api/tutorial/content')
+TUTORIAL_CONTENT = os.path.join(main.root_path, 'tutorials', 'content.json')
+TUTORIAL_TERMS = os.path.join(main.root_path, 'tutorials', 'terms.json')
+
+@main.route('/api/tutorial/content')
 def tutorial_content():
-    with open('tutorials/content.json', 'r', encoding='utf-8') as f:
-        return jsonify(json.load(f))
+    return send_document(get_content_cache().get(TUTORIAL_CONTENT))
 
-@app.route('/api/tutorial/terms')
+@main.route('/api/tutorial/terms')
 def tutorial_terms():
-    with open('tutorials/terms.json', 'r', encoding='utf-8') as f:
-        return jsonify(json.load(f))
+    return send_document(get_content_cache().get(TUTORIAL_TERMS))
 
 # --- API ROUTES ---
-@app.route('/api/markets', methods=['GET'])
+@main.route('/api/markets', methods=['GET'])
+@admit('market_data')
 def get_market_status():
     try:
         clock = api.get_clock()
@@ -135,13 +181,54 @@ def get_market_status():
         logger.error(f"Error fetching market status: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/symbols', methods=['GET'])
+@main.route('/api/events')
+def events():
+    """Stream market status and portfolio changes to the browser as Server-Sent Events"""
+    if 'user_email' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    email = session['user_email']
+    requested = request.args.get('topics', 'market,portfolio').split(',')
+
+    topics = []
+    if 'market' in requested:
+        topics.append(event_broker.MARKET_TOPIC)
+    if 'portfolio' in requested:
+        topics.append(event_broker.portfolio_topic(email))
+    if not topics:
+        return jsonify({'error': 'No known topics requested'}), 400
+
+    broker = event_broker.get_broker()
+    subscription = broker.subscribe(topics)
+    if subscription is None:
+        # Clients fall back to polling rather than retrying
+        response = jsonify({'error': 'Too many open event streams'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    # Start the client from the current state; the portfolio version doubles
+    # as the event id, so a reconnect with an up-to-date Last-Event-ID is quiet
+    initial = []
+    if event_broker.MARKET_TOPIC in topics and broker.retained(event_broker.MARKET_TOPIC):
+        initial.append(broker.retained(event_broker.MARKET_TOPIC))
+    if 'portfolio' in requested:
+        version = get_portfolio_version(email)
+        if version is not None and request.headers.get('Last-Event-ID') != str(version):
+            initial.append(event_broker.format_event('portfolio', {'version': version}, event_id=version))
+
+    response = current_app.response_class(broker.stream(subscription, initial), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    return response
+
+@main.route('/api/symbols', methods=['GET'])
+@admit('market_data')
 def get_available_symbols():
     try:
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 50))
         assets = api.list_assets(status='active')
-        symbols = [asset.symbol for asset in assets if asset.tradable and asset.asset_class == 'us_equity']
+        symbols = [asset.symbol for asset in assets if asset.tradable and getattr(asset, 'class', None) == 'us_equity']
         
         # Calculate pagination
         start_idx = (page - 1) * per_page
@@ -165,7 +252,8 @@ def get_available_symbols():
         logger.error(f"Error fetching symbols: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/search-symbols', methods=['GET'])
+@main.route('/api/search-symbols', methods=['GET'])
+@admit('market_data')
 def search_symbols():
     query = request.args.get('query', '').upper()
     try:
@@ -173,7 +261,7 @@ def search_symbols():
         symbols = [
             {"symbol": asset.symbol, "name": asset.name}
             for asset in assets
-            if asset.tradable and asset.asset_class == 'us_equity' and
+            if asset.tradable and getattr(asset, 'class', None) == 'us_equity' and
             (query in asset.symbol or (asset.name and query in asset.name.upper()))
         ]
         
@@ -196,7 +284,8 @@ def search_symbols():
         logger.error(f"Error searching symbols: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/historical-data', methods=['GET'])
+@main.route('/api/historical-data', methods=['GET'])
+@admit('market_data')
 def get_historical_data():
     symbol = request.args.get('symbol', 'AAPL')
     timeframe = request.args.get('timeframe', '1D')
@@ -208,7 +297,8 @@ def get_historical_data():
         logger.error(f"Error fetching historical data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/account', methods=['GET'])
+@main.route('/api/account', methods=['GET'])
+@admit('market_data')
 def get_account():
     try:
         account = api.get_account()
@@ -223,7 +313,8 @@ def get_account():
         logger.error(f"Error fetching account: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/positions', methods=['GET'])
+@main.route('/api/positions', methods=['GET'])
+@admit('market_data')
 def get_positions():
     try:
         positions = api.list_positions()
@@ -243,10 +334,80 @@ def get_positions():
         logger.error(f"Error fetching positions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/backtest', methods=['POST'])
+def build_strategy(blocks):
+    """
+    Turn editor blocks (or an already parsed strategy) into a backtestable strategy
+    
+    Strategies with indicators but no entry or exit rules get default rules
+    based on their first indicator, with exits mirroring the entries.
+    
+    Args:
+        blocks: Block list from the editor, or a dict with 'indicators' and rules
+        
+    Returns:
+        dict: Strategy configuration with indicators, entry_rules and exit_rules
+    """
+    if isinstance(blocks, dict) and 'indicators' in blocks:
+        strategy = blocks
+    else:
+        parser = StrategyParser(blocks)
+        strategy = parser.parse_blocks()
+        
+    # Make sure we have some entry/exit rules
+    if (not strategy.get('entry_rules') or not strategy.get('exit_rules')) and len(strategy.get('indicators', [])) > 0:
+        logger.warning("No entry or exit rules found, adding default rules")
+        
+        # Add default entry rules if none exist
+        if not strategy.get('entry_rules'):
+            strategy['entry_rules'] = []
+            # Try to create a rule based on the first indicator
+            for ind in strategy['indicators']:
+                if ind['type'] == 'SMA':
+                    period = ind['parameters']['period']
+                    strategy['entry_rules'] = [
+                        {'indicator': f"SMA_{period}", 'operator': '>', 'value': 'close'}
+                    ]
+                    break
+                elif ind['type'] == 'RSI':
+                    period = ind['parameters']['period']
+                    strategy['entry_rules'] = [
+                        {'indicator': f"RSI_{period}", 'operator': '>', 'value': '50'}
+                    ]
+                    break
+                elif ind['type'] == 'EMA':
+                    period = ind['parameters']['period']
+                    strategy['entry_rules'] = [
+                        {'indicator': f"EMA_{period}", 'operator': '>', 'value': 'close'}
+                    ]
+                    break
+        
+        # Add default exit rules if none exist
+        if not strategy.get('exit_rules') and strategy.get('entry_rules'):
+            strategy['exit_rules'] = []
+            # Mirror the entry rules with opposite conditions
+            for rule in strategy['entry_rules']:
+                if 'expression' in rule:
+                    strategy['exit_rules'].append({'expression': f"not ({rule['expression']})"})
+                    continue
+                exit_rule = rule.copy()
+                if exit_rule['operator'] == '>':
+                    exit_rule['operator'] = '<'
+                elif exit_rule['operator'] == '<':
+                    exit_rule['operator'] = '>'
+                elif exit_rule['operator'] == '>=':
+                    exit_rule['operator'] = '<='
+                elif exit_rule['operator'] == '<=':
+                    exit_rule['operator'] = '>='
+                strategy['exit_rules'].append(exit_rule)
+    return strategy
+
+@main.route('/api/backtest', methods=['POST'])
+@admit('backtest')
 def run_backtest():
     if 'user_email' not in session:
         return jsonify({"error": "Please log in to run a backtest"}), 401
+    # Imported here so pages that never backtest do not load NumPy
+    from utils.strategy_compiler import StrategyCompileError
     try:
         if not request.is_json:
             return jsonify({"error": "Invalid content type, JSON required"}), 400
@@ -257,59 +418,11 @@ def run_backtest():
         initial_capital = float(strategy_config.get('capital', 10000))
         blocks = strategy_config.get('blocks')
         
-        if isinstance(blocks, dict) and 'indicators' in blocks:
-            strategy = blocks
-        else:
-            parser = StrategyParser(blocks)
-            strategy = parser.parse_blocks()
-            
+        strategy = build_strategy(blocks)
+        
         # Log the parsed strategy
         logger.info(f"Running backtest for {symbol} from {start_date} to {end_date}")
         
-        # Make sure we have some entry/exit rules
-        if (not strategy.get('entry_rules') or not strategy.get('exit_rules')) and len(strategy.get('indicators', [])) > 0:
-            logger.warning("No entry or exit rules found, adding default rules")
-            
-            # Add default entry rules if none exist
-            if not strategy.get('entry_rules'):
-                strategy['entry_rules'] = []
-                # Try to create a rule based on the first indicator
-                for ind in strategy['indicators']:
-                    if ind['type'] == 'SMA':
-                        period = ind['parameters']['period']
-                        strategy['entry_rules'] = [
-                            {'indicator': f"SMA_{period}", 'operator': '>', 'value': 'close'}
-                        ]
-                        break
-                    elif ind['type'] == 'RSI':
-                        period = ind['parameters']['period']
-                        strategy['entry_rules'] = [
-                            {'indicator': f"RSI_{period}", 'operator': '>', 'value': '50'}
-                        ]
-                        break
-                    elif ind['type'] == 'EMA':
-                        period = ind['parameters']['period']
-                        strategy['entry_rules'] = [
-                            {'indicator': f"EMA_{period}", 'operator': '>', 'value': 'close'}
-                        ]
-                        break
-            
-            # Add default exit rules if none exist
-            if not strategy.get('exit_rules') and strategy.get('entry_rules'):
-                strategy['exit_rules'] = []
-                # Mirror the entry rules with opposite conditions
-                for rule in strategy['entry_rules']:
-                    exit_rule = rule.copy()
-                    if exit_rule['operator'] == '>':
-                        exit_rule['operator'] = '<'
-                    elif exit_rule['operator'] == '<':
-                        exit_rule['operator'] = '>'
-                    elif exit_rule['operator'] == '>=':
-                        exit_rule['operator'] = '<='
-                    elif exit_rule['operator'] == '<=':
-                        exit_rule['operator'] = '>='
-                    strategy['exit_rules'].append(exit_rule)
-        
         results = backtest_engine.run_backtest(
             strategy=strategy,
             symbol=symbol,
@@ -319,14 +432,198 @@ def run_backtest():
         )
         
         # Log the results summary
-        logger.info(f"Backtest completed: {results['total_trades']} trades, {results['total_return']}% return")
+        logger.info(f"Backtest completed: {results.total_trades} trades, {results.total_return}% return")
         
-        return jsonify(results)
+        return jsonify(results.to_dict())
+    except StrategyCompileError as e:
+        return jsonify({'error': f"Invalid strategy rule: {str(e)}"}), 400
     except Exception as e:
         logger.error(f"Error running backtest: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/paper-trade', methods=['POST'])
+# Largest number of strategies compared in one tournament
+TOURNAMENT_MAX_STRATEGIES = 100
+
+@main.route('/api/tournament', methods=['POST'])
+@admit('backtest')
+def run_tournament():
+    """Backtest several saved strategies on the same bars and rank them side by side"""
+    if 'user_email' not in session:
+        return jsonify({"error": "Please log in to run a tournament"}), 401
+    if not request.is_json:
+        return jsonify({"error": "Invalid content type, JSON required"}), 400
+    try:
+        config = request.get_json()
+        email = session['user_email']
+        symbol = config.get('symbol', 'AAPL')
+        start_date = config.get('startDate')
+        end_date = config.get('endDate')
+        initial_capital = float(config.get('capital', 10000))
+        include_curves = bool(config.get('includeCurves', False))
+        
+        # Default to every strategy the user can load
+        names = config.get('strategies') or [entry['name'] for entry in strategy_store.list_strategies(email)]
+        if len(names) > TOURNAMENT_MAX_STRATEGIES:
+            return jsonify({"error": f"At most {TOURNAMENT_MAX_STRATEGIES} strategies can be compared at once"}), 400
+        
+        strategies = {}
+        errors = {}
+        for name in names:
+            entry = strategy_store.get_strategy_entry(strategy_store.sanitize_name(str(name)))
+            if entry is None or (entry['email'] is not None and entry['email'] != email):
+                errors[name] = "Strategy not found"
+                continue
+            try:
+                document = get_content_cache().get(strategy_store.strategy_path(entry['name']),
+                                                   version=(entry['mtime'], entry['size']))
+                # Strategies are built from a copy; the cached document is shared
+                strategies[entry['name']] = build_strategy(copy.deepcopy(document.data.get('blocks')))
+            except Exception as e:
+                errors[name] = f"Could not load strategy: {str(e)}"
+        if not strategies:
+            return jsonify({"error": "No strategies to compare", "errors": errors}), 400
+        
+        tournament = backtest_engine.run_tournament(
+            strategies=strategies,
+            symbol=symbol,
+            start_date=start_date,
+            end_date=end_date,
+            initial_capital=initial_capital
+        )
+        errors.update(tournament['errors'])
+        
+        standings = []
+        for name, results in tournament['results'].items():
+            standing = {key: getattr(results, key) for key in ('final_equity', 'total_return', 'sharpe_ratio', 'max_drawdown', 'total_trades')}
+            standing['name'] = name
+            if results.error:
+                standing['error'] = results.error
+            if include_curves:
+                standing['equity_curve'] = results.equity_curve.tolist()
+            standings.append(standing)
+        standings.sort(key=lambda standing: standing['total_return'], reverse=True)
+        for rank, standing in enumerate(standings, start=1):
+            standing['rank'] = rank
+        
+        return jsonify({
+            'symbol': symbol,
+            'startDate': start_date,
+            'endDate': end_date,
+            'initial_capital': initial_capital,
+            'shared_indicators': tournament['indicators'],
+            'standings': standings,
+            'errors': errors
+        })
+    except Exception as e:
+        logger.error(f"Error running tournament: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+# Upper limits on a parameter search's budget (in full backtests) and running time
+OPTIMIZER_MAX_EVALUATIONS = 500
+OPTIMIZER_MAX_SECONDS = 60
+
+@main.route('/api/optimize', methods=['POST'])
+@admit('backtest')
+def optimize_strategy():
+    """Search a strategy's indicator parameters and rule thresholds for the best backtest"""
+    if 'user_email' not in session:
+        return jsonify({"error": "Please log in to optimize a strategy"}), 401
+    if not request.is_json:
+        return jsonify({"error": "Invalid content type, JSON required"}), 400
+    # Imported here so pages that never backtest do not load NumPy
+    from utils.strategy_compiler import StrategyCompileError
+    from utils.optimizer import DEFAULT_MAX_EVALUATIONS, DEFAULT_TIME_BUDGET
+    try:
+        config = request.get_json()
+        symbol = config.get('symbol', 'AAPL')
+        start_date = config.get('startDate')
+        end_date = config.get('endDate')
+        objective = config.get('objective', 'sharpe_ratio')
+        budget = min(float(config.get('budget') or DEFAULT_MAX_EVALUATIONS), OPTIMIZER_MAX_EVALUATIONS)
+        time_budget = min(float(config.get('timeBudget') or DEFAULT_TIME_BUDGET), OPTIMIZER_MAX_SECONDS)
+        
+        search = backtest_engine.optimize(
+            strategy=build_strategy(config.get('blocks')),
+            symbol=symbol,
+            start_date=start_date,
+            end_date=end_date,
+            initial_capital=float(config.get('capital', 10000)),
+            space=config.get('space'),
+            objective=objective,
+            max_evaluations=budget,
+            time_budget=time_budget,
+            seed=config.get('seed')
+        )
+        
+        best = search['best']
+        leaderboard = []
+        for entry in search['leaderboard']:
+            standing = {key: getattr(entry['results'], key) for key in ('final_equity', 'total_return', 'sharpe_ratio', 'max_drawdown', 'total_trades')}
+            standing['parameters'] = entry['parameters']
+            leaderboard.append(standing)
+        response = {
+            'symbol': symbol,
+            'startDate': start_date,
+            'endDate': end_date,
+            'objective': objective,
+            'best': {
+                'parameters': best['parameters'],
+                'strategy': best['strategy'],
+                'results': best['results'].to_dict()
+            } if best else None,
+            'leaderboard': leaderboard,
+            'space': search['space'],
+            'stats': search['stats']
+        }
+        if search.get('error'):
+            response['error'] = search['error']
+        return jsonify(response)
+    except StrategyCompileError as e:
+        return jsonify({'error': f"Invalid strategy rule: {str(e)}"}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error optimizing strategy: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/screener', methods=['POST'])
+@admit('backtest')
+def run_screener():
+    """Find every tradable symbol whose latest daily bar meets a strategy's entry rules"""
+    if 'user_email' not in session:
+        return jsonify({"error": "Please log in to run the screener"}), 401
+    if not request.is_json:
+        return jsonify({"error": "Invalid content type, JSON required"}), 400
+    # Imported here so pages that never screen do not load NumPy
+    from utils.screener import SCREENER_MAX_MATCHES, UniverseNotReady
+    from utils.strategy_compiler import StrategyCompileError
+    try:
+        config = request.get_json()
+        if config.get('name'):
+            # Screen with a saved strategy
+            entry = strategy_store.get_strategy_entry(strategy_store.sanitize_name(str(config['name'])))
+            if entry is None or (entry['email'] is not None and entry['email'] != session['user_email']):
+                return jsonify({"error": "Strategy not found"}), 404
+            document = get_content_cache().get(strategy_store.strategy_path(entry['name']),
+                                               version=(entry['mtime'], entry['size']))
+            strategy = build_strategy(copy.deepcopy(document.data.get('blocks')))
+        else:
+            strategy = build_strategy(config.get('blocks'))
+        limit = max(1, min(int(config.get('limit', SCREENER_MAX_MATCHES)), SCREENER_MAX_MATCHES))
+        
+        return jsonify(screener.scan(strategy, limit=limit))
+    except UniverseNotReady as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    except StrategyCompileError as e:
+        return jsonify({'error': f"Invalid strategy rule: {str(e)}"}), 400
+    except Exception as e:
+        logger.error(f"Error running screener: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/paper-trade', methods=['POST'])
+@admit('market_data')
 def submit_paper_trade():
     if 'user_email' not in session:
         return jsonify({'error': 'Please log in to paper trade'}), 401
@@ -334,30 +631,142 @@ def submit_paper_trade():
         return jsonify({'error': 'Invalid request format'}), 400
     email = session['user_email']
     trade_data = request.json
-    success, result = save_paper_trade(email, trade_data)
+    success, result = save_paper_trade(email, trade_data, matching_engine)
     if success:
+        if result['status'] == 'filled':
+            message = 'Trade executed successfully'
+        elif result['status'] == 'partially_filled':
+            message = 'Order partially filled'
+        elif result['status'] == 'cancelled':
+            message = 'Order cancelled: ' + result['notes']
+        else:
+            message = 'Order placed'
         return jsonify({
             'success': True,
-            'message': 'Trade executed successfully',
+            'message': message,
             'data': result
         })
     else:
         return jsonify({'error': result}), 400
 
-@app.route('/api/portfolio/update', methods=['GET'])
+@main.route('/api/orders', methods=['GET'])
+def get_orders():
+    if 'user_email' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    status = request.args.get('status')
+    return jsonify({'orders': list_orders(session['user_email'], status=status)})
+
+@main.route('/api/orders/<order_id>', methods=['GET'])
+def get_order_status(order_id):
+    if 'user_email' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    order = get_order(session['user_email'], order_id)
+    if order is None:
+        return jsonify({'error': 'Order not found'}), 404
+    return jsonify(order)
+
+@main.route('/api/orders/<order_id>/cancel', methods=['POST'])
+def cancel_order(order_id):
+    if 'user_email' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    success, result = matching_engine.cancel_order(session['user_email'], order_id)
+    if success:
+        return jsonify({
+            'success': True,
+            'message': 'Order cancelled',
+            'data': result
+        })
+    else:
+        return jsonify({'error': result}), 400
+
+@main.route('/api/portfolio/update', methods=['GET'])
 def update_portfolio():
     if 'user_email' not in session:
         return jsonify({'error': 'Not logged in'}), 401
     email = session['user_email']
-    portfolio_data = get_user_portfolio(email)
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', 500, type=int), 1000)
+    
+    # The portfolio version changes with every trade, so an unchanged
+    # version means the client already has this response
+    version = get_portfolio_version(email)
+    if version is None:
+        return jsonify({'error': 'Failed to load portfolio'}), 400
+    if request.if_none_match.contains(portfolio_etag(email, version)):
+        response = current_app.response_class(status=304)
+        response.set_etag(portfolio_etag(email, version))
+        return response
+    
+    portfolio_data = get_user_portfolio(email, after_seq=after, limit=limit)
     if not portfolio_data:
         return jsonify({'error': 'Failed to load portfolio'}), 400
-    return jsonify({
+    response = jsonify({
         'success': True,
         'portfolio': portfolio_data
     })
+    response.set_etag(portfolio_etag(email, portfolio_data['version']))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def portfolio_etag(email, version):
+    """Build the ETag for a user's portfolio at a given version"""
+    user_key = hashlib.sha1(email.encode('utf-8')).hexdigest()[:12]
+    return f"{user_key}-{version}"
+
+def monitoring_denied():
+    """Check access to monitoring endpoints: the MONITORING_TOKEN bearer token if set, else a login"""
+    token = os.getenv('MONITORING_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            return jsonify({'error': 'Unauthorized'}), 401
+    elif 'user_email' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    return None
+
+@main.route('/api/admission', methods=['GET'])
+def get_admission_stats():
+    """Admission-control counters per capacity pool, for monitoring"""
+    denied = monitoring_denied()
+    if denied:
+        return denied
+    return jsonify({'pid': os.getpid(), 'pools': admission.get_stats()})
+
+@main.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Route, Alpaca call and cache metrics of every server process in Prometheus text format"""
+    denied = monitoring_denied()
+    if denied:
+        return denied
+    return current_app.response_class(metrics.render(metrics.collect()), content_type=metrics.CONTENT_TYPE)
+
+@main.route('/api/metrics/profiles', methods=['GET'])
+def list_profiles():
+    """Saved profiles of slow requests (see METRICS_PROFILE_RATE), newest first"""
+    denied = monitoring_denied()
+    if denied:
+        return denied
+    return jsonify({'profiles': metrics.list_profiles()})
+
+@main.route('/api/metrics/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Download one saved profile for pstats or snakeviz"""
+    denied = monitoring_denied()
+    if denied:
+        return denied
+    return send_from_directory(os.path.abspath(metrics.METRICS_PROFILE_DIR), name, as_attachment=True)
+
+@main.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    if 'user_email' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    sort = request.args.get('sort', 'total_return')
+    limit = min(int(request.args.get('limit', 50)), 500)
+    return jsonify({
+        'sort': sort if sort in leaderboard.SORT_COLUMNS else 'total_return',
+        'leaderboard': leaderboard.get_leaderboard(sort=sort, limit=limit)
+    })
 
-@app.route('/api/save-strategy', methods=['POST'])
+@main.route('/api/save-strategy', methods=['POST'])
 def save_strategy():
     if 'user_email' not in session:
         return jsonify({"error": "Please log in to save a strategy"}), 401
@@ -371,16 +780,12 @@ def save_strategy():
         strategy_data['user_email'] = session['user_email']
         strategy_data['username'] = session.get('username', 'Anonymous')
         strategy_name = strategy_data.get('name', f"strategy_{int(time.time())}")
-        strategy_name = ''.join(c for c in strategy_name if c.isalnum() or c in '._- ')
-        
-        save_dir = 'data/saved_strategies'
-        os.makedirs(save_dir, exist_ok=True)  # Ensure directory exists
-        
-        filepath = os.path.join(save_dir, f"{strategy_name}.json")
+        strategy_name = strategy_store.sanitize_name(strategy_name)
+        if not strategy_name:
+            return jsonify({"error": "Invalid strategy name"}), 400
         
         try:
-            with open(filepath, 'w') as f:
-                json.dump(strategy_data, f, indent=4)
+            strategy_store.save_strategy(strategy_name, strategy_data)
         except PermissionError:
             return jsonify({"error": "Permission denied saving strategy"}), 403
         except IOError:
@@ -395,34 +800,22 @@ def save_strategy():
         logger.error(f"Error saving strategy: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/list-strategies', methods=['GET'])
+@main.route('/api/list-strategies', methods=['GET'])
 def list_strategies():
     if 'user_email' not in session:
         return jsonify({"error": "Please log in to view strategies"}), 401
     try:
-        user_email = session['user_email']
-        strategy_files = os.listdir('data/saved_strategies')
-        strategies = []
-        
-        for filename in strategy_files:
-            if not filename.endswith('.json'):
-                continue
-                
-            filepath = os.path.join('data/saved_strategies', filename)
-            try:
-                with open(filepath, 'r') as f:
-                    strategy_data = json.load(f)
-                if 'user_email' not in strategy_data or strategy_data['user_email'] == user_email:
-                    strategies.append(filename.replace('.json', ''))
-            except:
-                continue
-                
-        return jsonify({"strategies": strategies})
+        # Served from the catalog; strategy files are never opened here
+        entries = strategy_store.list_strategies(session['user_email'])
+        return jsonify({
+            "strategies": [entry['name'] for entry in entries],
+            "details": entries
+        })
     except Exception as e:
         logger.error(f"Error listing strategies: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/load-strategy', methods=['GET'])
+@main.route('/api/load-strategy', methods=['GET'])
 def load_strategy():
     if 'user_email' not in session:
         return jsonify({"error": "Please log in to load a strategy"}), 401
@@ -434,25 +827,84 @@ def load_strategy():
             # Return a list of strategies instead
             return list_strategies()
             
-        filepath = os.path.join('data/saved_strategies', f"{strategy_name}.json")
-        if not os.path.exists(filepath):
+        entry = strategy_store.get_strategy_entry(strategy_store.sanitize_name(strategy_name))
+        if entry is None:
             return jsonify({"error": f"Strategy '{strategy_name}' not found"}), 404
+        if entry['email'] is not None and entry['email'] != user_email:
+            return jsonify({"error": "You don't have permission to access this strategy"}), 403
             
+        # The catalog's mtime and size identify the file version, so an
+        # unchanged strategy is served from memory without touching the file
+        filepath = strategy_store.strategy_path(entry['name'])
         try:
-            with open(filepath, 'r') as f:
-                strategy_data = json.load(f)
+            document = get_content_cache().get(filepath, version=(entry['mtime'], entry['size']))
         except json.JSONDecodeError:
             return jsonify({"error": "Invalid strategy file format"}), 400
+        except FileNotFoundError:
+            return jsonify({"error": f"Strategy '{strategy_name}' not found"}), 404
         except PermissionError:
             return jsonify({"error": "Permission denied accessing strategy file"}), 403
             
-        if 'user_email' in strategy_data and strategy_data['user_email'] != user_email:
-            return jsonify({"error": "You don't have permission to access this strategy"}), 403
-            
-        return jsonify(strategy_data)
+        return send_document(document, cache_control='private, no-cache')
     except Exception as e:
         logger.error(f"Error loading strategy: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@main.route('/api/live-strategies', methods=['GET'])
+def list_live_strategies():
+    """List the user's live strategies with their positions and last signals"""
+    if 'user_email' not in session:
+        return jsonify({"error": "Please log in to view live strategies"}), 401
+    return jsonify({'strategies': live_strategies.list_strategies(session['user_email'])})
+
+@main.route('/api/live-strategies/start', methods=['POST'])
+def start_live_strategy():
+    """Run a saved strategy live against the user's paper account as each new bar closes"""
+    if 'user_email' not in session:
+        return jsonify({"error": "Please log in to run a strategy live"}), 401
+    if not request.is_json:
+        return jsonify({"error": "Invalid content type, JSON required"}), 400
+    # Imported here so pages that never run strategies do not load NumPy
+    from utils.live_runner import check_strategy
+    try:
+        config = request.get_json()
+        email = session['user_email']
+        name = strategy_store.sanitize_name(str(config.get('name', '')))
+        entry = strategy_store.get_strategy_entry(name) if name else None
+        if entry is None or (entry['email'] is not None and entry['email'] != email):
+            return jsonify({"error": "Strategy not found"}), 404
+        
+        document = get_content_cache().get(strategy_store.strategy_path(entry['name']),
+                                           version=(entry['mtime'], entry['size']))
+        strategy = build_strategy(copy.deepcopy(document.data.get('blocks')))
+        error = check_strategy(strategy)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        success, result = live_strategies.start_strategy(
+            email, entry['name'], strategy,
+            symbol=str(config.get('symbol') or entry['symbol'] or 'AAPL'),
+            timeframe=config.get('timeframe', '1D'),
+            quantity=config.get('quantity', 1)
+        )
+        if not success:
+            return jsonify({"error": result}), 400
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error starting live strategy: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/live-strategies/stop', methods=['POST'])
+def stop_live_strategy():
+    """Stop running a strategy live"""
+    if 'user_email' not in session:
+        return jsonify({"error": "Please log in to stop a live strategy"}), 401
+    if not request.is_json:
+        return jsonify({"error": "Invalid content type, JSON required"}), 400
+    success, result = live_strategies.stop_strategy(session['user_email'], str(request.get_json().get('name', '')))
+    if not success:
+        return jsonify({"error": result}), 404
+    return jsonify(result)
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,104 @@
+"""
+Gunicorn configuration for AlgoBlocks
+
+Every setting can be overridden from the environment, so instance sizes can
+be tuned from load-test measurements (tools/loadtest.py) without code changes.
+"""
+import os
+import multiprocessing
+
+# Background services (order matcher, journal compactor, leaderboard marks)
+# are started in each worker after fork, not in the preloading master
+os.environ.setdefault('ALGOBLOCKS_START_SERVICES', '0')
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Memory a worker grows to once a backtest has loaded pandas, and memory kept
+# back for the master process
+WORKER_MEMORY_MB = int(os.getenv('GUNICORN_WORKER_MEMORY_MB', 250))
+RESERVED_MEMORY_MB = 128
+
+
+def _memory_limit_mb():
+    """Memory available to this container (cgroup limit if set, else physical memory), or None"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _default_workers():
+    """One worker per half core plus one, capped at 8 and at what memory can hold"""
+    workers = min(2 * multiprocessing.cpu_count() + 1, 8)
+    memory = _memory_limit_mb()
+    if memory is not None:
+        workers = min(workers, (memory - RESERVED_MEMORY_MB) // WORKER_MEMORY_MB)
+    return max(workers, 1)
+
+
+# Request handling is mostly I/O bound (Alpaca calls, SQLite), so each worker
+# runs a thread pool; workers add CPU parallelism for backtests
+workers = int(os.getenv('WEB_CONCURRENCY', _default_workers()))
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+worker_class = 'gthread'
+
+# Split each worker's threads so that event streams (which hold a thread while
+# they wait), Alpaca-bound endpoints and queued backtests (utils/admission.py)
+# can never take all of them; the remainder serves login, portfolio and pages
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ.setdefault('SSE_MAX_STREAMS', str(max(threads * 3 // 8, 1)))
+os.environ.setdefault('ADMISSION_MARKET_DATA_CONCURRENCY', str(max(threads // 4, 1)))
+os.environ.setdefault('ADMISSION_MARKET_DATA_QUEUE', str(max(threads // 16, 1)))
+
+# Import the app once in the master and fork workers from it
+preload_app = True
+
+# The app defers pandas and the Alpaca client until a request needs them. Set
+# ALGOBLOCKS_PRELOAD_HEAVY=1 to import those modules in the master instead, so
+# workers share their memory and no worker pays for the import on a request
+if os.getenv('ALGOBLOCKS_PRELOAD_HEAVY', '0') == '1':
+    import pandas  # noqa: F401
+    import alpaca_trade_api  # noqa: F401
+
+# Backtests over long ranges can take a while; in-flight requests get
+# graceful_timeout seconds to finish on shutdown or reload
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers periodically to bound memory growth from caches
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """Start the per-process background services in the new worker"""
+    from app import start_background_services
+    start_background_services()
+
+
+def worker_exit(server, worker):
+    """Flush queued email, save the worker's metrics and checkpoint the database before the worker exits"""
+    from utils import storage, metrics
+    from utils.mailer import get_mail_queue
+
+    queue = get_mail_queue()
+    if queue is not None:
+        queue.stop(timeout=graceful_timeout)
+    metrics.flush()
+    try:
+        storage.checkpoint()
+    except Exception as e:
+        server.log.warning(f"Checkpoint on worker exit failed: {e}")
@@ -0,0 +1,38 @@
+// static/js/events.js
+
+// One Server-Sent Events connection per page for market status and portfolio
+// changes. The browser reconnects on its own (sending Last-Event-ID); if the
+// server refuses the stream, or EventSource is unavailable, the page's
+// fallback (polling) is used instead.
+window.AlgoEvents = (function() {
+    function subscribe(topics, handlers) {
+        let fellBack = false;
+        function fallback() {
+            if (fellBack || !handlers.fallback) return;
+            fellBack = true;
+            handlers.fallback();
+        }
+
+        if (!window.EventSource) {
+            fallback();
+            return null;
+        }
+
+        const source = new EventSource(`/api/events?topics=${encodeURIComponent(topics.join(','))}`);
+        topics.forEach(topic => {
+            if (!handlers[topic]) return;
+            source.addEventListener(topic, event => {
+                handlers[topic](JSON.parse(event.data));
+            });
+        });
+        source.onerror = function() {
+            // CONNECTING means the browser is retrying; CLOSED means it gave up
+            if (source.readyState === EventSource.CLOSED) {
+                fallback();
+            }
+        };
+        return source;
+    }
+
+    return { subscribe: subscribe };
+})();
@@ -11,51 +11,108 @@ document.addEventListener('DOMContentLoaded', function() {
     const tradesTableBody = document.getElementById('tradesTableBody');
     const marketStatus = document.getElementById('marketStatus');
 
-    // Fetch market status
-    fetchMarketStatus();
+    // Trades are fetched incrementally: the cursor is the last trade we have,
+    // the ETag the portfolio version we last rendered
+    let tradeCursor = parseInt(tradesTableBody.dataset.cursor || '0', 10);
+    let portfolioETag = tradesTableBody.dataset.etag ? `"${tradesTableBody.dataset.etag}"` : null;
+    const POLL_INTERVAL_MS = 30000;
 
     // Add refresh button event listener
     if (refreshBtn) {
         refreshBtn.addEventListener('click', refreshPortfolio);
     }
 
+    // Market status and portfolio versions are pushed by the server; without
+    // the event stream, fall back to polling (unchanged portfolios cost a 304)
+    AlgoEvents.subscribe(['market', 'portfolio'], {
+        market: renderMarketStatus,
+        portfolio: onPortfolioChanged,
+        fallback: function() {
+            fetchMarketStatus();
+            setInterval(pollPortfolio, POLL_INTERVAL_MS);
+        }
+    });
+
     // Fetch market status
     function fetchMarketStatus() {
         fetch('/api/markets')
             .then(response => response.json())
-            .then(data => {
-                if (data.is_open) {
-                    marketStatus.innerHTML = 'Market Status: <span class="text-success">Open</span>';
-                } else {
-                    const nextOpen = new Date(data.next_open);
-                    marketStatus.innerHTML = `Market Status: <span class="text-danger">Closed</span> (Opens ${formatDateTime(nextOpen)})`;
-                }
-            })
+            .then(renderMarketStatus)
             .catch(error => {
                 console.error('Error fetching market status:', error);
                 marketStatus.textContent = 'Market Status: Unknown';
             });
     }
 
+    // Show market status pushed by the server or fetched by the fallback
+    function renderMarketStatus(data) {
+        if (data.is_open) {
+            marketStatus.innerHTML = 'Market Status: <span class="text-success">Open</span>';
+        } else {
+            const nextOpen = new Date(data.next_open);
+            marketStatus.innerHTML = `Market Status: <span class="text-danger">Closed</span> (Opens ${formatDateTime(nextOpen)})`;
+        }
+    }
+
+    // Fetch portfolio changes since the last cursor
+    function fetchPortfolioChanges() {
+        const headers = {};
+        if (portfolioETag) {
+            headers['If-None-Match'] = portfolioETag;
+        }
+
+        return fetch(`/api/portfolio/update?after=${tradeCursor}`, { headers: headers })
+            .then(response => {
+                if (response.status === 304) {
+                    return null;
+                }
+                const etag = response.headers.get('ETag');
+                return response.json().then(data => {
+                    if (data.error) {
+                        throw new Error(data.error);
+                    }
+                    if (etag) {
+                        portfolioETag = etag;
+                    }
+                    updatePortfolioUI(data.portfolio);
+                    tradeCursor = data.portfolio.cursor;
+
+                    // Keep paging until we have caught up with the history
+                    if (data.portfolio.has_more) {
+                        portfolioETag = null;
+                        return fetchPortfolioChanges();
+                    }
+                    return data.portfolio;
+                });
+            });
+    }
+
+    // A pushed version we have not rendered yet: fetch only what changed
+    function onPortfolioChanged(data) {
+        if (portfolioETag && portfolioETag.endsWith(`-${data.version}"`)) return;
+        fetchPortfolioChanges().catch(error => {
+            console.error('Error fetching portfolio changes:', error);
+        });
+    }
+
+    // Background poll, silent on errors
+    function pollPortfolio() {
+        if (document.hidden) return;
+        fetchPortfolioChanges().catch(error => {
+            console.error('Error polling portfolio:', error);
+        });
+    }
+
     // Refresh portfolio data
     function refreshPortfolio() {
         // Show loading spinner
         refreshBtn.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Refreshing...';
         refreshBtn.disabled = true;
 
-        fetch('/api/portfolio/update')
-            .then(response => response.json())
-            .then(data => {
-                if (data.error) {
-                    console.error("Portfolio error:", data.error);
-                    alert("Error refreshing portfolio: " + data.error);
-                    return;
-                }
-                updatePortfolioUI(data.portfolio);
-            })
+        fetchPortfolioChanges()
             .catch(error => {
                 console.error('Error refreshing portfolio:', error);
-                alert("Error refreshing portfolio");
+                alert("Error refreshing portfolio: " + error.message);
             })
             .finally(() => {
                 // Reset button
@@ -104,11 +161,10 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         }
 
-        // Update trades table
+        // Prepend new trades to the trades table, most recent first
         if (portfolio.trades && portfolio.trades.length > 0) {
             let tradesHTML = '';
 
-            // Show most recent trades first
             portfolio.trades.slice().reverse().forEach(trade => {
                 tradesHTML += `
                     <tr>
@@ -128,8 +184,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 `;
             });
 
-            tradesTableBody.innerHTML = tradesHTML;
-        } else {
+            if (tradeCursor === 0) {
+                tradesTableBody.innerHTML = '';
+            }
+            tradesTableBody.insertAdjacentHTML('afterbegin', tradesHTML);
+        } else if (tradeCursor === 0) {
             tradesTableBody.innerHTML = '<tr><td colspan="8" class="text-center">No trades found</td></tr>';
         }
     }
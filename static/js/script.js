@@ -48,8 +48,11 @@ document.addEventListener('DOMContentLoaded', function() {
         width: '100%'
     });
     
-    // Fetch market status
-    fetchMarketStatus();
+    // Market status is pushed by the server; fetch it once if the stream is unavailable
+    AlgoEvents.subscribe(['market'], {
+        market: renderMarketStatus,
+        fallback: fetchMarketStatus
+    });
     
     // Set up drag and drop functionality
     setupDragAndDrop();
@@ -114,24 +117,27 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
-    // Fetch market status periodically
+    // Fetch market status
     function fetchMarketStatus() {
         fetch('/api/markets')
             .then(response => response.json())
-            .then(data => {
-                if (data.is_open) {
-                    marketStatus.innerHTML = 'Market Status: <span class="text-success">Open</span>';
-                } else {
-                    const nextOpen = new Date(data.next_open);
-                    marketStatus.innerHTML = `Market Status: <span class="text-danger">Closed</span> (Opens ${formatDateTime(nextOpen)})`;
-                }
-            })
+            .then(renderMarketStatus)
             .catch(error => {
                 console.error('Error fetching market status:', error);
                 marketStatus.textContent = 'Market Status: Unknown';
             });
     }
     
+    // Show market status pushed by the server or fetched by the fallback
+    function renderMarketStatus(data) {
+        if (data.is_open) {
+            marketStatus.innerHTML = 'Market Status: <span class="text-success">Open</span>';
+        } else {
+            const nextOpen = new Date(data.next_open);
+            marketStatus.innerHTML = `Market Status: <span class="text-danger">Closed</span> (Opens ${formatDateTime(nextOpen)})`;
+        }
+    }
+    
     // Update TradingView chart symbol
     function updateSymbol() {
         const symbol = symbolSelect.value;
@@ -774,7 +780,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (result.error) {
                     alert(`Error: ${result.error}`);
                 } else {
-                    alert('Trade executed successfully!');
+                    alert(result.message);
                     modal.hide();
                 }
             })
@@ -1,6 +1,9 @@
 document.addEventListener('DOMContentLoaded', function() {
-    // Fetch market status
-    fetchMarketStatus();
+    // Market status is pushed by the server; fetch it once if the stream is unavailable
+    AlgoEvents.subscribe(['market'], {
+        market: renderMarketStatus,
+        fallback: fetchMarketStatus
+    });
     
     // Load tutorial steps
     fetch('/api/tutorial/content')
@@ -51,21 +54,24 @@ document.addEventListener('DOMContentLoaded', function() {
     function fetchMarketStatus() {
         fetch('/api/markets')
             .then(response => response.json())
-            .then(data => {
-                const marketStatus = document.getElementById('marketStatus');
-                if (data.is_open) {
-                    marketStatus.innerHTML = 'Market Status: <span class="text-success">Open</span>';
-                } else {
-                    const nextOpen = new Date(data.next_open);
-                    marketStatus.innerHTML = `Market Status: <span class="text-danger">Closed</span> (Opens ${formatDateTime(nextOpen)})`;
-                }
-            })
+            .then(renderMarketStatus)
             .catch(error => {
                 console.error('Error fetching market status:', error);
                 document.getElementById('marketStatus').textContent = 'Market Status: Unknown';
             });
     }
     
+    // Show market status pushed by the server or fetched by the fallback
+    function renderMarketStatus(data) {
+        const marketStatus = document.getElementById('marketStatus');
+        if (data.is_open) {
+            marketStatus.innerHTML = 'Market Status: <span class="text-success">Open</span>';
+        } else {
+            const nextOpen = new Date(data.next_open);
+            marketStatus.innerHTML = `Market Status: <span class="text-danger">Closed</span> (Opens ${formatDateTime(nextOpen)})`;
+        }
+    }
+    
     // Utility: Format date and time
     function formatDateTime(date) {
         return date.toLocaleString();
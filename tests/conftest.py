@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import storage
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Point storage at an empty database for one test"""
+    monkeypatch.setattr(storage, 'DB_PATH', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(storage, 'LEGACY_USER_DATA_FILE', str(tmp_path / 'users.json'))
+    monkeypatch.setattr(storage._local, 'conn', None, raising=False)
+    yield storage
+    conn = getattr(storage._local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        storage._local.conn = None
@@ -0,0 +1,95 @@
+import os
+import time
+import runpy
+import threading
+from unittest import mock
+import pytest
+from utils import admission
+from utils.admission import AdmissionRejected, CapacityPool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _acquire_in_thread(pool, user, granted):
+    """Acquire a slot in a thread and wait until it is running or queued"""
+    waiting = pool.stats['waiting']
+
+    def run():
+        try:
+            pool.acquire(user)
+            granted.append(user)
+        except AdmissionRejected as e:
+            granted.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 2
+    while pool.stats['waiting'] == waiting and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return thread
+
+
+def test_full_pool_queues_then_rejects():
+    pool = CapacityPool('test', capacity=1, queue_size=1)
+    pool.acquire('a')
+    granted = []
+    thread = _acquire_in_thread(pool, 'b', granted)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        pool.acquire('c')
+    assert rejected.value.reason == 'queue is full'
+    assert rejected.value.retry_after > 0
+
+    pool.release('a', 0.01)
+    thread.join(2)
+    assert granted == ['b']
+    assert pool.stats['rejected_queue'] == 1
+
+
+def test_freed_slots_rotate_between_users():
+    pool = CapacityPool('test', capacity=1, per_user=3, queue_size=4)
+    pool.acquire('a')
+    granted = []
+    threads = [_acquire_in_thread(pool, user, granted) for user in ('a', 'a', 'b')]
+
+    for user in ['a', 'a', 'b', 'a']:
+        pool.release(user, 0.01)
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(2)
+    assert granted == ['a', 'b', 'a']
+
+
+def test_per_user_limit_and_rate_limit():
+    pool = CapacityPool('test', capacity=4, per_user=1, queue_size=4)
+    pool.acquire('a')
+    with pytest.raises(AdmissionRejected) as rejected:
+        pool.acquire('a')
+    assert rejected.value.reason == 'too many concurrent requests for this user'
+    pool.acquire('b')
+
+    limited = CapacityPool('test', capacity=4, per_user=4, rate=1.0, burst=1)
+    limited.acquire('a')
+    with pytest.raises(AdmissionRejected) as rejected:
+        limited.acquire('a')
+    assert rejected.value.reason == 'rate limited'
+    assert 0 < rejected.value.retry_after <= 1
+
+
+def test_queued_request_times_out():
+    pool = CapacityPool('test', capacity=1, queue_size=1, max_wait=0.05)
+    pool.acquire('a')
+    with pytest.raises(AdmissionRejected) as rejected:
+        pool.acquire('b')
+    assert rejected.value.reason == 'timed out waiting for capacity'
+    assert pool.snapshot()['waiting'] == 0
+
+
+def test_gunicorn_config_leaves_room_to_queue_market_data():
+    with mock.patch.dict(os.environ, {'GUNICORN_THREADS': '4', 'WEB_CONCURRENCY': '1'}):
+        for name in ('ADMISSION_MARKET_DATA_CONCURRENCY', 'ADMISSION_MARKET_DATA_QUEUE'):
+            os.environ.pop(name, None)
+        runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+        pool = admission._build_pools()['market_data']
+    assert pool.capacity == 1
+    assert pool.queue_size >= 1
@@ -0,0 +1,100 @@
+from datetime import datetime
+from utils.matching_engine import MatchingEngine, OrderBook
+from utils.records import format_time
+
+EMAIL = 'trader@example.com'
+
+
+class FakeFetcher:
+    """Quotes and latest bars set by the test"""
+
+    def __init__(self, quote=None, bars=None):
+        self.quote = quote
+        self.bars = bars or {}
+
+    def get_real_time_quote(self, symbol):
+        return self.quote
+
+    def get_latest_bars(self, symbols):
+        return {symbol: self.bars[symbol] for symbol in symbols if symbol in self.bars}
+
+
+def _bar(seconds, low, high, open_price=None, volume=10000):
+    open_price = high if open_price is None else open_price
+    return {'time': format_time(seconds), 'open': open_price, 'high': high, 'low': low, 'close': low, 'volume': volume}
+
+
+def _placed(order):
+    return datetime.strptime(order['created_at'], '%Y-%m-%d %H:%M:%S').timestamp()
+
+
+def _resting_buy(db, limit_price=100.0, quantity=10):
+    db.create_user(EMAIL, 'trader', 'x', cash=10000.0)
+    engine = MatchingEngine(FakeFetcher(quote={'ask': limit_price + 5, 'bid': limit_price + 4}))
+    ok, order = engine.submit_order(EMAIL, 'AAPL', 'buy', 'limit', quantity, limit_price=limit_price)
+    assert ok and order['status'] == 'open'
+    engine.sync()
+    return engine, order
+
+
+def test_limit_order_ignores_bars_that_started_before_it(db):
+    engine, order = _resting_buy(db)
+    placed = _placed(order)
+
+    assert engine.on_bar('AAPL', _bar(placed - 30, low=95.0, high=101.0)) == []
+    assert db.get_order(order['id'])['status'] == 'open'
+    assert len(engine.books['AAPL']) == 1
+
+    filled = engine.on_bar('AAPL', _bar(placed + 60, low=95.0, high=101.0))
+    assert [o['id'] for o in filled] == [order['id']]
+    stored = db.get_order(order['id'])
+    assert stored['status'] == 'filled'
+    assert stored['avg_fill_price'] == 100.0
+
+
+def test_gap_fills_at_open_and_volume_caps_the_fill(db):
+    engine, order = _resting_buy(db, quantity=10)
+    placed = _placed(order)
+
+    # 50 shares of volume at a 10% participation rate leave room for 5
+    engine.on_bar('AAPL', _bar(placed + 60, low=90.0, high=97.0, open_price=96.0, volume=50))
+    stored = db.get_order(order['id'])
+    assert stored['status'] == 'partially_filled'
+    assert stored['filled_quantity'] == 5
+    assert stored['avg_fill_price'] == 96.0
+    assert len(engine.books['AAPL']) == 1
+
+
+def test_orders_reach_the_book_only_through_sync(db):
+    db.create_user(EMAIL, 'trader', 'x', cash=10000.0)
+    engine = MatchingEngine(FakeFetcher(quote={'ask': 105.0, 'bid': 104.0}))
+    engine.submit_order(EMAIL, 'AAPL', 'buy', 'limit', 1, limit_price=100.0)
+    assert engine.books == {}
+
+    engine.sync()
+    assert len(engine.books['AAPL']) == 1
+
+
+def test_market_order_without_a_real_price_is_rejected(db):
+    db.create_user(EMAIL, 'trader', 'x', cash=10000.0)
+    engine = MatchingEngine(FakeFetcher())
+    assert engine.submit_order(EMAIL, 'AAPL', 'buy', 'market', 1) == (False, "No market price available")
+    assert db.list_open_orders() == []
+
+
+def test_market_order_falls_back_to_the_latest_bar(db):
+    db.create_user(EMAIL, 'trader', 'x', cash=10000.0)
+    engine = MatchingEngine(FakeFetcher(bars={'AAPL': _bar(0, low=49.0, high=51.0) | {'close': 50.0}}))
+    ok, order = engine.submit_order(EMAIL, 'AAPL', 'buy', 'market', 2)
+    assert ok and order['status'] == 'filled'
+    assert order['avg_fill_price'] == 50.0
+
+
+def test_pop_crossing_keeps_price_time_priority():
+    book = OrderBook()
+    for seq, (side, price) in enumerate([('buy', 99.0), ('buy', 101.0), ('buy', 101.0), ('sell', 110.0)], 1):
+        book.add(seq, EMAIL, {'id': str(seq), 'side': side, 'limit_price': price, 'created_at': '2020-01-01 00:00:00'})
+
+    crossed = book.pop_crossing(100.0, 105.0)
+    assert [(seq, side, price) for seq, _, side, price, _ in crossed] == [(2, 'buy', 101.0), (3, 'buy', 101.0)]
+    assert len(book) == 2
@@ -0,0 +1,71 @@
+import os
+import pytest
+
+EMAIL = 'trader@example.com'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv('ALGOBLOCKS_START_SERVICES', '0')
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    db.create_user(EMAIL, 'trader', 'x', cash=10000.0)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_email'] = EMAIL
+    return client
+
+
+def _trades(db, count):
+    with db.transaction() as conn:
+        for i in range(count):
+            db.insert_trade(conn, EMAIL, {
+                'timestamp': f'2024-01-02 10:{i:02d}:00', 'symbol': 'AAPL', 'quantity': 1,
+                'side': 'buy', 'type': 'market', 'price': 100.0 + i, 'status': 'executed'
+            })
+
+
+def test_trade_history_pages_by_cursor(db, client):
+    _trades(db, 5)
+
+    seen = []
+    after = 0
+    while True:
+        portfolio = client.get(f'/api/portfolio/update?after={after}&limit=2').get_json()['portfolio']
+        assert len(portfolio['trades']) <= 2
+        seen += [trade['price'] for trade in portfolio['trades']]
+        after = portfolio['cursor']
+        if not portfolio['has_more']:
+            break
+
+    assert seen == [100.0, 101.0, 102.0, 103.0, 104.0]
+    assert portfolio['stats']['total_trades'] == 5
+    # A caught-up cursor returns no trades and stays put
+    portfolio = client.get(f'/api/portfolio/update?after={after}').get_json()['portfolio']
+    assert portfolio['trades'] == [] and portfolio['cursor'] == after
+
+
+def test_unchanged_portfolio_answers_not_modified(db, client):
+    _trades(db, 1)
+    first = client.get('/api/portfolio/update')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    again = client.get('/api/portfolio/update', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+
+    _trades(db, 1)
+    changed = client.get('/api/portfolio/update', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['portfolio']['stats']['total_trades'] == 2
+
+
+def test_portfolio_requires_login(db, client):
+    with client.session_transaction() as session:
+        session.clear()
+    assert client.get('/api/portfolio/update').status_code == 401
@@ -0,0 +1,70 @@
+import pytest
+from utils import trade_manager
+
+EMAIL = 'trader@example.com'
+
+
+@pytest.fixture
+def user(db):
+    db.create_user(EMAIL, 'trader', 'x', cash=10000.0)
+    return EMAIL
+
+
+def _trade(db, side, quantity, price, symbol='AAPL'):
+    with db.transaction() as conn:
+        return db.insert_trade(conn, EMAIL, {
+            'timestamp': '2024-01-02 10:00:00', 'symbol': symbol, 'quantity': quantity,
+            'side': side, 'type': 'market', 'price': price, 'status': 'executed'
+        })
+
+
+def test_compaction_folds_the_journal_tail_into_the_snapshot(db, user):
+    _trade(db, 'buy', 10, 100.0)
+    _trade(db, 'buy', 10, 110.0)
+    last = _trade(db, 'sell', 5, 120.0)
+    assert db.list_stale_snapshots() == [user]
+
+    assert trade_manager.compact_portfolios() == 1
+    assert db.list_stale_snapshots() == []
+
+    snapshot = db.get_snapshot(user)
+    assert snapshot['snapshot_seq'] == last
+    assert snapshot['trade_count'] == 3
+    assert snapshot['profitable_trades'] == 1
+    assert snapshot['realized_pl'] == pytest.approx(75.0)
+    assert snapshot['positions']['AAPL']['quantity'] == 15
+    assert snapshot['positions']['AAPL']['total_cost'] == pytest.approx(1575.0)
+
+
+def test_portfolio_combines_snapshot_and_uncompacted_tail(db, user):
+    _trade(db, 'buy', 10, 100.0)
+    trade_manager.compact_portfolios()
+    _trade(db, 'sell', 10, 90.0)
+    _trade(db, 'buy', 3, 50.0, symbol='MSFT')
+
+    portfolio = trade_manager.get_user_portfolio(user)
+    stats = portfolio['stats']
+    assert stats['total_trades'] == 3
+    assert stats['profit_loss'] == pytest.approx(-100.0)
+    assert [(p['symbol'], p['quantity']) for p in stats['active_positions']] == [('MSFT', 3)]
+    assert trade_manager.check_portfolio(user)
+
+    trade_manager.compact_portfolios()
+    assert trade_manager.get_user_portfolio(user)['stats'] == stats
+    assert trade_manager.check_portfolio(user)
+
+
+def test_check_portfolio_detects_a_drifted_snapshot_and_rebuild_repairs_it(db, user):
+    _trade(db, 'buy', 10, 100.0)
+    trade_manager.compact_portfolios()
+    with db.transaction() as conn:
+        conn.execute('UPDATE positions SET quantity = 9 WHERE email = ?', (user,))
+    assert not trade_manager.check_portfolio(user)
+
+    assert trade_manager.rebuild_portfolio(user)
+    assert trade_manager.check_portfolio(user)
+    assert db.get_snapshot(user)['positions']['AAPL']['quantity'] == 10
+
+
+def test_check_portfolio_of_unknown_user(db):
+    assert not trade_manager.check_portfolio('nobody@example.com')
@@ -0,0 +1,276 @@
+"""
+Local stand-in for the Alpaca trading and market data APIs
+
+Serves deterministic synthetic data for the endpoints AlgoBlocks uses, so the
+app can be run and load-tested without network access or API keys. Point the
+app at it with:
+
+    APCA_API_BASE_URL=http://127.0.0.1:5005 APCA_API_DATA_URL=http://127.0.0.1:5005 \
+    APCA_API_KEY_ID=fake APCA_API_SECRET_KEY=fake python app.py
+
+Run standalone with `python tools/fake_alpaca.py [--port 5005] [--latency 20]`,
+or start it in-process with `FakeAlpaca(port=0).start()`.
+"""
+import json
+import time
+import zlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+# Largest page of bars returned per request, as the real API does
+PAGE_LIMIT = 10000
+
+# Symbols listed by /v2/assets; more are generated with --assets
+BASE_ASSETS = [
+    ('AAPL', 'Apple Inc.'), ('MSFT', 'Microsoft Corporation'), ('GOOGL', 'Alphabet Inc.'),
+    ('AMZN', 'Amazon.com Inc.'), ('TSLA', 'Tesla Inc.'), ('NVDA', 'NVIDIA Corporation'),
+    ('META', 'Meta Platforms Inc.'), ('JPM', 'JPMorgan Chase & Co.'), ('V', 'Visa Inc.'),
+    ('SPY', 'SPDR S&P 500 ETF Trust')
+]
+
+EXCHANGE_TZ = 'America/New_York'
+
+_FREQUENCIES = {'1Min': '1min', '5Min': '5min', '15Min': '15min', '1Hour': '1h', '1Day': '1D'}
+
+
+def _timestamp(ts):
+    """Format a timestamp the way the Alpaca API does"""
+    return ts.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _parse_time(text, end_of_day=False):
+    """Parse an RFC 3339 timestamp or a YYYY-MM-DD date (optionally as the end of that day) in UTC"""
+    ts = pd.Timestamp(text)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    if end_of_day and 'T' not in text:
+        ts += pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    return ts
+
+
+class MarketData:
+    """Deterministic synthetic prices per symbol"""
+
+    def price_at(self, symbol, times):
+        """Prices of a symbol at a DatetimeIndex of times, stable across calls and processes"""
+        seed = zlib.crc32(symbol.encode())
+        base = 50 + seed % 450
+        # A few incommensurate sine waves per symbol: trends, swings and intraday noise
+        t = times.asi8 / 1e9 / 86400.0
+        phase = (seed % 1000) / 1000.0 * 2 * np.pi
+        drift = np.sin(t / 97 + phase) * 0.15 + np.sin(t / 13 + 2 * phase) * 0.05 + np.sin(t * 7.3 + phase) * 0.01
+        return np.round(base * (1 + drift), 2)
+
+    def bars(self, symbol, timeframe, start, end, limit, offset=0, descending=False):
+        """
+        Bars for a symbol between two times (business hours only for intraday),
+        newest first when descending
+
+        Returns:
+            tuple: (bar dicts, next offset or None)
+        """
+        freq = _FREQUENCIES.get(timeframe, '1D')
+        end = min(end, pd.Timestamp.now(tz='UTC'))
+        if freq == '1D':
+            # Daily bars start at midnight New York time, like Alpaca's
+            days = pd.bdate_range(start.tz_convert(EXCHANGE_TZ).date(), end.tz_convert(EXCHANGE_TZ).date())
+            index = days.tz_localize(EXCHANGE_TZ).tz_convert('UTC')
+        else:
+            index = pd.date_range(start, end, freq=freq, tz='UTC')
+            local = index.tz_convert(EXCHANGE_TZ)
+            minutes = local.hour * 60 + local.minute
+            index = index[(local.dayofweek < 5) & (minutes >= 9 * 60 + 30) & (minutes < 16 * 60)]
+        index = index[(index >= start) & (index <= end)]
+        if descending:
+            index = index[::-1]
+
+        page = min(limit or PAGE_LIMIT, PAGE_LIMIT)
+        selected = index[offset:offset + page]
+        closes = self.price_at(symbol, selected)
+        opens = self.price_at(symbol, selected - pd.Timedelta(minutes=1))
+        highs = np.maximum(opens, closes) * 1.002
+        lows = np.minimum(opens, closes) * 0.998
+        volumes = 1000 + (zlib.crc32(symbol.encode()) % 9000) + (np.abs(closes * 37) % 5000).astype(int)
+        bars = [
+            {'t': _timestamp(ts), 'o': float(o), 'h': round(float(h), 2), 'l': round(float(l), 2),
+             'c': float(c), 'v': int(v), 'n': 100, 'vw': float(c)}
+            for ts, o, h, l, c, v in zip(selected, opens, highs, lows, closes, volumes)
+        ]
+        next_offset = offset + page if offset + page < len(index) else None
+        return bars, next_offset
+
+    def quote(self, symbol):
+        """Latest quote around the current synthetic price"""
+        now = pd.Timestamp.now(tz='UTC')
+        price = float(self.price_at(symbol, pd.DatetimeIndex([now]))[0])
+        return {'t': _timestamp(now), 'ap': round(price * 1.0005, 2), 'bp': round(price * 0.9995, 2),
+                'as': 3, 'bs': 2, 'ax': 'V', 'bx': 'V', 'c': ['R'], 'z': 'C'}
+
+    def latest_bar(self, symbol):
+        """Most recent minute bar"""
+        now = pd.Timestamp.now(tz='UTC').floor('min')
+        bars, _ = self.bars(symbol, '1Min', now - pd.Timedelta(minutes=1), now, 1)
+        if bars:
+            return bars[-1]
+        price = float(self.price_at(symbol, pd.DatetimeIndex([now]))[0])
+        return {'t': _timestamp(now), 'o': price, 'h': price, 'l': price, 'c': price, 'v': 1000, 'n': 10, 'vw': price}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes Alpaca REST paths to synthetic responses"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.fake.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        fake.requests += 1
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            body = self.route(parts, query)
+        except Exception as e:
+            return self.send_json({'code': 50000000, 'message': str(e)}, status=500)
+        if body is None:
+            return self.send_json({'code': 40410000, 'message': 'not found'}, status=404)
+        self.send_json(body)
+
+    def route(self, parts, query):
+        fake = self.server.fake
+        data = fake.market
+
+        if parts == ['v2', 'account']:
+            return fake.account()
+        if parts == ['v2', 'positions']:
+            return []
+        if parts == ['v2', 'clock']:
+            now = datetime.now(timezone.utc)
+            return {'timestamp': now.isoformat(), 'is_open': now.weekday() < 5 and 14 <= now.hour < 21,
+                    'next_open': (now + timedelta(hours=12)).isoformat(),
+                    'next_close': (now + timedelta(hours=6)).isoformat()}
+        if parts == ['v2', 'assets']:
+            return fake.assets
+        if parts[:2] != ['v2', 'stocks']:
+            return None
+
+        symbols = query.get('symbols', '').split(',') if query.get('symbols') else []
+        if parts[2:] == ['bars', 'latest']:
+            return {'bars': {symbol: data.latest_bar(symbol) for symbol in symbols}}
+        if parts[2:] == ['quotes', 'latest']:
+            return {'quotes': {symbol: data.quote(symbol) for symbol in symbols}}
+        if len(parts) == 5 and parts[3:] == ['quotes', 'latest']:
+            return {'symbol': parts[2], 'quote': data.quote(parts[2])}
+        if len(parts) == 5 and parts[3:] == ['bars', 'latest']:
+            return {'symbol': parts[2], 'bar': data.latest_bar(parts[2])}
+        if parts[2:] == ['bars']:
+            # Multi-symbol bars: the limit and pages span all symbols, in symbol order
+            start = _parse_time(query.get('start') or '2015-01-01')
+            end = _parse_time(query.get('end') or pd.Timestamp.now(tz='UTC').strftime('%Y-%m-%d'), end_of_day=True)
+            index, offset = (int(part) for part in (query.get('page_token') or '0:0').split(':'))
+            budget = min(int(query['limit']) if query.get('limit') else PAGE_LIMIT, PAGE_LIMIT)
+            ordered = sorted(symbols)
+            result = {}
+            while index < len(ordered) and budget > 0:
+                bars, next_offset = data.bars(ordered[index], query.get('timeframe', '1Day'), start, end, budget, offset)
+                if bars:
+                    result.setdefault(ordered[index], []).extend(bars)
+                budget -= len(bars)
+                index, offset = (index + 1, 0) if next_offset is None else (index, next_offset)
+            return {'bars': result, 'next_page_token': f"{index}:{offset}" if index < len(ordered) else None}
+        if len(parts) == 4 and parts[3] == 'bars':
+            start = _parse_time(query.get('start') or '2015-01-01')
+            end = _parse_time(query.get('end') or pd.Timestamp.now(tz='UTC').strftime('%Y-%m-%d'), end_of_day=True)
+            offset = int(query.get('page_token') or 0)
+            limit = int(query['limit']) if query.get('limit') else None
+            bars, next_offset = data.bars(parts[2], query.get('timeframe', '1Day'), start, end, limit, offset,
+                                          descending=query.get('sort') == 'desc')
+            return {'bars': bars, 'symbol': parts[2],
+                    'next_page_token': None if next_offset is None else str(next_offset)}
+        return None
+
+    def send_json(self, body, status=200):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeAlpaca:
+    """Threaded HTTP server answering Alpaca trading and data API requests"""
+
+    def __init__(self, host='127.0.0.1', port=5005, latency_ms=0, extra_assets=0, verbose=False):
+        """
+        Initialize the fake API
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on (0 picks a free port)
+            latency_ms (float): Delay added to every response, to mimic network round trips
+            extra_assets (int): Synthetic symbols listed in addition to the base set
+            verbose (bool): Log every request
+        """
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.host, self.port = self.server.server_address
+        self.latency = latency_ms / 1000.0
+        self.verbose = verbose
+        self.requests = 0
+        self.market = MarketData()
+        self.assets = [self._asset(symbol, name) for symbol, name in BASE_ASSETS]
+        self.assets += [self._asset(f"SYN{i:04d}", f"Synthetic Holdings {i}") for i in range(extra_assets)]
+
+    @property
+    def url(self):
+        """Base URL to use for both APCA_API_BASE_URL and APCA_API_DATA_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    def account(self):
+        return {'id': 'fake-account', 'status': 'ACTIVE', 'currency': 'USD', 'cash': '100000',
+                'equity': '100000', 'buying_power': '200000', 'portfolio_value': '100000'}
+
+    def start(self):
+        """Serve in a background thread and return self"""
+        threading.Thread(target=self.server.serve_forever, name='fake-alpaca', daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _asset(self, symbol, name):
+        return {'id': f"asset-{symbol}", 'class': 'us_equity', 'exchange': 'NASDAQ', 'symbol': symbol,
+                'name': name, 'status': 'active', 'tradable': True, 'marginable': True,
+                'shortable': True, 'easy_to_borrow': True, 'fractionable': True}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local fake Alpaca API for AlgoBlocks development')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5005)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to every response')
+    parser.add_argument('--assets', type=int, default=0, help='synthetic symbols to list besides the base set')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    fake = FakeAlpaca(args.host, args.port, args.latency, args.assets, args.verbose)
+    print(f"Fake Alpaca API listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,346 @@
+"""
+Load test AlgoBlocks end to end against a local fake Alpaca backend
+
+By default this starts tools/fake_alpaca.py in-process, seeds verified test
+users into a temporary database and launches the production server
+(gunicorn -c gunicorn.conf.py wsgi:app) against them. Virtual users then log
+in and repeatedly search symbols, run backtests, place paper trades and poll
+their portfolio. Throughput and latency percentiles are reported per route,
+over admitted requests only; 429 admission rejections are counted separately.
+
+    python tools/loadtest.py --users 20 --duration 60 --workers 2 --threads 4
+
+To measure a server that is already running (it must be pointed at a fake or
+real Alpaca backend itself), pass its URL and existing accounts instead:
+
+    python tools/loadtest.py --url http://127.0.0.1:8000 --account a@b.c:secret
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from tools.fake_alpaca import FakeAlpaca, BASE_ASSETS  # noqa: E402
+
+# Relative frequency of each action in a virtual user's session
+ACTION_WEIGHTS = {
+    'search': 3,
+    'backtest': 1,
+    'paper_trade': 2,
+    'portfolio_poll': 4
+}
+
+# Longest Retry-After a virtual user honours before its next request
+MAX_RETRY_AFTER = 5.0
+
+SYMBOLS = [symbol for symbol, _ in BASE_ASSETS]
+SEARCH_TERMS = ['A', 'AP', 'MS', 'TE', 'IN', 'S', 'CORP']
+
+
+class Recorder:
+    """
+    Thread-safe collection of request latencies per route
+
+    429 responses are admission-control rejections: they return fast without
+    doing the work, so they are counted apart and left out of throughput and
+    latency, which would otherwise look better the more load is shed.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, route, status, seconds):
+        with self._lock:
+            self.statuses[route][status] += 1
+            if status == 429:
+                self.rejected[route] += 1
+                return
+            self.latencies[route].append(seconds)
+            if status is None or status >= 500:
+                self.errors[route] += 1
+
+    def report(self, elapsed):
+        """
+        Summarize the run
+
+        Args:
+            elapsed (float): Seconds the load phase ran for
+
+        Returns:
+            dict: Per-route and total admitted count, rejections, errors,
+            throughput and latency percentiles (ms) of admitted requests
+        """
+        routes = {}
+        everything = []
+        for route in sorted(self.statuses):
+            latencies = self.latencies[route]
+            everything.extend(latencies)
+            routes[route] = self._summary(latencies, self.rejected[route], self.errors[route], elapsed)
+            routes[route]['statuses'] = {str(status): count for status, count in self.statuses[route].items()}
+        return {'elapsed': round(elapsed, 2), 'routes': routes,
+                'total': self._summary(everything, sum(self.rejected.values()), sum(self.errors.values()), elapsed)}
+
+    def _summary(self, latencies, rejected, errors, elapsed):
+        ordered = sorted(latencies)
+        return {
+            'requests': len(ordered),
+            'rejected': rejected,
+            'errors': errors,
+            'rps': round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(_percentile(ordered, 50) * 1000, 1),
+            'p90_ms': round(_percentile(ordered, 90) * 1000, 1),
+            'p99_ms': round(_percentile(ordered, 99) * 1000, 1),
+            'max_ms': round(ordered[-1] * 1000, 1) if ordered else 0.0
+        }
+
+
+def _percentile(ordered, percent):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(int(round(percent / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class VirtualUser(threading.Thread):
+    """One simulated user session driving the real endpoints"""
+
+    def __init__(self, base_url, email, password, recorder, deadline, think_time, seed):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.email = email
+        self.password = password
+        self.recorder = recorder
+        self.deadline = deadline
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.etag = None
+        self.actions = [action for action, weight in ACTION_WEIGHTS.items() for _ in range(weight)]
+
+    def run(self):
+        response = self.call('login', 'POST', '/login', data={'email': self.email, 'password': self.password},
+                             allow_redirects=False)
+        if response is None or response.status_code != 302:
+            return
+        while time.time() < self.deadline:
+            response = getattr(self, self.random.choice(self.actions))()
+            if response is not None and response.status_code == 429:
+                # Back off as a well-behaved client would, instead of hammering the limiter
+                time.sleep(min(float(response.headers.get('Retry-After') or 1), MAX_RETRY_AFTER))
+            elif self.think_time:
+                time.sleep(self.random.uniform(0, 2 * self.think_time))
+
+    def call(self, route, method, path, **kwargs):
+        """Send one request and record its latency under a route name"""
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=120, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(route, None, time.perf_counter() - start)
+            return None
+        self.recorder.record(route, response.status_code, time.perf_counter() - start)
+        return response
+
+    def search(self):
+        return self.call('search', 'GET', '/api/search-symbols', params={'query': self.random.choice(SEARCH_TERMS)})
+
+    def backtest(self):
+        period = self.random.choice([10, 20, 50])
+        end = datetime.now()
+        start = end - timedelta(days=self.random.choice([90, 180, 365]))
+        return self.call('backtest', 'POST', '/api/backtest', json={
+            'symbol': self.random.choice(SYMBOLS),
+            'startDate': start.strftime('%Y-%m-%d'),
+            'endDate': end.strftime('%Y-%m-%d'),
+            'capital': 10000,
+            'blocks': [
+                {'type': 'indicator', 'indicatorType': 'SMA', 'period': period},
+                {'type': 'indicator', 'indicatorType': 'RSI', 'period': 14},
+                {'type': 'entry', 'conditions': [{'expression': f"close crosses_above SMA_{period} and RSI_14 < 70"}]},
+                {'type': 'exit', 'conditions': [{'expression': f"close < SMA_{period}"}]}
+            ]
+        })
+
+    def paper_trade(self):
+        return self.call('paper_trade', 'POST', '/api/paper-trade', json={
+            'symbol': self.random.choice(SYMBOLS),
+            'quantity': 1,
+            'side': 'buy' if self.random.random() < 0.7 else 'sell',
+            'orderType': 'market'
+        })
+
+    def portfolio_poll(self):
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        response = self.call('portfolio_poll', 'GET', '/api/portfolio/update', headers=headers)
+        if response is not None and response.status_code == 200:
+            self.etag = response.headers.get('ETag')
+        return response
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _seed_users(db_path, count, password):
+    """Create verified accounts in a fresh database"""
+    os.environ['ALGOBLOCKS_DB'] = db_path
+    from utils import storage
+    storage.DB_PATH = db_path
+    accounts = []
+    for i in range(count):
+        email = f"loadtest{i}@example.com"
+        storage.create_user(email, f"loadtest{i}", password)
+        storage.set_verified(email)
+        accounts.append((email, password))
+    return accounts
+
+
+def _start_server(workdir, port, alpaca_url, db_path, args):
+    """Launch gunicorn with the production config against the fake backend"""
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': REPO_ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+        'APCA_API_BASE_URL': alpaca_url,
+        'APCA_API_DATA_URL': alpaca_url,
+        'APCA_API_KEY_ID': 'loadtest',
+        'APCA_API_SECRET_KEY': 'loadtest',
+        'ALGOBLOCKS_DB': db_path,
+        'PORT': str(port),
+        'WEB_CONCURRENCY': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        'GUNICORN_ACCESS_LOG': '',
+        'GUNICORN_LOG_LEVEL': 'warning'
+    })
+    for key in ('SMTP_USER', 'SMTP_PASSWORD'):
+        env.pop(key, None)
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+               '--bind', f"127.0.0.1:{port}", 'wsgi:app']
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT), log
+
+
+def _wait_until_up(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            requests.get(url + '/login', timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout}s")
+
+
+def run_load(base_url, accounts, users, duration, think_time, ramp_up):
+    """
+    Drive virtual users against a server and collect latencies
+
+    Returns:
+        dict: Report from Recorder.report
+    """
+    recorder = Recorder()
+    start = time.time()
+    deadline = start + ramp_up + duration
+    threads = []
+    for i in range(users):
+        email, password = accounts[i % len(accounts)]
+        thread = VirtualUser(base_url, email, password, recorder, deadline, think_time, seed=i)
+        thread.start()
+        threads.append(thread)
+        if ramp_up:
+            time.sleep(ramp_up / users)
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.time() - start)
+
+
+def print_report(report):
+    columns = ('requests', 'rejected', 'errors', 'rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')
+    print(f"\n{'route':<16}" + ''.join(f"{name:>10}" for name in columns))
+    rows = list(report['routes'].items()) + [('TOTAL', report['total'])]
+    for route, summary in rows:
+        print(f"{route:<16}" + ''.join(f"{summary[name]:>10}" for name in columns))
+    print(f"\n{report['elapsed']}s elapsed")
+    for route, summary in report['routes'].items():
+        print(f"  {route}: status codes {summary['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test AlgoBlocks against a fake Alpaca backend')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load after ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=2, help='seconds over which users start')
+    parser.add_argument('--think-time', type=float, default=0.5,
+                        help='mean seconds between a user\'s requests (0 exceeds the per-user rate limits)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+    parser.add_argument('--alpaca-latency', type=float, default=20, help='milliseconds added by the fake Alpaca API')
+    parser.add_argument('--url', help='test an already running server instead of starting one')
+    parser.add_argument('--account', action='append', default=[], help='email:password of an existing user (with --url)')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    workdir = None
+    process = log = fake = None
+    try:
+        if args.url:
+            if not args.account:
+                parser.error('--url needs at least one --account email:password')
+            base_url = args.url.rstrip('/')
+            accounts = [tuple(account.split(':', 1)) for account in args.account]
+        else:
+            workdir = tempfile.mkdtemp(prefix='algoblocks-loadtest-')
+            db_path = os.path.join(workdir, 'data', 'algoblocks.db')
+            accounts = _seed_users(db_path, args.users, 'loadtest')
+            fake = FakeAlpaca(port=0, latency_ms=args.alpaca_latency).start()
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process, log = _start_server(workdir, port, fake.url, db_path, args)
+
+        _wait_until_up(base_url, process)
+        print(f"Running {args.users} users for {args.duration}s against {base_url}"
+              + ('' if args.url else f" ({args.workers} workers x {args.threads} threads)"))
+        report = run_load(base_url, accounts, args.users, args.duration, args.think_time, args.ramp_up)
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=40)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if log is not None:
+            log.close()
+        if fake is not None:
+            fake.stop()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Local SMTP stand-in for development and testing
+
+Accepts any login and stores every message it receives instead of
+delivering it. Point the app at it with:
+
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=2525 SMTP_USE_TLS=0 \
+    SMTP_USER=dev@localhost SMTP_PASSWORD=dev python app.py
+
+Run standalone with `python tools/smtp_sink.py [--port 2525] [--mbox path]`,
+or start it in-process with `SMTPSink(port=0).start()` and read `sink.messages`.
+"""
+import argparse
+import socketserver
+import threading
+from email import message_from_bytes
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: EHLO, AUTH, MAIL, RCPT, DATA, NOOP, RSET, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        self.reply('220 localhost SMTP sink ready')
+        sink.stats['connections'] += 1
+        sender, recipients = None, []
+
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            command = line.split(' ', 1)[0].upper()
+
+            if command == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250-AUTH PLAIN LOGIN')
+                self.reply('250 OK')
+            elif command == 'HELO':
+                self.reply('250 localhost')
+            elif command == 'AUTH':
+                parts = line.split()
+                # Any credentials are accepted
+                if len(parts) > 1 and parts[1].upper() == 'LOGIN':
+                    if len(parts) == 2:
+                        self.reply('334 VXNlcm5hbWU6')
+                        self.rfile.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                elif len(parts) == 2:
+                    # PLAIN without an initial response
+                    self.reply('334 ')
+                    self.rfile.readline()
+                self.reply('235 Authentication successful')
+            elif command == 'MAIL':
+                sender, recipients = line[10:].strip(' <>'), []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipients.append(line[8:].strip(' <>'))
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b'.\r\n', b'.\n'):
+                        break
+                    # Undo dot-stuffing
+                    data.append(chunk[1:] if chunk.startswith(b'..') else chunk)
+                sink.store(sender, recipients, b''.join(data))
+                self.reply('250 OK: queued')
+            elif command in ('NOOP', 'RSET'):
+                if command == 'RSET':
+                    sender, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Threaded SMTP server that records received messages"""
+
+    def __init__(self, host='127.0.0.1', port=2525, mbox=None):
+        """
+        Initialize the sink
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on (0 picks a free port)
+            mbox (str): Optional file every message is appended to
+        """
+        self.server = _ThreadingServer((host, port), _SMTPHandler)
+        self.server.sink = self
+        self.host, self.port = self.server.server_address
+        self.mbox = mbox
+        self.messages = []
+        self.stats = {'connections': 0, 'messages': 0}
+        self._lock = threading.Lock()
+
+    def store(self, sender, recipients, data):
+        """Record a received message"""
+        with self._lock:
+            self.messages.append({'from': sender, 'to': recipients, 'message': message_from_bytes(data)})
+            self.stats['messages'] += 1
+            if self.mbox:
+                with open(self.mbox, 'ab') as f:
+                    f.write(f"From {sender}\n".encode('utf-8') + data + b'\n')
+
+    def start(self):
+        """Serve in a background thread and return self"""
+        threading.Thread(target=self.server.serve_forever, name='smtp-sink', daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local SMTP sink for AlgoBlocks development')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--mbox', help='append received messages to this file')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.mbox)
+    print(f"SMTP sink listening on {sink.host}:{sink.port}")
+    try:
+        sink.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
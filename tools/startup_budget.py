@@ -0,0 +1,135 @@
+"""
+Measure AlgoBlocks cold-start cost against a budget
+
+Each run starts a fresh interpreter, imports app.py and calls create_app(),
+then serves the login page and a static file through the test client. It
+reports import time, peak RSS and which heavy modules (pandas, NumPy,
+alpaca_trade_api) got loaded, and exits non-zero when a budget is exceeded,
+so it can guard cold starts and worker recycling in CI:
+
+    python tools/startup_budget.py --runs 5 --max-import-ms 400 --max-rss-mb 60
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only the pages that need market data or backtests may load
+HEAVY_MODULES = ['pandas', 'numpy', 'alpaca_trade_api', 'aiohttp']
+
+_PROBE = r"""
+import sys, time, json, resource
+start = time.perf_counter()
+import app
+flask_app = app.create_app()
+import_ms = (time.perf_counter() - start) * 1000
+
+def rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+heavy = json.loads(sys.argv[1])
+loaded_at_import = [name for name in heavy if name in sys.modules]
+import_rss = rss_mb()
+
+client = flask_app.test_client()
+start = time.perf_counter()
+statuses = [client.get('/login').status_code, client.get('/static/js/events.js').status_code]
+first_request_ms = (time.perf_counter() - start) * 1000
+
+print(json.dumps({
+    'import_ms': import_ms,
+    'import_rss_mb': import_rss,
+    'first_request_ms': first_request_ms,
+    'rss_mb': rss_mb(),
+    'statuses': statuses,
+    'loaded_at_import': loaded_at_import,
+    'loaded_after_login': [name for name in heavy if name in sys.modules]
+}))
+"""
+
+
+def measure_once(workdir):
+    """
+    Run the startup probe in a fresh interpreter
+
+    Returns:
+        dict: Probe measurements
+    """
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': REPO_ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+        'ALGOBLOCKS_START_SERVICES': '0',
+        'ALGOBLOCKS_DB': os.path.join(workdir, 'data', 'algoblocks.db'),
+        'PYTHONDONTWRITEBYTECODE': '1'
+    })
+    result = subprocess.run([sys.executable, '-c', _PROBE, json.dumps(HEAVY_MODULES)], cwd=workdir, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_budget(runs, max_import_ms, max_rss_mb):
+    """
+    Summarize probe runs and compare them with the budget
+
+    Returns:
+        tuple: (within budget, report dict)
+    """
+    report = {
+        'runs': len(runs),
+        'import_ms': round(statistics.median(run['import_ms'] for run in runs), 1),
+        'first_request_ms': round(statistics.median(run['first_request_ms'] for run in runs), 1),
+        'rss_mb': round(max(run['rss_mb'] for run in runs), 1),
+        'loaded_after_login': sorted({name for run in runs for name in run['loaded_after_login']}),
+        'statuses': runs[0]['statuses'],
+        'failures': []
+    }
+    if report['import_ms'] > max_import_ms:
+        report['failures'].append(f"import took {report['import_ms']} ms (budget {max_import_ms} ms)")
+    if report['rss_mb'] > max_rss_mb:
+        report['failures'].append(f"peak RSS {report['rss_mb']} MB (budget {max_rss_mb} MB)")
+    if report['loaded_after_login']:
+        report['failures'].append(f"login and static pages loaded {', '.join(report['loaded_after_login'])}")
+    if any(status != 200 for status in report['statuses']):
+        report['failures'].append(f"unexpected statuses {report['statuses']}")
+    return not report['failures'], report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check AlgoBlocks import time and memory against a budget')
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters to measure (median is reported)')
+    parser.add_argument('--max-import-ms', type=float, default=400, help='budget for import app + create_app()')
+    parser.add_argument('--max-rss-mb', type=float, default=60, help='budget for peak RSS after the first request')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='algoblocks-startup-')
+    try:
+        runs = [measure_once(workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ok, report = check_budget(runs, args.max_import_ms, args.max_rss_mb)
+    print(f"import + create_app: {report['import_ms']} ms (median of {report['runs']})")
+    print(f"first login/static requests: {report['first_request_ms']} ms")
+    print(f"peak RSS: {report['rss_mb']} MB")
+    print(f"heavy modules loaded: {', '.join(report['loaded_after_login']) or 'none'}")
+    for failure in report['failures']:
+        print(f"OVER BUDGET: {failure}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
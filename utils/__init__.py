@@ -1,6 +1,21 @@
 # Initialize utils package
-from utils.backtest_engine import BacktestEngine
-from utils.data_fetcher import DataFetcher
-from utils.strategy_parser import StrategyParser
+# The package exports are imported on first access (PEP 562), so importing a
+# light module such as utils.storage does not load pandas via the backtest engine
+import importlib
+
+_EXPORTS = {
+    'BacktestEngine': 'utils.backtest_engine',
+    'DataFetcher': 'utils.data_fetcher',
+    'StrategyParser': 'utils.strategy_parser'
+}
 
 __all__ = ['BacktestEngine', 'DataFetcher', 'StrategyParser']
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'utils' has no attribute '{name}'")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
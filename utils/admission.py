@@ -0,0 +1,321 @@
+import os
+import math
+import time
+import logging
+import threading
+from functools import wraps
+from collections import OrderedDict, deque, defaultdict
+from flask import request, session, jsonify
+
+logger = logging.getLogger(__name__)
+
+# Token buckets idle longer than this are full again and can be forgotten
+BUCKET_IDLE_SECONDS = 600
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted to a pool"""
+
+    def __init__(self, pool, reason, retry_after):
+        super().__init__(f"{pool} {reason}")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Rate limiter allowing bursts of `burst` requests refilled at `rate` per second"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Take one token if available
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Ticket:
+    __slots__ = ('user', 'event', 'granted', 'enqueued')
+
+    def __init__(self, user):
+        self.user = user
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued = time.monotonic()
+
+
+class CapacityPool:
+    """
+    Concurrency limit for one class of endpoints, with a bounded fair wait queue
+
+    Up to `capacity` requests run at once and each user may hold at most
+    `per_user` running or queued slots. Beyond that, up to `queue_size`
+    requests wait; freed slots are handed out round-robin across users, so one
+    user's burst cannot starve others. Requests that cannot queue, or that
+    wait longer than `max_wait`, are rejected with an estimated retry time.
+    Each user also has a token bucket limiting their request rate.
+    """
+
+    def __init__(self, name, capacity, per_user=1, queue_size=0, max_wait=10.0, rate=None, burst=None):
+        """
+        Initialize the pool
+
+        Args:
+            name (str): Pool name used in counters and errors
+            capacity (int): Requests allowed to run at once in this process
+            per_user (int): Running plus queued requests allowed per user
+            queue_size (int): Requests allowed to wait for a slot
+            max_wait (float): Seconds a request may wait before it is rejected
+            rate (float): Requests per second per user, or None for no rate limit
+            burst (int): Token bucket size (defaults to max(1, rate))
+        """
+        self.name = name
+        self.capacity = capacity
+        self.per_user = per_user
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.rate = rate
+        self.burst = burst or max(1, int(math.ceil(rate or 1)))
+        self.stats = {
+            'admitted': 0, 'queued': 0, 'completed': 0, 'timed_out': 0,
+            'rejected_rate': 0, 'rejected_user': 0, 'rejected_queue': 0,
+            'active': 0, 'waiting': 0, 'peak_active': 0, 'peak_waiting': 0,
+            'wait_seconds': 0.0, 'service_seconds': 0.0
+        }
+        self._lock = threading.Lock()
+        self._active = 0
+        self._held = defaultdict(int)
+        self._waiting = OrderedDict()
+        self._queued = 0
+        self._buckets = {}
+        self._avg_service = 1.0
+        self._last_prune = time.monotonic()
+
+    def acquire(self, user):
+        """
+        Wait for a slot
+
+        Args:
+            user (str): Key the per-user limits apply to
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            AdmissionRejected: If the request is rate limited, over its user's
+                limit, finds the queue full or waits longer than max_wait
+        """
+        with self._lock:
+            if self.rate:
+                retry_after = self._bucket(user).take()
+                if retry_after:
+                    self.stats['rejected_rate'] += 1
+                    raise AdmissionRejected(self.name, 'rate limited', retry_after)
+            if self._held[user] >= self.per_user:
+                self.stats['rejected_user'] += 1
+                raise AdmissionRejected(self.name, 'too many concurrent requests for this user', self._avg_service)
+            if self._active < self.capacity and not self._queued:
+                self._grant(user)
+                return 0.0
+            if self._queued >= self.queue_size:
+                self.stats['rejected_queue'] += 1
+                raise AdmissionRejected(self.name, 'queue is full', self._estimated_wait(self._queued))
+
+            ticket = _Ticket(user)
+            self._waiting.setdefault(user, deque()).append(ticket)
+            self._queued += 1
+            self._held[user] += 1
+            self.stats['queued'] += 1
+            self.stats['waiting'] = self._queued
+            self.stats['peak_waiting'] = max(self.stats['peak_waiting'], self._queued)
+
+        ticket.event.wait(self.max_wait)
+
+        with self._lock:
+            waited = time.monotonic() - ticket.enqueued
+            if ticket.granted:
+                self.stats['wait_seconds'] += waited
+                return waited
+            # Timed out: leave the queue
+            tickets = self._waiting[user]
+            tickets.remove(ticket)
+            if not tickets:
+                del self._waiting[user]
+            self._queued -= 1
+            self._release_hold(user)
+            self.stats['waiting'] = self._queued
+            self.stats['timed_out'] += 1
+            raise AdmissionRejected(self.name, 'timed out waiting for capacity', self._estimated_wait(self._queued))
+
+    def release(self, user, service_seconds):
+        """Free a slot and hand it to the next user in round-robin order"""
+        with self._lock:
+            self._active -= 1
+            self._release_hold(user)
+            self.stats['completed'] += 1
+            self.stats['service_seconds'] += service_seconds
+            self._avg_service += 0.2 * (service_seconds - self._avg_service)
+
+            while self._active < self.capacity and self._waiting:
+                next_user, tickets = next(iter(self._waiting.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    self._waiting.move_to_end(next_user)
+                else:
+                    del self._waiting[next_user]
+                self._queued -= 1
+                ticket.granted = True
+                self._active += 1
+                self.stats['admitted'] += 1
+                self.stats['active'] = self._active
+                self.stats['peak_active'] = max(self.stats['peak_active'], self._active)
+                ticket.event.set()
+            self.stats['active'] = self._active
+            self.stats['waiting'] = self._queued
+
+    def _grant(self, user):
+        self._active += 1
+        self._held[user] += 1
+        self.stats['admitted'] += 1
+        self.stats['active'] = self._active
+        self.stats['peak_active'] = max(self.stats['peak_active'], self._active)
+
+    def _release_hold(self, user):
+        self._held[user] -= 1
+        if self._held[user] <= 0:
+            del self._held[user]
+
+    def _estimated_wait(self, queued):
+        """Seconds until a request behind `queued` others would likely start"""
+        return self._avg_service * (queued + 1) / max(self.capacity, 1)
+
+    def _bucket(self, user):
+        now = time.monotonic()
+        if now - self._last_prune > BUCKET_IDLE_SECONDS:
+            self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                             if now - bucket.updated < BUCKET_IDLE_SECONDS}
+            self._last_prune = now
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            bucket = self._buckets[user] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def snapshot(self):
+        """Get a copy of the pool's counters and settings"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({'capacity': self.capacity, 'per_user': self.per_user,
+                      'queue_size': self.queue_size, 'rate': self.rate, 'burst': self.burst})
+        return stats
+
+
+def _default_backtest_capacity():
+    """CPU-bound work: share the machine's cores between the server's worker processes"""
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    return max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+
+def _env(name, default, cast=int):
+    value = os.getenv(name)
+    return default if value in (None, '') else cast(value)
+
+
+def _build_pools():
+    backtest_capacity = _env('ADMISSION_BACKTEST_CONCURRENCY', _default_backtest_capacity())
+    return {
+        # Backtests are CPU bound; a short queue absorbs bursts while the rest
+        # are turned away quickly instead of tying up server threads
+        'backtest': CapacityPool(
+            'backtest',
+            capacity=backtest_capacity,
+            per_user=_env('ADMISSION_BACKTEST_PER_USER', 1),
+            queue_size=_env('ADMISSION_BACKTEST_QUEUE', 2 * backtest_capacity),
+            max_wait=_env('ADMISSION_BACKTEST_MAX_WAIT', 15.0, float),
+            rate=_env('ADMISSION_BACKTEST_RATE', 0.2, float),
+            burst=_env('ADMISSION_BACKTEST_BURST', 3)
+        ),
+        # Endpoints that wait on the Alpaca API
+        'market_data': CapacityPool(
+            'market_data',
+            capacity=_env('ADMISSION_MARKET_DATA_CONCURRENCY', 8),
+            per_user=_env('ADMISSION_MARKET_DATA_PER_USER', 4),
+            queue_size=_env('ADMISSION_MARKET_DATA_QUEUE', 8),
+            max_wait=_env('ADMISSION_MARKET_DATA_MAX_WAIT', 5.0, float),
+            rate=_env('ADMISSION_MARKET_DATA_RATE', 5.0, float),
+            burst=_env('ADMISSION_MARKET_DATA_BURST', 20)
+        )
+    }
+
+
+_pools = None
+_pools_lock = threading.Lock()
+
+
+def get_pools():
+    """
+    Get the process-wide capacity pools configured from ADMISSION_* environment variables
+
+    Limits apply per server process; pages that only read the database
+    (login, portfolio, events) are not pooled and keep their own threads.
+
+    Returns:
+        dict: Pool name -> CapacityPool
+    """
+    global _pools
+    if _pools is None:
+        with _pools_lock:
+            if _pools is None:
+                _pools = _build_pools()
+    return _pools
+
+
+def get_stats():
+    """Get every pool's counters"""
+    return {name: pool.snapshot() for name, pool in get_pools().items()}
+
+
+def admit(pool_name):
+    """
+    Decorate a view so it runs inside a capacity pool slot
+
+    Requests are keyed by the logged-in user, or the client address when
+    there is none. Rejections answer 429 with a Retry-After header.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            pool = get_pools()[pool_name]
+            user = session.get('user_email') or request.remote_addr or 'anonymous'
+            try:
+                pool.acquire(user)
+            except AdmissionRejected as e:
+                retry_after = max(1, int(math.ceil(e.retry_after)))
+                logger.warning(f"Rejected {request.path} for {user}: {e.pool} {e.reason}")
+                response = jsonify({'error': f"Server busy ({e.reason}), please retry shortly",
+                                    'retry_after': retry_after})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+            start = time.monotonic()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                pool.release(user, time.monotonic() - start)
+        return wrapper
+    return decorator
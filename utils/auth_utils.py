@@ -1,55 +1,72 @@
-import smtplib
 import os
+import time
+import uuid
 import random
+import socket
 import string
-import json
+import logging
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from flask import session
+from utils import storage
+from utils.mailer import get_mail_queue
+from utils.user_directory import get_account, account_exists
 
-# Store verification codes temporarily
-VERIFICATION_CODES = {}
-USER_DATA_FILE = 'data/users.json'
+logger = logging.getLogger(__name__)
 
-# Ensure users file exists
-os.makedirs(os.path.dirname(USER_DATA_FILE), exist_ok=True)
-if not os.path.exists(USER_DATA_FILE):
-    with open(USER_DATA_FILE, 'w') as f:
-        json.dump({}, f)
+# Verification codes expire after 10 minutes; expired codes are swept every
+# sweep interval by whichever process holds the sweep lease
+VERIFICATION_CODE_TTL = int(os.getenv('VERIFICATION_CODE_TTL', 600))
+VERIFICATION_SWEEP_INTERVAL = 300
+SWEEP_LEASE = 'verification-sweep'
+SWEEP_LEASE_TTL = 2 * VERIFICATION_SWEEP_INTERVAL
 
-def load_users():
-    """Load users from JSON file"""
-    try:
-        with open(USER_DATA_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return {}
-
-def save_users(users):
-    """Save users to JSON file"""
-    with open(USER_DATA_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+_sweeper_pid = None
 
 def generate_verification_code():
     """Generate a 6-digit verification code"""
     return ''.join(random.choices(string.digits, k=6))
 
+def _sweep_loop(interval, owner):
+    """Delete expired verification codes every interval seconds while holding the sweep lease"""
+    while True:
+        try:
+            if storage.acquire_lease(SWEEP_LEASE, owner, SWEEP_LEASE_TTL):
+                removed = storage.sweep_verification_codes()
+                if removed:
+                    logger.info(f"Swept {removed} expired verification codes")
+        except Exception as e:
+            logger.error(f"Error sweeping verification codes: {str(e)}")
+        time.sleep(interval)
+
+def start_code_sweeper(interval=VERIFICATION_SWEEP_INTERVAL):
+    """
+    Start the background sweep of expired verification codes for this process
+    
+    Args:
+        interval (int): Seconds between sweeps
+    """
+    global _sweeper_pid
+    if _sweeper_pid == os.getpid():
+        return
+    _sweeper_pid = os.getpid()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    thread = threading.Thread(target=_sweep_loop, args=(interval, owner), name='verification-sweep', daemon=True)
+    thread.start()
+
 def send_verification_email(email, code):
-    """Send verification email with code"""
-    # Get email credentials from environment
-    smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-    smtp_port = int(os.getenv('SMTP_PORT', 587))
-    smtp_user = os.getenv('SMTP_USER', '')
-    smtp_password = os.getenv('SMTP_PASSWORD', '')
+    """Queue verification email with code for background delivery"""
+    mail_queue = get_mail_queue()
     
-    if not smtp_user or not smtp_password:
+    if mail_queue is None:
         # Use a simulated email for development
         print(f"DEVELOPMENT MODE: Verification code for {email} is {code}")
         return True
         
     # Create email message
     message = MIMEMultipart()
-    message['From'] = smtp_user
+    message['From'] = mail_queue.user
     message['To'] = email
     message['Subject'] = 'AlgoBlocks Verification Code'
     
@@ -59,63 +76,47 @@ def send_verification_email(email, code):
     <body>
         <h2>AlgoBlocks Verification Code</h2>
         <p>Your verification code is: <strong>{code}</strong></p>
-        <p>This code will expire in 10 minutes.</p>
+        <p>This code will expire in {VERIFICATION_CODE_TTL // 60} minutes.</p>
     </body>
     </html>
     """
     message.attach(MIMEText(body, 'html'))
     
-    try:
-        # Connect to SMTP server
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.send_message(message)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+    # Delivery (connection reuse, retries) happens on the mail queue worker
+    return mail_queue.enqueue(message)
 
 def register_user(email, password, username):
     """Register a new user"""
-    users = load_users()
-    if email in users:
+    if account_exists(email):
+        return False, "Email already registered"
+        
+    # Store user details first (in production, use password hashing!), so a
+    # duplicate or failed registration never sends a verification email
+    if not storage.create_user(email, username, password):
         return False, "Email already registered"
         
     # Generate verification code
     code = generate_verification_code()
-    VERIFICATION_CODES[email] = code
+    storage.save_verification_code(email, code, VERIFICATION_CODE_TTL)
     
     # Send verification email
     if send_verification_email(email, code):
-        # Store user details temporarily
-        users[email] = {
-            'username': username,
-            'password': password,  # In production, use password hashing!
-            'verified': False,
-            'portfolio': {
-                'cash': 10000.00,
-                'trades': []
-            }
-        }
-        save_users(users)
         return True, "Verification email sent"
-    else:
-        return False, "Failed to send verification email"
+    
+    # Undo the registration so the address can be registered again
+    storage.delete_verification_code(email)
+    storage.delete_unverified_user(email)
+    return False, "Failed to send verification email"
 
 def verify_user(email, code):
     """Verify a user's email"""
-    if email not in VERIFICATION_CODES or VERIFICATION_CODES[email] != code:
+    stored_code = storage.get_verification_code(email)
+    if stored_code is None or stored_code != code:
         return False, "Invalid verification code"
         
-    users = load_users()
-    if email in users:
-        users[email]['verified'] = True
-        save_users(users)
-        
+    if storage.set_verified(email):
         # Clean up verification code
-        del VERIFICATION_CODES[email]
+        storage.delete_verification_code(email)
         
         return True, "Email verified successfully"
     else:
@@ -123,11 +124,10 @@ def verify_user(email, code):
 
 def login_user(email, password):
     """Log in a user"""
-    users = load_users()
-    if email not in users:
+    user = get_account(email)
+    if user is None:
         return False, "Email not registered"
         
-    user = users[email]
     if not user['verified']:
         return False, "Email not verified"
         
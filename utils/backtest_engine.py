@@ -1,10 +1,111 @@
 import pandas as pd
 import numpy as np
 import logging
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
+from utils import indicators
+from utils.optimizer import (ParameterSpace, SuccessiveHalving, DEFAULT_MAX_EVALUATIONS, DEFAULT_TIME_BUDGET,
+                             ETA, MAX_RUNGS, MIN_WINDOW_BARS)
+from utils.strategy_compiler import ExpressionGraph, StrategyCompileError, compile_strategy, rewrite_rule
+from utils.records import TRADE_DTYPE, BUY, SELL, TRADE_TIME_FORMAT, bars_to_frame, epoch_seconds, format_time, index_seconds, trades_to_records
 
 logger = logging.getLogger(__name__)
 
+class BacktestResult:
+    """
+    Metrics, trades and equity curve of one backtest
+    
+    Trades are kept as a TRADE_DTYPE array and the equity curve as a float
+    array, so results held by tournaments and optimizers stay small; the
+    dictionaries the API returns are only built by to_dict().
+    """
+    
+    __slots__ = ('initial_capital', 'final_equity', 'total_return', 'sharpe_ratio',
+                 'max_drawdown', 'trades', 'equity_curve', 'error')
+    
+    def __init__(self, initial_capital, final_equity, total_return, sharpe_ratio, max_drawdown,
+                 trades, equity_curve, error=None):
+        self.initial_capital = initial_capital
+        self.final_equity = final_equity
+        self.total_return = total_return
+        self.sharpe_ratio = sharpe_ratio
+        self.max_drawdown = max_drawdown
+        self.trades = trades
+        self.equity_curve = equity_curve
+        self.error = error
+    
+    @property
+    def total_trades(self):
+        return len(self.trades)
+    
+    def to_dict(self):
+        """Get the results in the JSON format returned by the backtest API"""
+        result = {'error': self.error} if self.error else {}
+        result.update({
+            'initial_capital': self.initial_capital,
+            'final_equity': self.final_equity,
+            'total_return': self.total_return,
+            'sharpe_ratio': self.sharpe_ratio,
+            'max_drawdown': self.max_drawdown,
+            'total_trades': self.total_trades,
+            'trades': trades_to_records(self.trades),
+            'equity_curve': self.equity_curve.tolist()
+        })
+        return result
+
+class _IndicatorTable:
+    """
+    Bars plus indicator columns computed once per distinct configuration
+    
+    Shared by every strategy of a tournament or parameter search. Each
+    configuration's columns are kept apart, so two configurations adding a
+    column of the same name (e.g. MACDs with different periods) do not
+    overwrite each other.
+    """
+    
+    def __init__(self, df):
+        """
+        Initialize the table
+        
+        Args:
+            df (DataFrame): Bars indexed by time
+        """
+        self.df = df
+        self.bars = {column: df[column].to_numpy(dtype=float) for column in df.columns}
+        self.times = index_seconds(df.index)
+        self.complete = ~df.isnull().any(axis=1).to_numpy()
+        self.outputs = {}  # Configuration key -> names of the columns it adds
+        self.values = {}  # Configuration key -> column name -> values
+        self._complete = {}  # Configuration key -> rows where its columns are valid, or None
+        self._ids = {}
+    
+    def __len__(self):
+        return len(self.df)
+    
+    def add(self, config):
+        """Compute an indicator configuration unless already done, and return its key"""
+        key = indicators.indicator_key(config)
+        if key not in self.outputs:
+            frame = indicators.apply_indicators(self.df.copy(deep=False), [config])
+            added = [column for column in frame.columns if column not in self.bars]
+            self.outputs[key] = added
+            self.values[key] = {column: frame[column].to_numpy(dtype=float) for column in added}
+            self._complete[key] = ~frame[added].isnull().any(axis=1).to_numpy() if added else None
+            self._ids[key] = len(self._ids)
+        return key
+    
+    def qualified(self, key, column):
+        """Get a name for a configuration's column that no other configuration shares"""
+        return f"{column}__{self._ids[key]}"
+    
+    def complete_rows(self, keys):
+        """Get the rows where the bars and every given configuration's columns are valid"""
+        rows = self.complete.copy()
+        for key in keys:
+            if self._complete[key] is not None:
+                rows &= self._complete[key]
+        return rows
+
 class BacktestEngine:
     """Engine for backtesting trading strategies with Alpaca data"""
     
@@ -29,107 +130,327 @@ class BacktestEngine:
             initial_capital (float): Initial capital amount
             
         Returns:
-            dict: Backtest results including metrics and trades
+            BacktestResult: Backtest results including metrics and trades
+            
+        Raises:
+            StrategyCompileError: If a rule cannot be compiled or reads a missing column
         """
         # Log the start of backtest
         logger.info(f"Starting backtest for {symbol} with {len(strategy['indicators'])} indicators")
         
-        # Get historical data
-        historical_data = self.data_fetcher.get_historical_data(
+        # Default to the last two years
+        start_date, end_date = self._default_range(start_date, end_date)
+        
+        # Get exactly the requested range plus its warmup
+        df, error = self._load_bars(symbol, start_date, end_date, self._warmup(strategy))
+        if df is None:
+            return self._empty_result(error, initial_capital)
+        
+        start_bar = int(np.searchsorted(df.index, pd.Timestamp(start_date)))
+        results, errors = self._run_batch(_IndicatorTable(df), {symbol: strategy}, start_bar, initial_capital)
+        if errors:
+            raise errors[symbol]
+        return results[symbol]
+    
+    def run_tournament(self, strategies, symbol='AAPL', start_date=None, end_date=None, initial_capital=10000.0):
+        """
+        Backtest several strategies against the same bars
+        
+        The bars are fetched once with the largest warmup any strategy needs
+        and the strategies run as one batch (see _run_batch).
+        
+        Args:
+            strategies (dict): Strategy name -> strategy configuration
+            symbol (str): Trading symbol
+            start_date (str): Start date for backtest (YYYY-MM-DD)
+            end_date (str): End date for backtest (YYYY-MM-DD)
+            initial_capital (float): Initial capital amount
+            
+        Returns:
+            dict: 'results' (name -> BacktestResult), 'errors'
+                (name -> message for strategies that could not run) and 'indicators'
+                (number of distinct indicators computed)
+        """
+        start_date, end_date = self._default_range(start_date, end_date)
+        errors = {}
+        warmups = {}
+        for name, strategy in strategies.items():
+            try:
+                warmups[name] = self._warmup(strategy)
+            except StrategyCompileError as e:
+                errors[name] = f"Invalid strategy rule: {str(e)}"
+        if not warmups:
+            return {'results': {}, 'errors': errors, 'indicators': 0}
+        
+        df, error = self._load_bars(symbol, start_date, end_date, max(warmups.values()))
+        if df is None:
+            return {'results': {name: self._empty_result(error, initial_capital) for name in warmups},
+                    'errors': errors, 'indicators': 0}
+        
+        table = _IndicatorTable(df)
+        start_bar = int(np.searchsorted(df.index, pd.Timestamp(start_date)))
+        results, failed = self._run_batch(table, {name: strategies[name] for name in warmups}, start_bar, initial_capital)
+        errors.update({name: f"Invalid strategy rule: {str(e)}" for name, e in failed.items()})
+        return {'results': results, 'errors': errors, 'indicators': len(table.outputs)}
+    
+    def optimize(self, strategy, symbol='AAPL', start_date=None, end_date=None, initial_capital=10000.0,
+                 space=None, objective='sharpe_ratio', max_evaluations=DEFAULT_MAX_EVALUATIONS,
+                 time_budget=DEFAULT_TIME_BUDGET, seed=None):
+        """
+        Search a strategy's indicator parameters and rule thresholds for the best backtest
+        
+        Candidates are screened by successive halving (see SuccessiveHalving):
+        each rung backtests its candidates on a trailing window of the range,
+        from the shortest up to the full range, and only the best third move
+        on. Every rung's candidates run as one batch over bars fetched once,
+        so each distinct indicator configuration is computed once per search.
+        
+        Args:
+            strategy (dict): Strategy configuration with indicators and rules
+            symbol (str): Trading symbol
+            start_date (str): Start date for backtest (YYYY-MM-DD)
+            end_date (str): End date for backtest (YYYY-MM-DD)
+            initial_capital (float): Initial capital amount
+            space (dict): Parameter range overrides (see ParameterSpace)
+            objective (str): Metric to optimize ('sharpe_ratio', 'total_return', 'final_equity' or 'max_drawdown')
+            max_evaluations (float): Budget in full-range backtests
+            time_budget (float): Seconds the search may run
+            seed (int): Random seed for reproducible searches
+            
+        Returns:
+            dict: 'best' ({'parameters', 'strategy', 'results'} or None), 'leaderboard'
+                (list of {'parameters', 'strategy', 'results'}, best first), 'space' (the
+                searched ranges), 'stats' (evaluations, cost, grid size, ...) and 'error'
+                if no bars were available
+            
+        Raises:
+            ValueError: If the space overrides or the objective are invalid
+            StrategyCompileError: If a rule cannot be compiled
+        """
+        start_date, end_date = self._default_range(start_date, end_date)
+        space = ParameterSpace(strategy, space)
+        
+        # Fetch once with the warmup the widest candidate needs
+        df, error = self._load_bars(symbol, start_date, end_date,
+                                    self._warmup(space.apply(strategy, space.upper_bounds())))
+        if df is None:
+            return {'best': None, 'leaderboard': [], 'space': space.describe(), 'stats': {}, 'error': error}
+        
+        table = _IndicatorTable(df)
+        start_bar = int(np.searchsorted(df.index, pd.Timestamp(start_date)))
+        windows = self._windows(start_bar, len(df))
+        
+        def evaluate(candidates, rung):
+            concrete = {i: space.apply(strategy, values) for i, values in enumerate(candidates)}
+            results, errors = self._run_batch(table, concrete, windows[rung], initial_capital)
+            return [results.get(i) for i in range(len(candidates))]
+        
+        search = SuccessiveHalving(space, evaluate, costs=[(len(df) - start) / (len(df) - windows[-1]) for start in windows],
+                                   objective=objective, max_evaluations=max_evaluations,
+                                   time_budget=time_budget, seed=seed)
+        leaderboard = [{'parameters': values, 'strategy': space.apply(strategy, values), 'results': result}
+                       for _, values, result in search.run()]
+        
+        stats = dict(search.stats)
+        stats.update({
+            'grid_size': space.grid_size,
+            'grid_fraction': stats['cost'] / space.grid_size,
+            'rungs': len(windows),
+            'indicators': len(table.outputs)
+        })
+        stats['cost'] = round(stats['cost'], 3)
+        return {'best': leaderboard[0] if leaderboard else None, 'leaderboard': leaderboard,
+                'space': space.describe(), 'stats': stats}
+    
+    def _default_range(self, start_date, end_date):
+        """Fill in a missing range with the last two years"""
+        end_date = end_date or datetime.now().strftime('%Y-%m-%d')
+        start_date = start_date or (datetime.now() - timedelta(days=365 * 2)).strftime('%Y-%m-%d')
+        return start_date, end_date
+    
+    def _warmup(self, strategy):
+        """
+        Bars needed before the first bar a strategy can trade on
+        
+        Signals on bar i are read from bar i - 1, so the first bar in range needs
+        one bar beyond the indicator and rule warmup behind it.
+        """
+        return indicators.required_lookback(strategy.get('indicators')) + compile_strategy(strategy).lookback + 1
+    
+    def _windows(self, start_bar, end_bar, eta=ETA):
+        """
+        First bars of the trailing windows a parameter search tests candidates on
+        
+        Each window is eta times longer than the one before, the last one is
+        the full range, and the first keeps at least MIN_WINDOW_BARS bars.
+        """
+        total = max(end_bar - start_bar, 1)
+        rungs = 1
+        while rungs < MAX_RUNGS and total / eta ** rungs >= MIN_WINDOW_BARS:
+            rungs += 1
+        return [end_bar - int(round(total / eta ** (rungs - 1 - rung))) for rung in range(rungs)]
+    
+    def _run_batch(self, table, strategies, start_bar, initial_capital):
+        """
+        Backtest several strategies on the bars of one indicator table
+        
+        Each distinct indicator is computed once for the whole table and every
+        strategy's rules are compiled into one shared expression graph, so
+        common subexpressions are evaluated once for all of them. Only the
+        per-bar trade simulation runs per strategy.
+        
+        Args:
+            table (_IndicatorTable): Bars and the indicators computed on them so far
+            strategies (dict): Name -> strategy configuration
+            start_bar (int): Index of the first bar to trade on, once every input is valid
+            initial_capital (float): Initial capital amount
+            
+        Returns:
+            tuple: (name -> BacktestResult, name -> StrategyCompileError for strategies that could not run)
+        """
+        keys = {name: [table.add(config) for config in strategy.get('indicators') or []]
+                for name, strategy in strategies.items()}
+        
+        # Columns added by more than one configuration get qualified names, so
+        # every strategy reads the values of its own configuration
+        owners = defaultdict(set)
+        for name in strategies:
+            for key in keys[name]:
+                for column in table.outputs[key]:
+                    owners[column].add(key)
+        
+        graph = ExpressionGraph()
+        compiled = {}
+        warmups = {}
+        sources = {}
+        errors = {}
+        for name, strategy in strategies.items():
+            names = {}
+            for key in keys[name]:
+                for column in table.outputs[key]:
+                    names[column] = table.qualified(key, column) if len(owners[column]) > 1 else column
+                    sources[names[column]] = table.values[key][column]
+            renames = {column: qualified for column, qualified in names.items() if qualified != column}
+            if renames:
+                strategy = dict(strategy)
+                for side in ('entry_rules', 'exit_rules'):
+                    strategy[side] = [rewrite_rule(rule, renames) for rule in strategy.get(side) or []]
+            
+            # Block conditions on columns no indicator produced are skipped, as before
+            available = set(table.bars) | set(names.values())
+            try:
+                compiled[name] = compile_strategy(strategy, columns=available, graph=graph)
+                missing = [column for column in compiled[name].columns if column not in available]
+                if missing:
+                    raise StrategyCompileError(f"Column '{missing[0]}' not found in data")
+                warmups[name] = (indicators.required_lookback(strategy.get('indicators'))
+                                 + compiled[name].lookback + 1)
+            except StrategyCompileError as e:
+                compiled.pop(name, None)
+                errors[name] = e
+        if not compiled:
+            return {}, errors
+        logger.info(f"Backtesting {len(compiled)} strategies sharing {len(owners)} indicator columns "
+                    f"and {len(graph.nodes)} expression nodes")
+        
+        bars = {column: sources[column] if column in sources else table.bars[column]
+                for column in graph.columns if column in sources or column in table.bars}
+        roots = {}
+        for name, strategy in compiled.items():
+            roots[(name, 'entry')] = strategy.entry
+            roots[(name, 'exit')] = strategy.exit
+        signals = graph.evaluate(bars, roots, length=len(table))
+        
+        results = {}
+        closes = table.bars['close']
+        for name in compiled:
+            first_bar = max(start_bar, warmups[name])
+            if first_bar >= len(table):
+                logger.warning("Insufficient data after date filtering")
+                results[name] = self._empty_result("Insufficient data after date filtering", initial_capital)
+                continue
+            results[name] = self._simulate(closes, table.times, signals[(name, 'entry')].astype(bool),
+                                           signals[(name, 'exit')].astype(bool), table.complete_rows(keys[name]),
+                                           first_bar, initial_capital)
+        return results, errors
+    
+    def _load_bars(self, symbol, start_date, end_date, warmup):
+        """
+        Fetch daily bars for a range plus warmup bars before it
+        
+        Returns:
+            tuple: (DataFrame indexed by time, or None; error message if None)
+        """
+        bars = self.data_fetcher.get_daily_bars(
             symbol=symbol,
-            timeframe='1D',  # Daily data for backtesting
-            period='2Y'      # Get enough data for calculations
+            start_date=start_date,
+            end_date=end_date,
+            warmup_bars=warmup
         )
         
-        if not historical_data or len(historical_data) < 30:
+        if not len(bars):
             logger.warning(f"Insufficient historical data for {symbol}")
-            return {
-                'error': f"Insufficient historical data for {symbol}",
-                'initial_capital': initial_capital,
-                'final_equity': initial_capital,
-                'total_return': 0.0,
-                'sharpe_ratio': 0.0,
-                'max_drawdown': 0.0,
-                'total_trades': 0,
-                'trades': [],
-                'equity_curve': [initial_capital]
-            }
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(historical_data)
-        df['time'] = pd.to_datetime(df['time'])
-        df.set_index('time', inplace=True)
-        
-        # Filter by date range if provided
-        if start_date:
-            df = df[df.index >= start_date]
-        if end_date:
-            df = df[df.index <= end_date]
-        
-        # Check if we have enough data after filtering
-        if len(df) < 20:
-            logger.warning(f"Insufficient data after date filtering")
-            return {
-                'error': "Insufficient data after date filtering",
-                'initial_capital': initial_capital,
-                'final_equity': initial_capital,
-                'total_return': 0.0,
-                'sharpe_ratio': 0.0,
-                'max_drawdown': 0.0,
-                'total_trades': 0,
-                'trades': [],
-                'equity_curve': [initial_capital]
-            }
-        
-        # Apply indicators based on strategy
-        df = self._apply_indicators(df, strategy['indicators'])
-        
-        # Log available indicators after calculation
-        logger.info(f"Available columns after indicator calculation: {df.columns.tolist()}")
+            return None, f"Insufficient historical data for {symbol}"
+        
+        # Indicators work on a frame built straight from the bar columns
+        # Keep every bar before midnight (exchange time) after the end date
+        end = epoch_seconds(pd.Timestamp(end_date) + pd.Timedelta(days=1))
+        return bars_to_frame(bars[bars['time'] < end]), None
+    
+    def _empty_result(self, error, initial_capital):
+        """Results for a backtest that could not run"""
+        return BacktestResult(initial_capital, initial_capital, 0.0, 0.0, 0.0,
+                              np.empty(0, dtype=TRADE_DTYPE), np.array([initial_capital], dtype=float), error=error)
+    
+    def _simulate(self, closes, times, entry_signals, exit_signals, complete_rows, first_bar, initial_capital):
+        """
+        Trade on precomputed signals bar by bar and measure the results
         
+        Args:
+            closes (ndarray): Close price per bar
+            times (ndarray): Bar times in epoch seconds
+            entry_signals (ndarray): Entry condition per bar
+            exit_signals (ndarray): Exit condition per bar
+            complete_rows (ndarray): Whether every input of the strategy is valid per bar
+            first_bar (int): Index of the first bar to trade on
+            initial_capital (float): Initial capital amount
+            
+        Returns:
+            BacktestResult: Backtest results including metrics and trades
+        """
         # Initialize variables for simulation
         cash = initial_capital
         shares = 0
-        trades = []
+        trade_bars = []
+        trade_sides = []
+        trade_shares = []
         equity_curve = [initial_capital]
         
         # Run simulation day by day
-        for i in range(len(df)):
-            if i < 20:  # Skip first few rows for indicator calculation
-                continue
-                
-            date = df.index[i].strftime('%Y-%m-%d')
-            price = df['close'].iloc[i]
+        for i in range(first_bar, len(closes)):
+            price = closes[i]
             
-            # Get yesterday's row for signal calculation (to avoid lookahead bias)
-            yesterday_data = df.iloc[i-1]
-            
-            # Check for NaN values in the row
-            if yesterday_data.isnull().any():
+            # Use yesterday's signals (to avoid lookahead bias), skipping rows with missing values
+            if not complete_rows[i-1]:
                 continue
             
             # Check entry conditions when we have no position
             if shares == 0:
                 # Check if entry conditions are met
-                entry_signal = self._evaluate_conditions(yesterday_data, strategy['entry_rules'])
-                
-                if entry_signal:
+                if entry_signals[i-1]:
                     # Calculate position size (simple approach: use all available cash)
                     shares_to_buy = int(cash / price)
                     cost = shares_to_buy * price
                     
                     if shares_to_buy > 0:
                         # Log the trade
-                        logger.info(f"BUY signal triggered on {date}: {shares_to_buy} shares at ${price:.2f}")
+                        logger.info(f"BUY signal triggered on {format_time(times[i], TRADE_TIME_FORMAT)}: "
+                                    f"{shares_to_buy} shares at ${price:.2f}")
                         
-                        # Record the trade
-                        trades.append({
-                            'date': date,
-                            'type': 'BUY',
-                            'price': price,
-                            'shares': shares_to_buy,
-                            'value': cost
-                        })
+                        # Record the trade; price and value are filled in from the bar afterwards
+                        trade_bars.append(i)
+                        trade_sides.append(BUY)
+                        trade_shares.append(shares_to_buy)
                         
                         # Update portfolio
                         cash -= cost
@@ -138,23 +459,18 @@ class BacktestEngine:
             # Check exit conditions when we have a position
             elif shares > 0:
                 # Check if exit conditions are met
-                exit_signal = self._evaluate_conditions(yesterday_data, strategy['exit_rules'])
-                
-                if exit_signal:
+                if exit_signals[i-1]:
                     # Calculate sale value
                     sale_value = shares * price
                     
                     # Log the trade
-                    logger.info(f"SELL signal triggered on {date}: {shares} shares at ${price:.2f}")
+                    logger.info(f"SELL signal triggered on {format_time(times[i], TRADE_TIME_FORMAT)}: "
+                                f"{shares} shares at ${price:.2f}")
                     
                     # Record the trade
-                    trades.append({
-                        'date': date,
-                        'type': 'SELL',
-                        'price': price,
-                        'shares': shares,
-                        'value': sale_value
-                    })
+                    trade_bars.append(i)
+                    trade_sides.append(SELL)
+                    trade_shares.append(shares)
                     
                     # Update portfolio
                     cash += sale_value
@@ -164,6 +480,13 @@ class BacktestEngine:
             current_equity = cash + (shares * price)
             equity_curve.append(current_equity)
         
+        trades = np.empty(len(trade_bars), dtype=TRADE_DTYPE)
+        trades['time'] = times[trade_bars]
+        trades['side'] = trade_sides
+        trades['price'] = closes[trade_bars]
+        trades['shares'] = trade_shares
+        trades['value'] = trades['shares'] * trades['price']
+        
         # Calculate performance metrics
         initial_equity = equity_curve[0]
         final_equity = equity_curve[-1]
@@ -181,164 +504,15 @@ class BacktestEngine:
         logger.info(f"Backtest completed: {len(trades)} trades, {total_return:.2f}% return")
         
         # Prepare and return results
-        return {
-            'initial_capital': initial_capital,
-            'final_equity': round(final_equity, 2),
-            'total_return': round(total_return, 2),
-            'sharpe_ratio': round(sharpe_ratio, 2),
-            'max_drawdown': round(max_drawdown, 2),
-            'total_trades': len(trades),
-            'trades': trades,
-            'equity_curve': [round(eq, 2) for eq in equity_curve]
-        }
-    
-    def _apply_indicators(self, df, indicators):
-        """
-        Apply technical indicators to the DataFrame
-        
-        Args:
-            df (DataFrame): Price data
-            indicators (list): List of indicator configurations
-            
-        Returns:
-            DataFrame: DataFrame with indicators added
-        """
-        for indicator in indicators:
-            try:
-                if indicator['type'] == 'SMA':
-                    period = indicator['parameters']['period']
-                    df[f'SMA_{period}'] = df['close'].rolling(window=period).mean()
-                    logger.info(f"Calculated SMA_{period}")
-                
-                elif indicator['type'] == 'EMA':
-                    period = indicator['parameters']['period']
-                    df[f'EMA_{period}'] = df['close'].ewm(span=period, adjust=False).mean()
-                    logger.info(f"Calculated EMA_{period}")
-                
-                elif indicator['type'] == 'RSI':
-                    period = indicator['parameters']['period']
-                    delta = df['close'].diff()
-                    gain = delta.where(delta > 0, 0).rolling(window=period).mean()
-                    loss = -delta.where(delta < 0, 0).rolling(window=period).mean()
-                    
-                    # Avoid division by zero
-                    loss = loss.replace(0, np.nan)
-                    rs = gain / loss
-                    rs = rs.fillna(0)
-                    
-                    df[f'RSI_{period}'] = 100 - (100 / (1 + rs))
-                    logger.info(f"Calculated RSI_{period}")
-                
-                elif indicator['type'] == 'MACD':
-                    fast_period = indicator['parameters']['fast_period']
-                    slow_period = indicator['parameters']['slow_period']
-                    signal_period = indicator['parameters']['signal_period']
-                    
-                    # Calculate MACD line
-                    df[f'EMA_{fast_period}'] = df['close'].ewm(span=fast_period, adjust=False).mean()
-                    df[f'EMA_{slow_period}'] = df['close'].ewm(span=slow_period, adjust=False).mean()
-                    df['MACD'] = df[f'EMA_{fast_period}'] - df[f'EMA_{slow_period}']
-                    
-                    # Calculate signal line
-                    df['MACD_Signal'] = df['MACD'].ewm(span=signal_period, adjust=False).mean()
-                    
-                    # Calculate histogram
-                    df['MACD_Hist'] = df['MACD'] - df['MACD_Signal']
-                    
-                    logger.info(f"Calculated MACD with parameters: fast={fast_period}, slow={slow_period}, signal={signal_period}")
-            
-            except Exception as e:
-                logger.error(f"Error calculating indicator {indicator['type']}: {str(e)}")
-        
-        return df
-    
-    def _evaluate_conditions(self, row, conditions):
-        """
-        Evaluate if trading conditions are met
-        
-        Args:
-            row (Series): DataFrame row with indicator values
-            conditions (list): List of condition configurations
-            
-        Returns:
-            bool: True if conditions are met, False otherwise
-        """
-        if not conditions:
-            return False
-        
-        results = []
-        
-        for condition in conditions:
-            indicator = condition['indicator']
-            operator = condition['operator']
-            value = condition['value']
-            
-            # If indicator isn't in the row, skip this condition
-            if indicator not in row:
-                logger.warning(f"Indicator '{indicator}' not found in data. Available: {row.index.tolist()}")
-                continue
-            
-            # Get the indicator value
-            indicator_value = row[indicator]
-            
-            # Handle None or NaN values
-            if pd.isna(indicator_value):
-                logger.warning(f"Indicator '{indicator}' has NaN value")
-                continue
-            
-            # Process the value to compare against
-            compare_value = None
-            
-            # If value is another column name, get its value
-            if isinstance(value, str) and value in row:
-                compare_value = row[value]
-            else:
-                # Handle special values
-                if value == 'close':
-                    compare_value = row['close']
-                elif value == 'open':
-                    compare_value = row['open']
-                elif value == 'high':
-                    compare_value = row['high']
-                elif value == 'low':
-                    compare_value = row['low']
-                else:
-                    # Try to convert to float
-                    try:
-                        compare_value = float(value)
-                    except (ValueError, TypeError):
-                        logger.warning(f"Could not convert value '{value}' to a number")
-                        continue
-            
-            # Handle None or NaN values in the comparison value
-            if pd.isna(compare_value):
-                logger.warning(f"Comparison value '{value}' is NaN")
-                continue
-            
-            # Apply operator
-            try:
-                if operator == '>':
-                    results.append(indicator_value > compare_value)
-                elif operator == '<':
-                    results.append(indicator_value < compare_value)
-                elif operator == '==':
-                    results.append(indicator_value == compare_value)
-                elif operator == '>=':
-                    results.append(indicator_value >= compare_value)
-                elif operator == '<=':
-                    results.append(indicator_value <= compare_value)
-                else:
-                    logger.warning(f"Unsupported operator: {operator}")
-            except Exception as e:
-                logger.error(f"Error evaluating condition: {str(e)}")
-                continue
-        
-        # If no conditions could be evaluated, return False
-        if not results:
-            return False
-        
-        # Return True if all conditions are met
-        return all(results)
+        return BacktestResult(
+            initial_capital=initial_capital,
+            final_equity=round(float(final_equity), 2),
+            total_return=round(float(total_return), 2),
+            sharpe_ratio=round(float(sharpe_ratio), 2),
+            max_drawdown=round(float(max_drawdown), 2),
+            trades=trades,
+            equity_curve=np.round(equity_curve, 2)
+        )
     
     def _calculate_max_drawdown(self, equity_curve):
         """
@@ -0,0 +1,187 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds between stat() checks of a file whose version is not supplied by the caller
+CHECK_INTERVAL = 2.0
+
+# Documents kept in memory before the least recently used one is dropped
+MAX_ENTRIES = 512
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 256
+
+
+class CachedDocument:
+    """A JSON document serialized once, with precompressed bodies and per-encoding strong ETags"""
+
+    __slots__ = ('data', 'bodies', 'etags', 'version', 'checked_at')
+
+    def __init__(self, data, version):
+        self.data = data
+        self.version = version
+        self.checked_at = time.monotonic()
+
+        body = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {'identity': body}
+        self.etags = {'identity': digest}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.bodies['gzip'] = compressed
+                self.etags['gzip'] = f"{digest}-gz"
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.bodies['br'] = compressed
+                    self.etags['br'] = f"{digest}-br"
+
+
+class ContentCache:
+    """
+    In-memory cache of JSON files served as ready-to-send responses
+
+    Each file is read, parsed and serialized once. Later lookups compare a
+    version (a caller-supplied one such as a catalog mtime, or the file's
+    mtime and size from a stat() at most every CHECK_INTERVAL seconds) and
+    reload only when it changed, so unchanged content costs no file I/O or
+    JSON work.
+    """
+
+    def __init__(self, check_interval=CHECK_INTERVAL, max_entries=MAX_ENTRIES):
+        """
+        Initialize the cache
+
+        Args:
+            check_interval (float): Seconds between stat() checks per file
+            max_entries (int): Maximum number of cached documents
+        """
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'not_modified': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, version=None):
+        """
+        Get the cached document for a JSON file, loading it if needed
+
+        Args:
+            path (str): Path of the JSON file
+            version: Caller-known version of the file (e.g. (mtime, size) from
+                a catalog); if None the file is stat()ed to detect changes
+
+        Returns:
+            CachedDocument: The current document
+
+        Raises:
+            FileNotFoundError, PermissionError, json.JSONDecodeError: If the file cannot be loaded
+        """
+        with self._lock:
+            document = self._entries.get(path)
+            if document is not None:
+                self._entries.move_to_end(path)
+                if version is not None and document.version == version:
+                    self.stats['hits'] += 1
+                    return document
+                if version is None and time.monotonic() - document.checked_at < self.check_interval:
+                    self.stats['hits'] += 1
+                    return document
+
+        if version is None:
+            stat = os.stat(path)
+            current = (stat.st_mtime_ns, stat.st_size)
+            if document is not None and document.version == current:
+                document.checked_at = time.monotonic()
+                with self._lock:
+                    self.stats['hits'] += 1
+                return document
+
+        with open(path, 'r', encoding='utf-8') as f:
+            if version is None:
+                stat = os.fstat(f.fileno())
+                version = (stat.st_mtime_ns, stat.st_size)
+            data = json.load(f)
+        loaded = CachedDocument(data, version)
+
+        with self._lock:
+            self.stats['reloads' if document is not None else 'misses'] += 1
+            self._entries[path] = loaded
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return loaded
+
+    def invalidate(self, path):
+        """Drop a file from the cache so the next lookup reloads it"""
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def preload(self, paths):
+        """Load files ahead of the first request, logging any that fail"""
+        for path in paths:
+            try:
+                self.get(path)
+            except Exception as e:
+                logger.error(f"Error preloading {path}: {str(e)}")
+
+
+def send_document(document, cache_control='no-cache'):
+    """
+    Build a response for a cached document for the current request
+
+    Answers 304 Not Modified when If-None-Match names any encoding of the
+    document, otherwise sends the smallest precompressed body the client
+    accepts.
+
+    Args:
+        document (CachedDocument): Document to send
+        cache_control (str): Cache-Control header value
+
+    Returns:
+        Response: Flask response
+    """
+    response = current_app.response_class()
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+
+    for etag in document.etags.values():
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+            response.set_etag(etag)
+            _cache.stats['not_modified'] += 1
+            return response
+
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in document.bodies and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    response.set_data(document.bodies[encoding])
+    response.mimetype = 'application/json'
+    response.set_etag(document.etags[encoding])
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+_cache = ContentCache()
+
+
+def get_content_cache():
+    """Get the process-wide content cache"""
+    return _cache
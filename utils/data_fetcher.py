@@ -2,20 +2,54 @@ import pandas as pd
 import numpy as np
 import logging
 from datetime import datetime, timedelta
+from utils.records import BAR_DTYPE, bars_from_frame, bars_to_frame, bars_to_records, epoch_seconds, format_time, index_seconds
 
 logger = logging.getLogger(__name__)
 
+# Cached bars are reused for 1 hour
+CACHE_TTL = timedelta(hours=1)
+
+# Intraday timeframes are resampled locally from one series of minute bars.
+# Daily bars are still fetched directly: minute history for multi-year periods
+# is far larger than the daily series it would be reduced to.
+BASE_TIMEFRAME = '1Min'
+RESAMPLE_RULES = {
+    '1Min': '1min',
+    '5Min': '5min',
+    '15Min': '15min',
+    '1H': '1h'
+}
+
+# Bars returned per request, at every timeframe
+OUTPUT_BAR_LIMIT = 1000
+
+# Minute bars per bar of each intraday timeframe: a timeframe needs
+# OUTPUT_BAR_LIMIT times this many of the most recent minute bars
+BASE_MINUTES = {
+    '1Min': 1,
+    '5Min': 5,
+    '15Min': 15,
+    '1H': 60
+}
+
+# Calendar days spanned by N daily bars is about N * 365 / 250 trading days,
+# plus slack for holidays when converting a warmup in bars to a fetch start
+TRADING_DAYS_PER_YEAR = 250
+WARMUP_SLACK_DAYS = 10
+
 class DataFetcher:
     """Class for fetching market data from Alpaca"""
     
     def __init__(self, api):
         """Initialize with an Alpaca API client"""
         self.api = api
-        self.cache = {}  # Simple cache for historical data
+        self.cache = {}  # Bar arrays per (symbol, timeframe, period)
+        self.base_cache = {}  # Minute bar arrays per (symbol, period), source for intraday timeframes
+        self.stats = {cache: {'hit': 0, 'miss': 0} for cache in ('bars', 'daily', 'base')}  # Lookups per cache
     
     def get_historical_data(self, symbol, timeframe='1D', period='1Y'):
         """
-        Get historical price data for a symbol
+        Get historical price data for a symbol in the format returned by the API routes
         
         Args:
             symbol (str): Trading symbol (e.g., 'AAPL')
@@ -25,18 +59,167 @@ class DataFetcher:
         Returns:
             list: A list of dictionaries containing historical price data
         """
+        return bars_to_records(self.get_historical_bars(symbol, timeframe, period))
+    
+    def get_historical_bars(self, symbol, timeframe='1D', period='1Y'):
+        """
+        Get historical bars for a symbol as a compact array
+        
+        Intraday timeframes are derived locally from a single cached series of
+        minute bars, so switching between them does not hit the API again.
+        
+        Args:
+            symbol (str): Trading symbol (e.g., 'AAPL')
+            timeframe (str): Timeframe for the data ('1D', '1H', '15Min', '5Min', '1Min')
+            period (str): Time period to fetch ('1D', '1W', '1M', '3M', '6M', '1Y', '5Y')
+            
+        Returns:
+            ndarray: Bars as BAR_DTYPE records (shared with the cache, do not modify)
+        """
         # Generate cache key
         cache_key = f"{symbol}_{timeframe}_{period}"
         
         # Return cached data if available and not expired
-        if cache_key in self.cache:
-            cache_time, data = self.cache[cache_key]
-            # Cache for 1 hour
-            if datetime.now() - cache_time < timedelta(hours=1):
-                logger.info(f"Using cached data for {cache_key}")
+        cached = self._get_cached(self.cache, cache_key, 'bars')
+        if cached is not None:
+            logger.info(f"Using cached data for {cache_key}")
+            return cached
+        
+        if timeframe in RESAMPLE_RULES:
+            base = self._get_base_bars(symbol, period, OUTPUT_BAR_LIMIT * BASE_MINUTES[timeframe])
+            if base is not None:
+                bars = self._resample(base, RESAMPLE_RULES[timeframe])[-OUTPUT_BAR_LIMIT:]
+                self.cache[cache_key] = (datetime.now(), bars)
+                return bars
+        else:
+            start, end = self._period_range(period)
+            bars = self._fetch_bars(symbol, '1Day', start, end, limit=OUTPUT_BAR_LIMIT)
+            if bars is not None:
+                self.cache[cache_key] = (datetime.now(), bars)
+                return bars
+        
+        # Fall back to sample data if the API call fails
+        logger.warning(f"Falling back to sample data for {symbol}")
+        sample_data = self._get_sample_data(symbol)
+        
+        # Cache the sample data too
+        self.cache[cache_key] = (datetime.now(), sample_data)
+        
+        return sample_data
+    
+    def get_daily_bars(self, symbol, start_date, end_date, warmup_bars=0):
+        """
+        Get daily bars for a date range plus a number of bars before it
+        
+        Only the calendar span needed for the range and its warmup is fetched,
+        and the result is trimmed to exactly warmup_bars bars before start_date
+        (fewer if the history does not go back that far).
+        
+        Args:
+            symbol (str): Trading symbol (e.g., 'AAPL')
+            start_date (str): First date of the range (YYYY-MM-DD)
+            end_date (str): Last date of the range (YYYY-MM-DD)
+            warmup_bars (int): Bars needed before start_date
+            
+        Returns:
+            ndarray: Bars as BAR_DTYPE records (a view of the cache, do not modify)
+        """
+        start = pd.Timestamp(start_date)
+        padding = int(warmup_bars * 365 / TRADING_DAYS_PER_YEAR) + WARMUP_SLACK_DAYS if warmup_bars else 0
+        fetch_start = (start - timedelta(days=padding)).strftime('%Y-%m-%d')
+        
+        cache_key = f"{symbol}_1D_{fetch_start}_{end_date}"
+        bars = self._get_cached(self.cache, cache_key, 'daily')
+        if bars is None:
+            days = (pd.Timestamp(end_date) - pd.Timestamp(fetch_start)).days + 1
+            bars = self._fetch_bars(symbol, '1Day', fetch_start, end_date, limit=max(days, 1))
+            if bars is None:
+                logger.warning(f"Falling back to sample data for {symbol}")
+                sample = self._get_sample_data(symbol)
+                in_range = (sample['time'] >= epoch_seconds(fetch_start)) & (sample['time'] <= epoch_seconds(end_date))
+                bars = sample[in_range]
+            self.cache[cache_key] = (datetime.now(), bars)
+        
+        # Keep only the last warmup_bars bars before the range
+        first = int(np.searchsorted(bars['time'], epoch_seconds(start)))
+        return bars[max(first - warmup_bars, 0):]
+    
+    def _get_cached(self, cache, cache_key, name, usable=None):
+        """
+        Return a cached value if present, younger than CACHE_TTL and accepted by
+        usable (if given), counting the lookup under name
+        """
+        if cache_key in cache:
+            cache_time, data = cache[cache_key]
+            if datetime.now() - cache_time < CACHE_TTL and (usable is None or usable(data)):
+                self.stats[name]['hit'] += 1
                 return data
+        self.stats[name]['miss'] += 1
+        return None
+    
+    def cache_stats(self):
+        """Get the hit and miss counts of each cache"""
+        return {name: dict(counts) for name, counts in self.stats.items()}
+    
+    def _get_base_bars(self, symbol, period, count):
+        """
+        Get the most recent minute bars of a period, fetching them at most once per TTL
+        
+        A cached series is reused by any timeframe needing no more bars than it
+        holds; a coarser timeframe replaces it with a longer one.
         
-        # Calculate start and end dates based on period
+        Args:
+            symbol (str): Trading symbol
+            period (str): Time period to fetch
+            count (int): Minute bars needed, counted back from the end of the period
+            
+        Returns:
+            ndarray: Minute bars as BAR_DTYPE records, or None if the fetch failed
+        """
+        base_key = f"{symbol}_{BASE_TIMEFRAME}_{period}"
+        cached = self._get_cached(self.base_cache, base_key, 'base', lambda entry: entry[0] >= count)
+        if cached is not None:
+            logger.info(f"Using cached base bars for {base_key}")
+            return cached[1][-count:]
+        
+        start, end = self._period_range(period)
+        base = self._fetch_bars(symbol, BASE_TIMEFRAME, start, end, limit=count, latest=True)
+        if base is not None:
+            self.base_cache[base_key] = (datetime.now(), (count, base))
+        return base
+    
+    def _resample(self, bars, rule):
+        """
+        Aggregate OHLCV bars into a coarser timeframe
+        
+        Args:
+            bars (ndarray): Bars as BAR_DTYPE records
+            rule (str): Pandas offset alias for the target timeframe
+            
+        Returns:
+            ndarray: Resampled bars with empty intervals dropped
+        """
+        if rule == '1min':
+            return bars
+        resampled = bars_to_frame(bars).resample(rule, label='left', closed='left').agg({
+            'open': 'first',
+            'high': 'max',
+            'low': 'min',
+            'close': 'last',
+            'volume': 'sum'
+        })
+        return bars_from_frame(resampled.dropna(subset=['open']))
+    
+    def _period_range(self, period):
+        """
+        Calculate start and end dates for a period
+        
+        Args:
+            period (str): Time period ('1D', '1W', '1M', '3M', '6M', '1Y', '2Y', '5Y')
+            
+        Returns:
+            tuple: (start, end) formatted as YYYY-MM-DD strings
+        """
         end_date = datetime.now()
         
         if period == '1D':
@@ -57,88 +240,72 @@ class DataFetcher:
             start_date = end_date - timedelta(days=365 * 5)
         
         # Format dates for API call
-        start = start_date.strftime('%Y-%m-%d')
-        end = end_date.strftime('%Y-%m-%d')
-        
-        # Map timeframe to Alpaca format
-        timeframe_map = {
-            '1Min': '1Min',
-            '5Min': '5Min',
-            '15Min': '15Min',
-            '1H': '1Hour',
-            '1D': '1Day'
-        }
-        alpaca_timeframe = timeframe_map.get(timeframe, '1Day')
+        return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+    
+    def _fetch_bars(self, symbol, alpaca_timeframe, start, end, limit=1000, latest=False):
+        """
+        Fetch bars from Alpaca
         
+        Args:
+            symbol (str): Trading symbol
+            alpaca_timeframe (str): Alpaca timeframe ('1Min', '1Day', ...)
+            start (str): Start date (YYYY-MM-DD)
+            end (str): End date (YYYY-MM-DD)
+            limit (int): Maximum number of bars to fetch
+            latest (bool): Apply the limit from the end of the range instead of its start
+            
+        Returns:
+            ndarray: Bars as BAR_DTYPE records, or None if the fetch failed
+        """
         logger.info(f"Fetching {symbol} data from {start} to {end} with timeframe {alpaca_timeframe}")
         
-        # Get data from Alpaca
         try:
             # Try using the newer bars API first
             try:
-                bars = self.api.get_bars(
-                    symbol=symbol,
-                    timeframe=alpaca_timeframe,
-                    start=start,
-                    end=end,
-                    limit=1000
-                )
-                
-                data = []
-                for bar in bars:
-                    data.append({
-                        'time': bar.t.strftime('%Y-%m-%d %H:%M:%S'),
-                        'open': bar.o,
-                        'high': bar.h,
-                        'low': bar.l,
-                        'close': bar.c,
-                        'volume': bar.v
-                    })
-                
-                # Cache the results
-                self.cache[cache_key] = (datetime.now(), data)
-                
-                return data
-                
+                if latest:
+                    # sort was added to the SDK in alpaca-trade-api 3.1.0
+                    bars = self.api.get_bars(
+                        symbol=symbol,
+                        timeframe=alpaca_timeframe,
+                        start=start,
+                        end=end,
+                        limit=limit,
+                        sort='desc'
+                    )[::-1]
+                else:
+                    bars = self.api.get_bars(
+                        symbol=symbol,
+                        timeframe=alpaca_timeframe,
+                        start=start,
+                        end=end,
+                        limit=limit
+                    )
             except AttributeError:
                 # Fall back to older barset API
-                bars = self.api.get_barset(
+                barset = self.api.get_barset(
                     symbols=symbol,
-                    timeframe=timeframe,
+                    timeframe=alpaca_timeframe,
                     start=start,
                     end=end,
-                    limit=1000
+                    limit=limit
                 )
-                
-                # Convert to list of dictionaries
-                if symbol in bars:
-                    data = []
-                    for bar in bars[symbol]:
-                        data.append({
-                            'time': bar.t.strftime('%Y-%m-%d %H:%M:%S'),
-                            'open': bar.o,
-                            'high': bar.h,
-                            'low': bar.l,
-                            'close': bar.c,
-                            'volume': bar.v
-                        })
-                    
-                    # Cache the results
-                    self.cache[cache_key] = (datetime.now(), data)
-                    
-                    return data
+                if symbol not in barset:
+                    return None
+                bars = barset[symbol]
+            
+            data = np.empty(len(bars), dtype=BAR_DTYPE)
+            data['time'] = index_seconds(pd.DatetimeIndex([bar.t for bar in bars]))
+            data['open'] = [bar.o for bar in bars]
+            data['high'] = [bar.h for bar in bars]
+            data['low'] = [bar.l for bar in bars]
+            data['close'] = [bar.c for bar in bars]
+            data['volume'] = [bar.v for bar in bars]
+            return data
         
         except Exception as e:
             logger.error(f"Error fetching data for {symbol}: {str(e)}")
         
-        # Fall back to sample data if the API call fails
-        logger.warning(f"Falling back to sample data for {symbol}")
-        sample_data = self._get_sample_data(symbol)
-        
-        # Cache the sample data too
-        self.cache[cache_key] = (datetime.now(), sample_data)
-        
-        return sample_data
+        return None
     
     def get_real_time_quote(self, symbol):
         """
@@ -160,7 +327,8 @@ class DataFetcher:
                     'ask': quote.ap,
                     'bid': quote.bp,
                     'timestamp': quote.t.strftime('%Y-%m-%d %H:%M:%S'),
-                    'size': quote.s
+                    # v2 quotes carry separate ask/bid sizes ('as'/'bs'), not one size
+                    'size': getattr(quote, 'as', None)
                 }
             except AttributeError:
                 # Fall back to bars for paper trading
@@ -179,8 +347,108 @@ class DataFetcher:
         # Return None if we couldn't get the data
         return None
     
+    def get_real_time_quotes(self, symbols, batch_size=500):
+        """
+        Get real-time quotes for many symbols with one request per batch
+        
+        Args:
+            symbols (list): Trading symbols
+            batch_size (int): Maximum number of symbols per request
+            
+        Returns:
+            dict: Quote dictionaries keyed by symbol; symbols without quotes are omitted
+        """
+        quotes = {}
+        for i in range(0, len(symbols), batch_size):
+            batch = symbols[i:i + batch_size]
+            try:
+                for symbol, quote in self.api.get_latest_quotes(batch).items():
+                    # Use the midpoint when both sides are quoted, otherwise whichever side is
+                    if quote.ap and quote.bp:
+                        price = (quote.ap + quote.bp) / 2
+                    else:
+                        price = quote.ap or quote.bp
+                    quotes[symbol] = {
+                        'symbol': symbol,
+                        'price': price,
+                        'ask': quote.ap,
+                        'bid': quote.bp,
+                        'timestamp': quote.t.strftime('%Y-%m-%d %H:%M:%S')
+                    }
+            except Exception as e:
+                logger.error(f"Error fetching quotes for {len(batch)} symbols: {str(e)}")
+        return quotes
+    
+    def get_latest_bars(self, symbols, batch_size=500):
+        """
+        Get the most recent minute bar for many symbols with one request per batch
+        
+        Args:
+            symbols (list): Trading symbols
+            batch_size (int): Maximum number of symbols per request
+            
+        Returns:
+            dict: Bar dictionaries keyed by symbol; symbols without data are omitted
+        """
+        latest = {}
+        for i in range(0, len(symbols), batch_size):
+            batch = symbols[i:i + batch_size]
+            try:
+                for symbol, bar in self.api.get_latest_bars(batch).items():
+                    latest[symbol] = {
+                        'time': format_time(epoch_seconds(bar.t)),
+                        'open': bar.o,
+                        'high': bar.h,
+                        'low': bar.l,
+                        'close': bar.c,
+                        'volume': bar.v
+                    }
+            except Exception as e:
+                logger.error(f"Error fetching latest bars for {len(batch)} symbols: {str(e)}")
+        return latest
+    
+    def get_bars_bulk(self, symbols, start, end, timeframe='1Day', batch_size=200):
+        """
+        Get bars for many symbols with one paged multi-symbol request per batch
+        
+        Args:
+            symbols (list): Trading symbols
+            start (str): Start date (YYYY-MM-DD)
+            end (str): End date (YYYY-MM-DD)
+            timeframe (str): Alpaca timeframe ('1Day', '1Min', ...)
+            batch_size (int): Maximum number of symbols per request
+            
+        Returns:
+            dict: Bars as BAR_DTYPE records keyed by symbol; symbols without bars (or whose batch failed) are omitted
+        """
+        result = {}
+        for i in range(0, len(symbols), batch_size):
+            batch = symbols[i:i + batch_size]
+            try:
+                # Raw dicts: wrapping millions of bars in entities costs more than the request
+                bars = list(self.api.get_bars_iter(batch, timeframe, start=start, end=end, raw=True))
+            except Exception as e:
+                logger.error(f"Error fetching bars for {len(batch)} symbols: {str(e)}")
+                continue
+            if not bars:
+                continue
+            
+            names = np.array([bar['S'] for bar in bars])
+            data = np.empty(len(bars), dtype=BAR_DTYPE)
+            data['time'] = index_seconds(pd.DatetimeIndex([bar['t'] for bar in bars]))
+            for field, key in (('open', 'o'), ('high', 'h'), ('low', 'l'), ('close', 'c'), ('volume', 'v')):
+                data[field] = [bar[key] for bar in bars]
+            
+            # Split into one time-ordered array per symbol
+            order = np.lexsort((data['time'], names))
+            names, data = names[order], data[order]
+            starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+            for begin, stop in zip(starts, np.r_[starts[1:], len(names)]):
+                result[str(names[begin])] = data[begin:stop]
+        return result
+    
     def _get_sample_data(self, symbol):
-        """Generate sample data for testing when API is unavailable"""
+        """Generate sample bars (BAR_DTYPE records) for testing when API is unavailable"""
         # Create a date range for the past year
         end_date = datetime.now()
         start_date = end_date - timedelta(days=365)
@@ -194,7 +462,8 @@ class DataFetcher:
         base_price = 100.0 + (seed % 400)  # Different base price per symbol
         volatility = 0.01 + (seed % 100) * 0.0001  # Different volatility per symbol
         
-        data = []
+        data = np.empty(len(dates), dtype=BAR_DTYPE)
+        data['time'] = index_seconds(dates.normalize())
         current_price = base_price
         
         # Generate an uptrend, downtrend, or sideways pattern
@@ -206,7 +475,7 @@ class DataFetcher:
         else:
             drift = 0.0
         
-        for date in dates:
+        for i in range(len(dates)):
             # Random daily volatility with drift
             price_change = np.random.normal(drift, volatility) * current_price
             current_price = max(current_price + price_change, 1.0)  # Ensure price doesn't go below 1
@@ -226,13 +495,7 @@ class DataFetcher:
             # Random volume
             volume = int(np.random.randint(100000, 10000000))
             
-            data.append({
-                'time': date.strftime('%Y-%m-%d'),
-                'open': round(open_price, 2),
-                'high': round(high_price, 2),
-                'low': round(low_price, 2),
-                'close': round(close_price, 2),
-                'volume': volume
-            })
+            data[i] = (data['time'][i], round(open_price, 2), round(high_price, 2),
+                       round(low_price, 2), round(close_price, 2), volume)
         
         return data
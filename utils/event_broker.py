@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import logging
+import threading
+from collections import defaultdict
+from utils import storage
+
+logger = logging.getLogger(__name__)
+
+# Seconds of silence after which a stream sends a comment to keep proxies and
+# the client's connection alive (and to notice clients that went away)
+HEARTBEAT_INTERVAL = 15
+
+# Streams are closed after this many seconds so server threads are recycled;
+# EventSource reconnects on its own and resumes from Last-Event-ID
+STREAM_LIFETIME = 300
+
+# Milliseconds clients wait before reconnecting
+RECONNECT_DELAY_MS = 3000
+
+# Seconds between market clock refreshes, and between portfolio change checks
+MARKET_INTERVAL = 60
+PORTFOLIO_INTERVAL = 1.0
+
+# The clock is polled by one process at a time and shared with the others
+CLOCK_LEASE = 'market-clock'
+CLOCK_STATE = 'market-clock'
+
+# Events buffered per subscriber; a subscriber that falls this far behind is
+# disconnected and resynchronizes when it reconnects
+SUBSCRIBER_QUEUE_SIZE = 100
+
+MARKET_TOPIC = 'market'
+PORTFOLIO_PREFIX = 'portfolio:'
+
+
+def portfolio_topic(email):
+    """Get the topic a user's portfolio changes are published on"""
+    return f"{PORTFOLIO_PREFIX}{email}"
+
+
+def format_event(event, data, event_id=None):
+    """
+    Serialize one event in the text/event-stream format
+
+    Args:
+        event (str): Event name
+        data: JSON-serializable payload
+        event_id: Id the client echoes back in Last-Event-ID, or None to leave it unchanged
+
+    Returns:
+        str: Event block terminated by a blank line
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """One client's stream of events for a set of topics"""
+
+    def __init__(self, topics, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.closed = False
+        self.unsubscribed = False
+
+    def push(self, message):
+        """Queue a formatted event, closing the subscription if the client has fallen behind"""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe hub behind the /api/events stream
+
+    Publishers fan each event out to the subscribers of its topic, so one
+    upstream refresh serves every open tab in this process. Events can be
+    retained per topic so new subscribers start from the current state.
+    """
+
+    def __init__(self, max_streams=None):
+        """
+        Initialize the broker
+
+        Args:
+            max_streams (int): Maximum concurrent subscriptions (each holds a server thread)
+        """
+        self.max_streams = max_streams or int(os.getenv('SSE_MAX_STREAMS', 64))
+        self.stats = {'published': 0, 'delivered': 0, 'dropped': 0, 'rejected': 0, 'streams': 0}
+        self._subscribers = defaultdict(set)
+        self._retained = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def subscribe(self, topics):
+        """
+        Register a subscription
+
+        Args:
+            topics (iterable): Topic names
+
+        Returns:
+            Subscription: The new subscription, or None if the process is at its stream limit
+        """
+        subscription = Subscription(topics)
+        with self._lock:
+            if self._count >= self.max_streams:
+                self.stats['rejected'] += 1
+                return None
+            self._count += 1
+            self.stats['streams'] = self._count
+            for topic in subscription.topics:
+                self._subscribers[topic].add(subscription)
+        # Let the market watcher refresh now rather than after a full interval
+        self._wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription from every topic"""
+        with self._lock:
+            if subscription.unsubscribed:
+                return
+            subscription.unsubscribed = True
+            self._count -= 1
+            self.stats['streams'] = self._count
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic, event, data, event_id=None, retain=False):
+        """
+        Send an event to every subscriber of a topic
+
+        Args:
+            topic (str): Topic name
+            event (str): Event name
+            data: JSON-serializable payload
+            event_id: Event id (see format_event)
+            retain (bool): Keep the event as the topic's current state for new subscribers
+
+        Returns:
+            int: Number of subscribers the event was delivered to
+        """
+        message = format_event(event, data, event_id)
+        with self._lock:
+            if retain:
+                self._retained[topic] = message
+            subscribers = list(self._subscribers.get(topic, ()))
+            self.stats['published'] += 1
+        delivered = 0
+        for subscription in subscribers:
+            if subscription.push(message):
+                delivered += 1
+            else:
+                self.stats['dropped'] += 1
+        self.stats['delivered'] += delivered
+        return delivered
+
+    def retained(self, topic):
+        """Get the retained event of a topic, already formatted, or None"""
+        return self._retained.get(topic)
+
+    def active_topics(self, prefix=''):
+        """Get the topics that currently have subscribers"""
+        with self._lock:
+            return [topic for topic in self._subscribers if topic.startswith(prefix)]
+
+    def wait(self, timeout):
+        """Sleep until the timeout passes or a new subscription arrives"""
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def stream(self, subscription, initial=(), heartbeat=HEARTBEAT_INTERVAL, lifetime=STREAM_LIFETIME):
+        """
+        Generate the text/event-stream body for a subscription
+
+        Args:
+            subscription (Subscription): Subscription to drain
+            initial (iterable): Formatted events to send first (e.g. current state)
+            heartbeat (float): Seconds of silence before a keepalive comment
+            lifetime (float): Seconds before the stream ends and the client reconnects
+
+        Yields:
+            str: Chunks of the response body
+        """
+        try:
+            yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+            for message in initial:
+                yield message
+            deadline = time.monotonic() + lifetime
+            while not subscription.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    yield subscription.queue.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+def _market_payload(clock):
+    return {
+        'is_open': clock.is_open,
+        'next_open': clock.next_open.isoformat(),
+        'next_close': clock.next_close.isoformat()
+    }
+
+
+def _shared_market(get_clock, interval, owner):
+    """
+    Get the market clock payload, polling Alpaca only if no process has within interval
+
+    The poll is made by the holder of the clock lease, which expires after
+    one interval, so it moves to another process once its holder has no
+    subscribers left.
+
+    Returns:
+        dict: Market payload, or None if no process has polled the clock yet
+    """
+    shared = storage.get_shared_state(CLOCK_STATE)
+    if shared is not None and time.time() - shared[1] < interval:
+        return shared[0]
+    if storage.acquire_lease(CLOCK_LEASE, owner, interval):
+        payload = _market_payload(get_clock())
+        storage.save_shared_state(CLOCK_STATE, payload)
+        return payload
+    return shared[0] if shared is not None else None
+
+
+def _watch_market(broker, get_clock, interval, owner):
+    """Refresh the market clock once per interval for all subscribers and publish changes"""
+    last = None
+    while True:
+        if broker.active_topics(MARKET_TOPIC):
+            try:
+                payload = _shared_market(get_clock, interval, owner)
+                if payload is not None and payload != last:
+                    broker.publish(MARKET_TOPIC, 'market', payload, retain=True)
+                    last = payload
+            except Exception as e:
+                logger.error(f"Error refreshing market status: {str(e)}")
+            time.sleep(interval)
+        else:
+            broker.wait(interval)
+
+
+def _watch_portfolios(broker, interval):
+    """
+    Publish a change event whenever a subscribed user's portfolio version moves
+
+    A single MAX(seq) query per interval detects that some portfolio changed;
+    only then are the subscribed users' versions read. Event ids are portfolio
+    versions, which are global, so Last-Event-ID stays meaningful when a
+    client reconnects to a different worker.
+    """
+    latest = None
+    known = {}
+    while True:
+        topics = broker.active_topics(PORTFOLIO_PREFIX)
+        if not topics:
+            known.clear()
+            time.sleep(interval)
+            continue
+        try:
+            emails = [topic[len(PORTFOLIO_PREFIX):] for topic in topics]
+            current = storage.get_latest_seq()
+            if current != latest or any(email not in known for email in emails):
+                versions = storage.get_journal_seqs(emails)
+                for email, version in versions.items():
+                    if email in known and version != known[email]:
+                        broker.publish(portfolio_topic(email), 'portfolio', {'version': version}, event_id=version)
+                known = versions
+                latest = current
+        except Exception as e:
+            logger.error(f"Error checking portfolio changes: {str(e)}")
+        time.sleep(interval)
+
+
+_broker = EventBroker()
+_watcher_pid = None
+_watcher_lock = threading.Lock()
+
+
+def get_broker():
+    """Get the process-wide event broker"""
+    return _broker
+
+
+def start_watchers(get_clock, market_interval=MARKET_INTERVAL, portfolio_interval=PORTFOLIO_INTERVAL):
+    """
+    Start the upstream refreshers that feed the broker, once per process
+
+    Each process publishes to its own subscribers, but the clock itself is
+    polled by one process for all of them (see _shared_market).
+
+    Args:
+        get_clock (callable): Returns the Alpaca market clock
+        market_interval (float): Seconds between clock refreshes
+        portfolio_interval (float): Seconds between portfolio change checks
+    """
+    global _watcher_pid
+    with _watcher_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    threading.Thread(target=_watch_market, args=(_broker, get_clock, market_interval, owner),
+                     name='events-market', daemon=True).start()
+    threading.Thread(target=_watch_portfolios, args=(_broker, portfolio_interval),
+                     name='events-portfolio', daemon=True).start()
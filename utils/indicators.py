@@ -0,0 +1,663 @@
+import logging
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Bars of history per period an exponential average is warmed up with; with
+# alpha = 2 / (period + 1) the seed value's weight has decayed below 1% after
+# 3 * period bars
+EMA_WARMUP_FACTOR = 3
+
+# The same for Wilder smoothing (alpha = 1 / period), which decays slower: the
+# seed weight is about exp(-k) after k * period bars, so below 1% needs k >= 4.6
+WILDER_WARMUP_FACTOR = 5
+
+# Indicator implementations keyed by type name
+INDICATORS = {}
+
+
+def register_indicator(cls):
+    """
+    Class decorator adding an indicator type to the registry
+
+    Args:
+        cls: Indicator subclass with a unique name
+    """
+    INDICATORS[cls.name] = cls()
+    return cls
+
+
+class Indicator:
+    """
+    Base class for technical indicators
+
+    Subclasses declare their parameters with defaults and how many bars of
+    history they need before their first valid value, so the backtester can
+    fetch exactly enough warmup data and start trading as soon as every
+    indicator is valid.
+    """
+
+    name = None
+    parameters = {}
+
+    def resolve(self, params):
+        """Merge configured parameters over the defaults"""
+        resolved = dict(self.parameters)
+        resolved.update({key: value for key, value in (params or {}).items() if value is not None})
+        return resolved
+
+    def lookback(self, params):
+        """
+        Number of bars before the first valid value
+
+        Args:
+            params (dict): Resolved parameters
+
+        Returns:
+            int: Bars of history needed
+        """
+        raise NotImplementedError
+
+    def is_valid(self, params):
+        """Check that resolved parameters make sense together (e.g. for the optimizer)"""
+        return True
+
+    def compute(self, bars, params):
+        """
+        Calculate the indicator
+
+        Args:
+            bars (DataFrame): Bars with open, high, low, close and volume columns
+            params (dict): Resolved parameters
+
+        Returns:
+            dict: Column name -> values aligned with bars
+        """
+        raise NotImplementedError
+
+    def compute_many(self, bars, params):
+        """
+        Calculate the indicator for many symbols at once
+
+        The array kernels below work on any shape with time along the last
+        axis, so by default this is compute itself; indicators computed with
+        pandas Series override it.
+
+        Args:
+            bars (dict): Column name -> 2D array of symbols x bars, oldest bar first
+            params (dict): Resolved parameters
+
+        Returns:
+            dict: Column name -> 2D array aligned with bars
+        """
+        return self.compute(bars, params)
+
+    def update(self, bars, params, previous):
+        """
+        Calculate the values at the newest bar of a live feed
+
+        The default recomputes over the trailing lookback + 1 bars, which is
+        exact for windowed indicators; recursive indicators override it to
+        carry their previous values forward in constant time.
+
+        Args:
+            bars (dict): Recent bars as column name -> array, oldest first, ending with the new bar
+            params (dict): Resolved parameters
+            previous (dict): Column name -> value at the bar before, or None for the first bar
+
+        Returns:
+            dict: Column name -> value at the new bar
+        """
+        size = self.lookback(params) + 1
+        window = pd.DataFrame({column: values[-size:] for column, values in bars.items()})
+        return {column: float(np.asarray(values, dtype=float)[-1])
+                for column, values in self.compute(window, params).items()}
+
+
+def _ewm_step(previous, value, alpha):
+    """Advance an exponential average (adjust=False) by one value, seeding it with the first"""
+    if previous is None or np.isnan(previous):
+        return value
+    if np.isnan(value):
+        return previous
+    return previous + alpha * (value - previous)
+
+
+def _last(bars, column, offset=1):
+    """Get a bar column's value `offset` bars from the end (NaN if there are too few bars)"""
+    values = bars[column]
+    return float(values[-offset]) if len(values) >= offset else np.nan
+
+
+@register_indicator
+class SMA(Indicator):
+    """Simple moving average"""
+
+    name = 'SMA'
+    parameters = {'period': 20, 'price': 'close'}
+
+    def lookback(self, params):
+        return int(params['period']) - 1
+
+    def compute(self, bars, params):
+        period = int(params['period'])
+        return {f'SMA_{period}': bars[params['price']].rolling(window=period).mean()}
+
+    def compute_many(self, bars, params):
+        period = int(params['period'])
+        return {f'SMA_{period}': _rolling_mean(_values(bars, params['price']), period)}
+
+    def update(self, bars, params, previous):
+        period = int(params['period'])
+        price = np.asarray(bars[params['price']][-period:], dtype=float)
+        return {f'SMA_{period}': float(price.mean()) if len(price) == period else np.nan}
+
+
+@register_indicator
+class EMA(Indicator):
+    """Exponential moving average"""
+
+    name = 'EMA'
+    parameters = {'period': 20, 'price': 'close'}
+
+    def lookback(self, params):
+        return EMA_WARMUP_FACTOR * int(params['period'])
+
+    def compute(self, bars, params):
+        period = int(params['period'])
+        return {f'EMA_{period}': bars[params['price']].ewm(span=period, adjust=False).mean()}
+
+    def compute_many(self, bars, params):
+        period = int(params['period'])
+        return {f'EMA_{period}': _ewm_mean(_values(bars, params['price']), 2.0 / (period + 1))}
+
+    def update(self, bars, params, previous):
+        period = int(params['period'])
+        column = f'EMA_{period}'
+        return {column: _ewm_step((previous or {}).get(column), _last(bars, params['price']), 2.0 / (period + 1))}
+
+
+@register_indicator
+class RSI(Indicator):
+    """Relative strength index over simple averages of gains and losses"""
+
+    name = 'RSI'
+    parameters = {'period': 14, 'price': 'close'}
+
+    def lookback(self, params):
+        return int(params['period'])
+
+    def compute(self, bars, params):
+        period = int(params['period'])
+        delta = bars[params['price']].diff()
+        gain = delta.where(delta > 0, 0).rolling(window=period).mean()
+        loss = -delta.where(delta < 0, 0).rolling(window=period).mean()
+
+        # Avoid division by zero
+        loss = loss.replace(0, np.nan)
+        rs = gain / loss
+        rs = rs.fillna(0)
+
+        rsi = 100 - (100 / (1 + rs))
+        # Undefined until period changes have been seen, rather than an oversold 0
+        rsi[bars[params['price']].notna().cumsum() <= period] = np.nan
+        return {f'RSI_{period}': rsi}
+
+    def compute_many(self, bars, params):
+        period = int(params['period'])
+        price = _values(bars, params['price'])
+        # As in compute, missing changes count as zero and a zero average loss gives 0
+        delta = np.nan_to_num(price - _previous(price))
+        gain = _rolling_mean(np.where(delta > 0, delta, 0.0), period)
+        loss = _rolling_mean(np.where(delta < 0, -delta, 0.0), period)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rs = np.nan_to_num(np.where(loss > 0, gain / loss, 0.0))
+        # Rows are NaN-padded at the front, so count each row's own history
+        history = np.cumsum(~np.isnan(price), axis=-1)
+        return {f'RSI_{period}': np.where(history <= period, np.nan, 100 - (100 / (1 + rs)))}
+
+    def update(self, bars, params, previous):
+        period = int(params['period'])
+        # As in compute, the first bar's change and missing changes count as zero
+        price = np.asarray(bars[params['price']][-(period + 1):], dtype=float)
+        delta = np.nan_to_num(np.diff(price, prepend=np.nan))[-period:]
+        if len(price) <= period:
+            # Not enough history yet: undefined as in compute, not an oversold 0
+            return {f'RSI_{period}': np.nan}
+        gain = np.where(delta > 0, delta, 0).mean()
+        loss = -np.where(delta < 0, delta, 0).mean()
+        rs = gain / loss if loss != 0 else 0.0
+        return {f'RSI_{period}': 100 - (100 / (1 + rs))}
+
+
+@register_indicator
+class MACD(Indicator):
+    """Moving average convergence/divergence with signal line and histogram"""
+
+    name = 'MACD'
+    parameters = {'fast_period': 12, 'slow_period': 26, 'signal_period': 9, 'price': 'close'}
+
+    def lookback(self, params):
+        slowest = max(int(params['fast_period']), int(params['slow_period']))
+        return EMA_WARMUP_FACTOR * (slowest + int(params['signal_period']))
+
+    def is_valid(self, params):
+        return int(params['fast_period']) < int(params['slow_period'])
+
+    def compute(self, bars, params):
+        fast_period = int(params['fast_period'])
+        slow_period = int(params['slow_period'])
+        signal_period = int(params['signal_period'])
+        price = bars[params['price']]
+
+        fast = price.ewm(span=fast_period, adjust=False).mean()
+        slow = price.ewm(span=slow_period, adjust=False).mean()
+        macd = fast - slow
+        signal = macd.ewm(span=signal_period, adjust=False).mean()
+        return {
+            f'EMA_{fast_period}': fast,
+            f'EMA_{slow_period}': slow,
+            'MACD': macd,
+            'MACD_Signal': signal,
+            'MACD_Hist': macd - signal
+        }
+
+    def compute_many(self, bars, params):
+        fast_period = int(params['fast_period'])
+        slow_period = int(params['slow_period'])
+        signal_period = int(params['signal_period'])
+        price = _values(bars, params['price'])
+
+        fast = _ewm_mean(price, 2.0 / (fast_period + 1))
+        slow = _ewm_mean(price, 2.0 / (slow_period + 1))
+        macd = fast - slow
+        signal = _ewm_mean(macd, 2.0 / (signal_period + 1))
+        return {
+            f'EMA_{fast_period}': fast,
+            f'EMA_{slow_period}': slow,
+            'MACD': macd,
+            'MACD_Signal': signal,
+            'MACD_Hist': macd - signal
+        }
+
+    def update(self, bars, params, previous):
+        fast_period = int(params['fast_period'])
+        slow_period = int(params['slow_period'])
+        signal_period = int(params['signal_period'])
+        previous = previous or {}
+        price = _last(bars, params['price'])
+
+        fast = _ewm_step(previous.get(f'EMA_{fast_period}'), price, 2.0 / (fast_period + 1))
+        slow = _ewm_step(previous.get(f'EMA_{slow_period}'), price, 2.0 / (slow_period + 1))
+        macd = fast - slow
+        signal = _ewm_step(previous.get('MACD_Signal'), macd, 2.0 / (signal_period + 1))
+        return {
+            f'EMA_{fast_period}': fast,
+            f'EMA_{slow_period}': slow,
+            'MACD': macd,
+            'MACD_Signal': signal,
+            'MACD_Hist': macd - signal
+        }
+
+
+# --- Windowed kernels ---
+#
+# All kernels take arrays with time along the last axis, return arrays of the
+# same shape aligned to the window's last bar (NaN until a full window is
+# available) and run in O(n) whatever the window length.
+
+
+def _values(bars, column):
+    """Get a bar column as a float array"""
+    return np.asarray(bars[column], dtype=float)
+
+
+def _rolling_sum(x, window):
+    """
+    Sum over a trailing window; windows containing a NaN are NaN
+
+    Like the extremes below, sums are built from prefix and suffix sums within
+    blocks of the window length rather than one running total, so rounding
+    error stays proportional to the window instead of growing with the series.
+    """
+    n = x.shape[-1]
+    out = np.full(x.shape, np.nan)
+    if window < 1 or window > n:
+        return out
+    valid = ~np.isnan(x)
+    prefix, suffix = _block_scans(np.where(valid, x, 0.0), window, np.add, 0.0)
+    # A window starting on a block boundary is exactly that block's suffix
+    aligned = (np.arange(n - window + 1) % window) == 0
+    sums = suffix[..., :n - window + 1] + np.where(aligned, 0.0, prefix[..., window - 1:n])
+
+    counts = np.cumsum(valid, axis=-1)
+    counts = counts[..., window - 1:] - np.concatenate([np.zeros(x.shape[:-1] + (1,), dtype=counts.dtype),
+                                                        counts[..., :n - window]], axis=-1)
+    out[..., window - 1:] = np.where(counts == window, sums, np.nan)
+    return out
+
+
+def _block_scans(x, window, ufunc, fill):
+    """
+    Prefix and suffix scans of x within consecutive blocks of the window length
+
+    Returns:
+        tuple: (prefix, suffix) arrays with x's shape
+    """
+    n = x.shape[-1]
+    blocks = -(-n // window)
+    pad = [(0, 0)] * (x.ndim - 1) + [(0, blocks * window - n)]
+    padded = np.pad(x, pad, constant_values=fill).reshape(x.shape[:-1] + (blocks, window))
+    prefix = ufunc.accumulate(padded, axis=-1).reshape(x.shape[:-1] + (-1,))[..., :n]
+    suffix = np.flip(ufunc.accumulate(np.flip(padded, axis=-1), axis=-1), axis=-1).reshape(x.shape[:-1] + (-1,))[..., :n]
+    return prefix, suffix
+
+
+def _rolling_mean(x, window):
+    """Mean over a trailing window"""
+    return _rolling_sum(x, window) / window
+
+
+def _rolling_std(x, window):
+    """Population standard deviation over a trailing window"""
+    # Centre on the first valid value so the sums of squares do not cancel catastrophically
+    centred = x - np.nan_to_num(x[..., :1])
+    mean = _rolling_mean(centred, window)
+    variance = _rolling_mean(centred * centred, window) - mean * mean
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def _rolling_extreme(x, window, ufunc, fill):
+    """
+    Rolling max or min with the van Herk/Gil-Werman block algorithm
+
+    The series is cut into blocks of the window length; every window spans at
+    most two blocks, so its extreme combines one suffix scan value and one
+    prefix scan value, making the cost a few passes over the data for any
+    window length.
+    """
+    n = x.shape[-1]
+    out = np.full(x.shape, np.nan)
+    if window < 1 or window > n:
+        return out
+    prefix, suffix = _block_scans(x, window, ufunc, fill)
+    # The window ending at bar j starts at i = j - window + 1
+    out[..., window - 1:] = ufunc(suffix[..., :n - window + 1], prefix[..., window - 1:n])
+    # Match the other kernels: windows containing a NaN have no value
+    return np.where(np.isnan(_rolling_sum(x, window)), np.nan, out)
+
+
+def _rolling_max(x, window):
+    """Maximum over a trailing window"""
+    return _rolling_extreme(x, window, np.fmax, -np.inf)
+
+
+def _rolling_min(x, window):
+    """Minimum over a trailing window"""
+    return _rolling_extreme(x, window, np.fmin, np.inf)
+
+
+def _previous(x):
+    """Values one bar earlier (NaN for the first bar)"""
+    out = np.full(x.shape, np.nan)
+    out[..., 1:] = x[..., :-1]
+    return out
+
+
+def _ewm_mean(x, alpha):
+    """Recursive exponential average (adjust=False) along the last axis, seeded with the first value"""
+    flat = x.reshape(-1, x.shape[-1])
+    if flat.shape[1] <= 10 * flat.shape[0]:
+        # Many short series (e.g. a whole universe of symbols): pandas would
+        # run them one column at a time, so step through time across all rows
+        return _ewm_rows(flat, alpha).reshape(x.shape)
+    smoothed = pd.DataFrame(flat.T).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return smoothed.T.reshape(x.shape)
+
+
+def _ewm_rows(x, alpha):
+    """
+    Exponential average of each row of a 2D array, one time step at a time
+
+    Follows pandas' ewm(adjust=False) weighting: each row starts at its first
+    value, and a gap keeps the last average while decaying its weight.
+    """
+    out = np.empty(x.shape)
+    if x.shape[1] == 0:
+        return out
+    weighted = x[:, 0].astype(float)
+    old_weight = np.ones(len(x))
+    out[:, 0] = weighted
+    for i in range(1, x.shape[1]):
+        current = x[:, i]
+        started = ~np.isnan(weighted)
+        observed = started & ~np.isnan(current)
+        old_weight = np.where(started, old_weight * (1 - alpha), old_weight)
+        with np.errstate(invalid='ignore'):
+            mixed = (old_weight * weighted + alpha * current) / (old_weight + alpha)
+        weighted = np.where(observed & (weighted != current), mixed, np.where(started, weighted, current))
+        old_weight = np.where(observed, 1.0, old_weight)
+        out[:, i] = weighted
+    return out
+
+
+@register_indicator
+class BBANDS(Indicator):
+    """Bollinger Bands: moving average with bands std_dev standard deviations either side"""
+
+    name = 'BBANDS'
+    parameters = {'period': 20, 'std_dev': 2.0, 'price': 'close'}
+
+    def lookback(self, params):
+        return int(params['period']) - 1
+
+    def compute(self, bars, params):
+        period = int(params['period'])
+        price = _values(bars, params['price'])
+        middle = _rolling_mean(price, period)
+        width = float(params['std_dev']) * _rolling_std(price, period)
+        return {
+            f'BB_Middle_{period}': middle,
+            f'BB_Upper_{period}': middle + width,
+            f'BB_Lower_{period}': middle - width
+        }
+
+
+@register_indicator
+class ATR(Indicator):
+    """Average true range with Wilder smoothing"""
+
+    name = 'ATR'
+    parameters = {'period': 14}
+
+    def lookback(self, params):
+        return WILDER_WARMUP_FACTOR * int(params['period'])
+
+    def compute(self, bars, params):
+        period = int(params['period'])
+        high, low = _values(bars, 'high'), _values(bars, 'low')
+        prev_close = _previous(_values(bars, 'close'))
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        return {f'ATR_{period}': _ewm_mean(true_range, 1.0 / period)}
+
+    def update(self, bars, params, previous):
+        period = int(params['period'])
+        column = f'ATR_{period}'
+        high, low, prev_close = _last(bars, 'high'), _last(bars, 'low'), _last(bars, 'close', 2)
+        true_range = np.fmax(high - low, np.fmax(abs(high - prev_close), abs(low - prev_close)))
+        return {column: _ewm_step((previous or {}).get(column), float(true_range), 1.0 / period)}
+
+
+@register_indicator
+class STOCH(Indicator):
+    """Stochastic oscillator: %K over k_period bars and its d_period average %D"""
+
+    name = 'STOCH'
+    parameters = {'k_period': 14, 'd_period': 3}
+
+    def lookback(self, params):
+        return int(params['k_period']) + int(params['d_period']) - 2
+
+    def compute(self, bars, params):
+        k_period, d_period = int(params['k_period']), int(params['d_period'])
+        close = _values(bars, 'close')
+        highest = _rolling_max(_values(bars, 'high'), k_period)
+        lowest = _rolling_min(_values(bars, 'low'), k_period)
+        span = highest - lowest
+        with np.errstate(invalid='ignore', divide='ignore'):
+            k = np.where(span > 0, 100.0 * (close - lowest) / span, 50.0)
+        k = np.where(np.isnan(span), np.nan, k)
+        return {
+            f'STOCH_K_{k_period}': k,
+            f'STOCH_D_{k_period}': _rolling_mean(k, d_period)
+        }
+
+
+@register_indicator
+class VWAP(Indicator):
+    """Volume-weighted average of the typical price over a trailing window"""
+
+    name = 'VWAP'
+    parameters = {'period': 20}
+
+    def lookback(self, params):
+        return int(params['period']) - 1
+
+    def compute(self, bars, params):
+        period = int(params['period'])
+        typical = (_values(bars, 'high') + _values(bars, 'low') + _values(bars, 'close')) / 3
+        volume = _values(bars, 'volume')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vwap = _rolling_sum(typical * volume, period) / _rolling_sum(volume, period)
+        return {f'VWAP_{period}': vwap}
+
+
+@register_indicator
+class OBV(Indicator):
+    """On-balance volume, accumulated from the first bar fetched"""
+
+    name = 'OBV'
+    parameters = {}
+
+    def lookback(self, params):
+        return 1
+
+    def compute(self, bars, params):
+        close = _values(bars, 'close')
+        direction = np.sign(np.nan_to_num(close - _previous(close)))
+        return {'OBV': np.cumsum(direction * np.nan_to_num(_values(bars, 'volume')), axis=-1)}
+
+    def update(self, bars, params, previous):
+        direction = np.sign(np.nan_to_num(_last(bars, 'close') - _last(bars, 'close', 2)))
+        total = (previous or {}).get('OBV', 0.0)
+        return {'OBV': float(total + direction * np.nan_to_num(_last(bars, 'volume')))}
+
+
+@register_indicator
+class DONCHIAN(Indicator):
+    """Donchian channel: highest high and lowest low over a trailing window"""
+
+    name = 'DONCHIAN'
+    parameters = {'period': 20}
+
+    def lookback(self, params):
+        return int(params['period']) - 1
+
+    def compute(self, bars, params):
+        period = int(params['period'])
+        upper = _rolling_max(_values(bars, 'high'), period)
+        lower = _rolling_min(_values(bars, 'low'), period)
+        return {
+            f'DC_Upper_{period}': upper,
+            f'DC_Lower_{period}': lower,
+            f'DC_Middle_{period}': (upper + lower) / 2
+        }
+
+
+def get_indicator(indicator_type):
+    """Get a registered indicator by type name, or None"""
+    return INDICATORS.get(indicator_type)
+
+
+@lru_cache(maxsize=1024)
+def _output_columns(indicator_type, params):
+    indicator = get_indicator(indicator_type)
+    bars = pd.DataFrame({column: np.ones(3) for column in ('open', 'high', 'low', 'close', 'volume')})
+    return tuple(indicator.compute(bars, dict(params)))
+
+
+def output_columns(config):
+    """
+    Get the names of the columns an indicator configuration adds
+
+    Args:
+        config (dict): Indicator configuration ({'type', 'parameters'})
+
+    Returns:
+        tuple: Column names in the order they are added (empty for unknown types)
+    """
+    indicator = get_indicator(config.get('type'))
+    if indicator is None:
+        return ()
+    params = indicator.resolve(config.get('parameters'))
+    return _output_columns(indicator.name, tuple(sorted(params.items())))
+
+
+def indicator_key(config):
+    """Identify an indicator configuration by its type and resolved parameters"""
+    indicator = get_indicator(config.get('type'))
+    try:
+        params = indicator.resolve(config.get('parameters')) if indicator else config.get('parameters')
+    except (KeyError, TypeError, ValueError):
+        params = config.get('parameters')
+    return (str(config.get('type')).upper(), repr(sorted((params or {}).items())))
+
+
+def required_lookback(indicators):
+    """
+    Get the warmup needed before every configured indicator is valid
+
+    Args:
+        indicators (list): Indicator configurations ({'type', 'parameters'})
+
+    Returns:
+        int: Largest lookback in bars (0 if there are no known indicators)
+    """
+    lookback = 0
+    for config in indicators or []:
+        indicator = get_indicator(config.get('type'))
+        if indicator is None:
+            continue
+        try:
+            lookback = max(lookback, indicator.lookback(indicator.resolve(config.get('parameters'))))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Invalid parameters for indicator {config.get('type')}: {str(e)}")
+    return lookback
+
+
+def apply_indicators(df, indicators):
+    """
+    Add the configured indicators' columns to a bar DataFrame
+
+    Args:
+        df (DataFrame): Price data
+        indicators (list): Indicator configurations ({'type', 'parameters'})
+
+    Returns:
+        DataFrame: DataFrame with indicator columns added
+    """
+    for config in indicators or []:
+        indicator = get_indicator(config.get('type'))
+        if indicator is None:
+            logger.warning(f"Unsupported indicator type: {config.get('type')}")
+            continue
+        try:
+            params = indicator.resolve(config.get('parameters'))
+            for column, values in indicator.compute(df, params).items():
+                df[column] = values
+            logger.info(f"Calculated {indicator.name} with parameters {params}")
+        except Exception as e:
+            logger.error(f"Error calculating indicator {config.get('type')}: {str(e)}")
+    return df
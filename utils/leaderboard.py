@@ -0,0 +1,156 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime
+from utils import storage
+
+logger = logging.getLogger(__name__)
+
+# Seconds between mark-to-market passes over all held symbols
+MARK_INTERVAL = int(os.getenv('LEADERBOARD_MARK_INTERVAL', 60))
+
+# Marks are shared in the database, so one process refreshes them for all
+MARK_LEASE = 'leaderboard-marks'
+MARK_LEASE_TTL = max(120, 3 * MARK_INTERVAL)
+
+# Leaderboard columns that rankings can be sorted by, keyed by API name
+SORT_COLUMNS = {
+    'total_return': 'total_return',
+    'profit_loss': 'realized_pl',
+    'win_rate': 'win_rate'
+}
+
+# Equity is cash plus positions valued at their latest mark (cost basis until
+# marked). Positions only move on compaction while cash moves at fill time, so
+# cash is taken back to the snapshot by undoing the fills of the journal tail
+# (one statement, so both sides are read at the same point)
+_EQUITY_SQL = """
+    UPDATE leaderboard SET equity =
+        (SELECT u.cash + COALESCE((SELECT SUM(CASE WHEN t.side = 'buy' THEN t.quantity * t.price
+                                                   ELSE -t.quantity * t.price END)
+                                   FROM trades t WHERE t.email = u.email AND t.seq > u.snapshot_seq), 0)
+         FROM users u WHERE u.email = leaderboard.email) +
+        COALESCE((SELECT SUM(p.quantity * COALESCE(m.price, p.avg_price))
+                  FROM positions p LEFT JOIN marks m ON m.symbol = p.symbol
+                  WHERE p.email = leaderboard.email), 0)
+"""
+_RETURN_SQL = "UPDATE leaderboard SET total_return = (equity - ?) * 100.0 / ?"
+
+_refresher_pid = None
+
+
+def update_entry(conn, email, snapshot):
+    """
+    Update a user's leaderboard row from their freshly folded snapshot
+
+    Args:
+        conn: Storage connection inside an open transaction
+        email (str): User email
+        snapshot (dict): Portfolio snapshot as maintained by trade_manager
+    """
+    trade_count = snapshot['trade_count']
+    win_rate = (snapshot['profitable_trades'] / trade_count) * 100 if trade_count > 0 else 0.0
+    conn.execute(
+        """INSERT INTO leaderboard (email, realized_pl, win_rate, trade_count) VALUES (?, ?, ?, ?)
+           ON CONFLICT(email) DO UPDATE SET realized_pl = excluded.realized_pl,
+               win_rate = excluded.win_rate, trade_count = excluded.trade_count""",
+        (email, snapshot['realized_pl'], win_rate, trade_count)
+    )
+    conn.execute(_EQUITY_SQL + " WHERE email = ?", (email,))
+    conn.execute(_RETURN_SQL + " WHERE email = ?", (storage.STARTING_CASH, storage.STARTING_CASH, email))
+
+
+def refresh_marks(data_fetcher):
+    """
+    Mark every held position to market with one batched quote pass
+
+    Args:
+        data_fetcher: Instance of DataFetcher used for quotes
+
+    Returns:
+        int: Number of symbols marked
+    """
+    conn = storage.get_connection()
+    symbols = [row['symbol'] for row in conn.execute('SELECT DISTINCT symbol FROM positions')]
+    if not symbols:
+        return 0
+
+    quotes = data_fetcher.get_real_time_quotes(symbols)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with storage.transaction() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO marks (symbol, price, updated_at) VALUES (?, ?, ?)',
+            [(symbol, quote['price'], now) for symbol, quote in quotes.items() if quote.get('price')]
+        )
+        conn.execute(_EQUITY_SQL)
+        conn.execute(_RETURN_SQL, (storage.STARTING_CASH, storage.STARTING_CASH))
+    logger.info(f"Marked {len(quotes)} of {len(symbols)} held symbols to market")
+    return len(quotes)
+
+
+def get_leaderboard(sort='total_return', limit=50):
+    """
+    Get the top of the paper-trading leaderboard
+
+    Args:
+        sort (str): Ranking key ('total_return', 'profit_loss' or 'win_rate')
+        limit (int): Number of entries to return
+
+    Returns:
+        list: Ranked entries without user emails
+    """
+    column = SORT_COLUMNS.get(sort, 'total_return')
+    rows = storage.get_connection().execute(
+        f"""SELECT u.username, l.total_return, l.realized_pl, l.win_rate, l.trade_count, l.equity
+            FROM leaderboard l JOIN users u ON u.email = l.email
+            WHERE l.trade_count > 0
+            ORDER BY l.{column} DESC LIMIT ?""",
+        (limit,)
+    ).fetchall()
+    return [
+        {
+            'rank': rank,
+            'username': row['username'],
+            'total_return': round(row['total_return'], 2),
+            'profit_loss': round(row['realized_pl'], 2),
+            'win_rate': round(row['win_rate'], 2),
+            'total_trades': row['trade_count'],
+            'equity': round(row['equity'], 2)
+        }
+        for rank, row in enumerate(rows, start=1)
+    ]
+
+
+def _refresh_loop(data_fetcher, interval, owner):
+    """Run refresh_marks every interval seconds while holding the marks lease"""
+    while True:
+        try:
+            if storage.acquire_lease(MARK_LEASE, owner, MARK_LEASE_TTL):
+                refresh_marks(data_fetcher)
+        except Exception as e:
+            logger.error(f"Error refreshing leaderboard marks: {str(e)}")
+        time.sleep(interval)
+
+
+def start_refresher(data_fetcher, interval=MARK_INTERVAL):
+    """
+    Start the background mark-to-market refresher for this process
+
+    Only the process holding the marks lease polls quotes; the others stand
+    by to take over if it stops renewing.
+
+    Args:
+        data_fetcher: Instance of DataFetcher used for quotes
+        interval (int): Seconds between refreshes
+    """
+    global _refresher_pid
+    if _refresher_pid == os.getpid():
+        return
+    _refresher_pid = os.getpid()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    thread = threading.Thread(target=_refresh_loop, args=(data_fetcher, interval, owner),
+                              name='leaderboard-marks', daemon=True)
+    thread.start()
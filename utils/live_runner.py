@@ -0,0 +1,523 @@
+import os
+import time
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from utils import indicators, storage
+from utils.records import BAR_DTYPE, EXCHANGE_TZ, bars_to_frame, epoch_seconds, format_time
+from utils.strategy_compiler import ExpressionGraph, StrategyCompileError, compile_strategy, rewrite_rule
+
+logger = logging.getLogger(__name__)
+
+# Threads evaluating strategies and placing their orders; bounds the runner's
+# CPU use however many strategies are active
+LIVE_WORKERS = int(os.getenv('LIVE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Feeds whose history is loaded per poll, so a restart with many active
+# strategies does not stall the first poll on hundreds of fetches
+LIVE_BOOTSTRAP_BATCH = int(os.getenv('LIVE_BOOTSTRAP_BATCH', 50))
+
+# Closed bars kept per feed, to seed indicators of strategies added later
+MAX_HISTORY_BARS = 1000
+
+# History fetched when a feed starts, per timeframe
+HISTORY_PERIODS = {'1Min': '1M', '5Min': '1M', '15Min': '1M', '1H': '1M', '1D': '2Y'}
+
+# Bar length in seconds per intraday timeframe
+INTRADAY_SECONDS = {'1Min': 60, '5Min': 300, '15Min': 900, '1H': 3600}
+
+# Daily bars cover the regular session, in exchange time
+SESSION_OPEN = 9 * 3600 + 30 * 60
+SESSION_CLOSE = 16 * 3600
+
+# Seconds after its last minute a bar is closed anyway when that minute never
+# arrives (no trades, or the feed was interrupted)
+CLOSE_GRACE_SECONDS = 90
+
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class _Timeframe:
+    """Assigns minute bars to the bars of one live timeframe"""
+
+    def __init__(self, name):
+        self.name = name
+        self.daily = name == '1D'
+        self.seconds = INTRADAY_SECONDS.get(name, 86400)
+
+    def bucket(self, t):
+        """Get the start time of the bar a minute belongs to"""
+        if not self.daily:
+            return t - t % self.seconds
+        return self._session_day(t)[0]
+
+    def accepts(self, t):
+        """Check whether a minute is part of a bar (daily bars skip extended hours)"""
+        if not self.daily:
+            return True
+        return SESSION_OPEN <= self._session_day(t)[1] < SESSION_CLOSE
+
+    def last_minute(self, start):
+        """Get the time of the final minute of the bar starting at `start`"""
+        if not self.daily:
+            return start + self.seconds - 60
+        midnight = pd.Timestamp(start, unit='s', tz='UTC').tz_convert(EXCHANGE_TZ).normalize()
+        return epoch_seconds((midnight + pd.Timedelta(seconds=SESSION_CLOSE - 60)).tz_convert('UTC'))
+
+    def _session_day(self, t):
+        """Get the start of a minute's trading day and its seconds since exchange midnight"""
+        local = pd.Timestamp(t, unit='s', tz='UTC').tz_convert(EXCHANGE_TZ)
+        midnight = local.normalize()
+        return epoch_seconds(midnight.tz_convert('UTC')), (local - midnight).total_seconds()
+
+
+class _IndicatorState:
+    """Recent values of one indicator configuration on one feed, advanced bar by bar"""
+
+    __slots__ = ('indicator', 'params', 'lookback', 'values', 'failed')
+
+    def __init__(self, config, bars, depth):
+        """
+        Compute the indicator over a feed's history
+
+        Args:
+            config (dict): Indicator configuration ({'type', 'parameters'})
+            bars (ndarray): Closed bars as BAR_DTYPE records
+            depth (int): Values to keep per column
+        """
+        self.indicator = indicators.get_indicator(config.get('type'))
+        self.params = self.indicator.resolve(config.get('parameters'))
+        self.lookback = self.indicator.lookback(self.params)
+        self.failed = False
+        columns = indicators.output_columns(config)
+        self.values = {column: deque(maxlen=depth) for column in columns}
+        if len(bars):
+            try:
+                for column, values in self.indicator.compute(bars_to_frame(bars), self.params).items():
+                    self.values[column].extend(np.asarray(values, dtype=float)[-depth:])
+            except Exception as e:
+                logger.error(f"Error calculating indicator {self.indicator.name}: {str(e)}")
+                self.failed = True
+
+    def update(self, bars):
+        """Append the values at the newest of the recent bars (column name -> array)"""
+        previous = {column: values[-1] for column, values in self.values.items() if values} or None
+        try:
+            latest = self.indicator.update(bars, self.params, previous)
+        except Exception as e:
+            logger.error(f"Error updating indicator {self.indicator.name}: {str(e)}")
+            self.failed = True
+            latest = {}
+        for column, values in self.values.items():
+            values.append(latest.get(column, np.nan))
+
+    def ready(self):
+        """Check that every column has a value at the newest bar"""
+        return not self.failed and all(values and not np.isnan(values[-1]) for values in self.values.values())
+
+
+class _LiveStrategy:
+    """One active live strategy as the runner tracks it"""
+
+    __slots__ = ('id', 'email', 'name', 'symbol', 'timeframe', 'quantity', 'position', 'config', 'keys')
+
+    def __init__(self, entry):
+        self.id = entry['id']
+        self.email = entry['email']
+        self.name = entry['name']
+        self.symbol = entry['symbol']
+        self.timeframe = entry['timeframe']
+        self.quantity = entry['quantity']
+        self.position = entry['position']
+        self.config = entry['strategy']
+        self.keys = []
+
+
+class _Feed:
+    """
+    Bars of one symbol and timeframe, with the indicators and rules of every strategy watching it
+
+    Closed bars are built from the shared minute feed. Each distinct indicator
+    configuration is advanced once per bar however many strategies use it, and
+    all the strategies' rules are compiled into one expression graph that is
+    evaluated over the last few values only.
+    """
+
+    def __init__(self, symbol, timeframe):
+        self.symbol = symbol
+        self.timeframe = _Timeframe(timeframe)
+        self.bars = np.empty(0, dtype=BAR_DTYPE)  # Closed bars, oldest first
+        self.forming = None  # One-element BAR_DTYPE array of the bar being built
+        self.last_minute = None  # Time of the newest minute folded in
+        self.ready = False
+        self.dirty = True
+        self.strategies = {}  # Live strategy id -> _LiveStrategy
+        self.states = {}  # Indicator key -> _IndicatorState
+        self.graph = None
+        self.roots = {}
+        self.sources = {}  # Graph column name -> (indicator key, column)
+        self.depth = 1
+        self.window = 2
+
+    def load(self, history, last_minute):
+        """
+        Start the feed from historical bars
+
+        Args:
+            history (ndarray): Bars of this timeframe as BAR_DTYPE records
+            last_minute (int): Time of the newest minute bar the history includes, or None
+        """
+        bars = history[-MAX_HISTORY_BARS:]
+        self.forming = None
+        if len(bars) and last_minute is not None:
+            start = self.timeframe.bucket(int(bars['time'][-1]))
+            if self.timeframe.bucket(last_minute) == start and last_minute < self.timeframe.last_minute(start):
+                # The newest bar is still forming; later minutes are folded into it
+                self.forming = bars[-1:].copy()
+                bars = bars[:-1]
+        self.bars = bars.copy()
+        self.last_minute = last_minute
+        self.ready = True
+        self.dirty = True
+
+    def add_minute(self, minute):
+        """
+        Fold a minute bar into the forming bar
+
+        Args:
+            minute (dict): Minute bar with time, open, high, low, close and volume
+
+        Returns:
+            list: Bars (one-element BAR_DTYPE arrays) closed by this minute
+        """
+        t = epoch_seconds(minute['time'])
+        if self.last_minute is not None and t <= self.last_minute:
+            return []
+        self.last_minute = t
+        if not self.timeframe.accepts(t):
+            return []
+
+        closed = []
+        start = self.timeframe.bucket(t)
+        if self.forming is not None and self.forming['time'][0] != start:
+            closed.append(self.forming)
+            self.forming = None
+        if self.forming is None:
+            self.forming = np.empty(1, dtype=BAR_DTYPE)
+            self.forming['time'] = start
+            for field in BAR_FIELDS:
+                self.forming[field] = minute[field]
+        else:
+            self.forming['high'] = max(self.forming['high'][0], minute['high'])
+            self.forming['low'] = min(self.forming['low'][0], minute['low'])
+            self.forming['close'] = minute['close']
+            self.forming['volume'] += minute['volume']
+        if t >= self.timeframe.last_minute(start):
+            closed.append(self.forming)
+            self.forming = None
+        return closed
+
+    def expire(self, now):
+        """Close the forming bar if its last minute is long overdue"""
+        if self.forming is None:
+            return []
+        if now < self.timeframe.last_minute(int(self.forming['time'][0])) + 60 + CLOSE_GRACE_SECONDS:
+            return []
+        closed, self.forming = self.forming, None
+        return [closed]
+
+    def rebuild(self):
+        """
+        Recompile the rules of the feed's strategies into one graph and seed new indicators
+
+        Returns:
+            dict: Live strategy id -> error message for strategies that cannot run
+        """
+        configs = {}
+        for strategy in self.strategies.values():
+            strategy.keys = []
+            for config in strategy.config.get('indicators') or []:
+                if indicators.get_indicator(config.get('type')) is None:
+                    logger.warning(f"Unsupported indicator type: {config.get('type')}")
+                    continue
+                key = indicators.indicator_key(config)
+                configs[key] = config
+                strategy.keys.append(key)
+
+        # Columns added by more than one configuration get qualified names,
+        # as in tournaments, so every strategy reads its own configuration's values
+        ids = {key: index for index, key in enumerate(configs)}
+        owners = defaultdict(set)
+        for key, config in configs.items():
+            for column in indicators.output_columns(config):
+                owners[column].add(key)
+
+        graph = ExpressionGraph()
+        roots = {}
+        sources = {}
+        errors = {}
+        depth = 1
+        for strategy in self.strategies.values():
+            names = {}
+            for key in strategy.keys:
+                for column in indicators.output_columns(configs[key]):
+                    names[column] = f"{column}__{ids[key]}" if len(owners[column]) > 1 else column
+                    sources[names[column]] = (key, column)
+            config = strategy.config
+            renames = {column: qualified for column, qualified in names.items() if qualified != column}
+            if renames:
+                config = dict(config)
+                for side in ('entry_rules', 'exit_rules'):
+                    config[side] = [rewrite_rule(rule, renames) for rule in config.get(side) or []]
+            available = set(BAR_FIELDS) | set(names.values())
+            try:
+                compiled = compile_strategy(config, columns=available, graph=graph)
+                missing = [column for column in compiled.columns if column not in available]
+                if missing:
+                    raise StrategyCompileError(f"Column '{missing[0]}' not found in data")
+            except StrategyCompileError as e:
+                errors[strategy.id] = f"Invalid strategy rule: {str(e)}"
+                continue
+            roots[(strategy.id, 'entry')] = compiled.entry
+            roots[(strategy.id, 'exit')] = compiled.exit
+            depth = max(depth, compiled.lookback + 1)
+
+        # Keep the state of indicators still in use unless the rules now look further back
+        grown = depth > self.depth
+        self.states = {key: state for key, state in self.states.items() if key in configs and not grown}
+        for key, config in configs.items():
+            if key not in self.states:
+                self.states[key] = _IndicatorState(config, self.bars, depth)
+        self.graph = graph
+        self.roots = roots
+        self.sources = sources
+        self.depth = depth
+        self.window = max([2] + [state.lookback + 1 for state in self.states.values()])
+        self.dirty = False
+        return errors
+
+    def on_bar(self, bar):
+        """
+        Advance the indicators by a closed bar and evaluate every strategy's rules on it
+
+        Args:
+            bar (ndarray): One-element BAR_DTYPE array
+
+        Returns:
+            dict: Live strategy id -> (entry signal, exit signal), for strategies whose inputs are all valid
+        """
+        self.bars = np.concatenate([self.bars[-(MAX_HISTORY_BARS - 1):], bar])
+        if self.states:
+            window = {field: self.bars[field][-self.window:] for field in BAR_FIELDS}
+            for state in self.states.values():
+                state.update(window)
+        if not self.roots:
+            return {}
+
+        arrays = {}
+        for name in self.graph.columns:
+            if name in self.sources:
+                key, column = self.sources[name]
+                values = np.fromiter(self.states[key].values[column], dtype=float)
+            else:
+                values = self.bars[name][-self.depth:].astype(float)
+            if len(values) < self.depth:
+                values = np.concatenate([np.full(self.depth - len(values), np.nan), values])
+            arrays[name] = values
+        signals = self.graph.evaluate(arrays, self.roots, length=self.depth)
+
+        valid = not np.isnan([bar[field][0] for field in BAR_FIELDS]).any()
+        decisions = {}
+        for strategy_id, strategy in self.strategies.items():
+            if (strategy_id, 'entry') not in self.roots:
+                continue
+            if valid and all(self.states[key].ready() for key in strategy.keys):
+                decisions[strategy_id] = (bool(signals[(strategy_id, 'entry')][-1]),
+                                          bool(signals[(strategy_id, 'exit')][-1]))
+        return decisions
+
+
+def check_strategy(strategy):
+    """
+    Compile a strategy's rules the way the runner will
+
+    Args:
+        strategy (dict): Strategy configuration with indicators and rules
+
+    Returns:
+        str: Error message, or None if the strategy can run live
+    """
+    if not strategy.get('entry_rules'):
+        return "Strategy has no entry rules"
+    feed = _Feed(None, '1D')
+    feed.strategies[0] = _LiveStrategy({'id': 0, 'email': None, 'name': None, 'symbol': None, 'timeframe': '1D',
+                                        'quantity': 0, 'position': 0, 'strategy': strategy})
+    return feed.rebuild().get(0)
+
+
+class LiveRunner:
+    """
+    Runs users' active live strategies against their paper accounts
+
+    Each poll fetches the latest minute bar of every watched symbol in one
+    batched request and fans it out to a feed per (symbol, timeframe). When a
+    feed's bar closes, its indicators advance by one bar and the entry and
+    exit rules of every strategy watching it are evaluated together; signals
+    become market orders through the paper matching engine. Feeds with closed
+    bars are processed on a fixed pool of worker threads.
+    """
+
+    def __init__(self, data_fetcher, matching_engine, workers=LIVE_WORKERS):
+        """
+        Initialize the runner
+
+        Args:
+            data_fetcher: Instance of DataFetcher for history and the latest bars
+            matching_engine: Instance of MatchingEngine orders are submitted to
+            workers (int): Threads evaluating feeds and placing orders
+        """
+        self.data_fetcher = data_fetcher
+        self.matching_engine = matching_engine
+        self.feeds = {}  # (symbol, timeframe) -> _Feed
+        self._feed_of = {}  # Live strategy id -> (symbol, timeframe)
+        self._synced_version = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='live-runner')
+        self.stats = {'polls': 0, 'bars': 0, 'evaluations': 0, 'orders': 0}
+
+    def sync(self):
+        """Pick up live strategies started, replaced or stopped since the last sync"""
+        for entry in storage.list_changed_live_strategies(after_version=self._synced_version):
+            self._synced_version = max(self._synced_version, entry['version'])
+            self._remove(entry['id'])
+            if entry['active']:
+                feed_key = (entry['symbol'], entry['timeframe'])
+                feed = self.feeds.get(feed_key)
+                if feed is None:
+                    feed = self.feeds[feed_key] = _Feed(*feed_key)
+                feed.strategies[entry['id']] = _LiveStrategy(entry)
+                feed.dirty = True
+                self._feed_of[entry['id']] = feed_key
+
+    def step(self, now=None):
+        """
+        Run one poll: sync strategies, load new feeds, fold in the latest bars and act on closed ones
+
+        Args:
+            now (float): Current epoch time, for tests
+
+        Returns:
+            int: Number of orders placed
+        """
+        self.sync()
+        if not self.feeds:
+            return 0
+        self.stats['polls'] += 1
+
+        pending = [feed for feed in self.feeds.values() if not feed.ready][:LIVE_BOOTSTRAP_BATCH]
+        for feed, error in zip(pending, self._pool.map(self._bootstrap, pending)):
+            if error:
+                logger.error(f"Error loading history for {feed.symbol} {feed.timeframe.name}: {error}")
+
+        updates = []
+        for feed in self.feeds.values():
+            if feed.ready and feed.dirty:
+                for strategy_id, error in feed.rebuild().items():
+                    updates.append((strategy_id, None, None, feed.strategies[strategy_id].position, error))
+
+        by_symbol = defaultdict(list)
+        for feed in self.feeds.values():
+            if feed.ready:
+                by_symbol[feed.symbol].append(feed)
+        latest = self.data_fetcher.get_latest_bars(sorted(by_symbol)) if by_symbol else {}
+
+        now = time.time() if now is None else now
+        work = []
+        for symbol, feeds in by_symbol.items():
+            for feed in feeds:
+                closed = feed.add_minute(latest[symbol]) if symbol in latest else []
+                closed += feed.expire(now)
+                if closed:
+                    work.append((feed, closed))
+
+        orders = 0
+        for feed_orders, feed_updates in self._pool.map(lambda item: self._process(*item), work):
+            orders += feed_orders
+            updates.extend(feed_updates)
+            self.stats['evaluations'] += len(feed_updates)
+        if updates:
+            storage.record_live_signals(updates)
+        self.stats['bars'] += sum(len(closed) for _, closed in work)
+        self.stats['orders'] += orders
+        return orders
+
+    def close(self):
+        """Stop the worker threads and drop all state"""
+        self._pool.shutdown(wait=True)
+        self.feeds.clear()
+        self._feed_of.clear()
+
+    def _remove(self, strategy_id):
+        feed_key = self._feed_of.pop(strategy_id, None)
+        if feed_key is None:
+            return
+        feed = self.feeds[feed_key]
+        feed.strategies.pop(strategy_id, None)
+        feed.dirty = True
+        if not feed.strategies:
+            del self.feeds[feed_key]
+
+    def _bootstrap(self, feed):
+        """Load a feed's history; returns an error message or None"""
+        try:
+            timeframe = feed.timeframe.name
+            history = self.data_fetcher.get_historical_bars(feed.symbol, timeframe, HISTORY_PERIODS[timeframe])
+            # Intraday bars are resampled from the same cached minute series
+            minutes = history if timeframe == '1Min' else self.data_fetcher.get_historical_bars(
+                feed.symbol, '1Min', HISTORY_PERIODS['1Min'])
+            feed.load(history, int(minutes['time'][-1]) if len(minutes) else None)
+            return None
+        except Exception as e:
+            return str(e)
+
+    def _process(self, feed, closed):
+        """
+        Evaluate a feed's strategies on its closed bars and place the resulting orders
+
+        Returns:
+            tuple: (orders placed, signal updates to record)
+        """
+        orders = 0
+        updates = {}
+        for bar in closed:
+            bar_time = format_time(bar['time'][0])
+            try:
+                decisions = feed.on_bar(bar)
+            except Exception as e:
+                logger.error(f"Error evaluating live strategies on {feed.symbol}: {str(e)}")
+                continue
+            for strategy_id, (entry, exit) in decisions.items():
+                strategy = feed.strategies[strategy_id]
+                signal, status = None, None
+                if strategy.position == 0 and entry:
+                    signal, side, quantity = 'entry', 'buy', strategy.quantity
+                elif strategy.position > 0 and exit:
+                    signal, side, quantity = 'exit', 'sell', strategy.position
+                if signal:
+                    success, order = self.matching_engine.submit_order(
+                        strategy.email, strategy.symbol, side, 'market', quantity,
+                        notes=f"Live strategy {strategy.name}")
+                    if success:
+                        filled = order['filled_quantity']
+                        strategy.position += filled if side == 'buy' else -filled
+                        orders += 1
+                        logger.info(f"Live strategy {strategy.name} ({strategy.email}) {side} "
+                                    f"{filled} {strategy.symbol} on bar {bar_time}")
+                    else:
+                        status = f"Order failed: {order}"
+                        logger.error(f"Live strategy {strategy.name} could not {side} {strategy.symbol}: {order}")
+                # Keep an earlier bar's signal when several bars closed in one poll
+                signal = signal or updates.get(strategy_id, (None, None, None))[2]
+                updates[strategy_id] = (strategy_id, bar_time, signal, strategy.position, status)
+        return orders, list(updates.values())
@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from utils import storage
+
+logger = logging.getLogger(__name__)
+
+# Timeframes strategies can run on live; every one is built from the minute feed
+LIVE_TIMEFRAMES = ('1Min', '5Min', '15Min', '1H', '1D')
+
+# Seconds between polls of the latest minute bars; under a minute so no minute is skipped
+LIVE_POLL_INTERVAL = int(os.getenv('LIVE_POLL_INTERVAL', 15))
+
+# Active live strategies allowed per user
+LIVE_MAX_PER_USER = int(os.getenv('LIVE_MAX_STRATEGIES_PER_USER', 20))
+
+# One process runs the live strategies; it must renew its lease within this
+# many seconds or another process takes over
+LEASE_NAME = 'live-runner'
+LEASE_TTL = max(60, 4 * LIVE_POLL_INTERVAL)
+
+_runner_pid = None
+
+
+def start_strategy(email, name, strategy, symbol, timeframe='1D', quantity=1):
+    """
+    Start running a saved strategy live against the user's paper account
+
+    The strategy is stored as given, so later edits to the saved strategy only
+    take effect once it is started again.
+
+    Args:
+        email (str): User email
+        name (str): Saved strategy name
+        strategy (dict): Strategy configuration with indicators and rules
+        symbol (str): Trading symbol
+        timeframe (str): Bar timeframe the rules are evaluated on
+        quantity (int): Shares bought on each entry
+
+    Returns:
+        tuple: (success, live strategy dict or error message)
+    """
+    if timeframe not in LIVE_TIMEFRAMES:
+        return False, f"Unsupported timeframe '{timeframe}', expected one of {', '.join(LIVE_TIMEFRAMES)}"
+    if not isinstance(quantity, int) or quantity <= 0:
+        return False, "Quantity must be a positive whole number of shares"
+    if not symbol:
+        return False, "Symbol is required"
+
+    running = {entry['name'] for entry in storage.list_live_strategies(email) if entry['active']}
+    if name not in running and len(running) >= LIVE_MAX_PER_USER:
+        return False, f"At most {LIVE_MAX_PER_USER} strategies can run live at once"
+
+    entry = storage.save_live_strategy(email, {
+        'name': name,
+        'symbol': symbol.upper(),
+        'timeframe': timeframe,
+        'quantity': quantity,
+        'strategy': strategy
+    })
+    logger.info(f"Started live strategy {name} for {email} on {entry['symbol']} {timeframe}")
+    return True, entry
+
+
+def stop_strategy(email, name):
+    """
+    Stop running a strategy live; shares it holds stay in the paper account
+
+    Returns:
+        tuple: (success, live strategy dict or error message)
+    """
+    entry = storage.stop_live_strategy(email, name)
+    if entry is None:
+        return False, "Live strategy not found"
+    logger.info(f"Stopped live strategy {name} for {email}")
+    return True, entry
+
+
+def list_strategies(email):
+    """Get a user's live strategies with their positions and last signals"""
+    return storage.list_live_strategies(email)
+
+
+def start_runner(interval=LIVE_POLL_INTERVAL):
+    """
+    Start the live strategy runner thread for this process
+
+    Every process polls for the runner lease, but only its holder fetches
+    market data and evaluates strategies, so each symbol is polled once
+    however many workers there are. The runner (and pandas with it) is only
+    built once a strategy is active.
+
+    Args:
+        interval (int): Seconds between polls
+    """
+    global _runner_pid
+    if _runner_pid == os.getpid():
+        return
+    _runner_pid = os.getpid()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    thread = threading.Thread(target=_run_loop, args=(interval, owner), name='live-strategies', daemon=True)
+    thread.start()
+
+
+def _run_loop(interval, owner):
+    """Hold the lease and step the runner every interval seconds; drop all state if the lease is lost"""
+    runner = None
+    while True:
+        try:
+            if not storage.acquire_lease(LEASE_NAME, owner, LEASE_TTL):
+                if runner is not None:
+                    logger.warning("Live strategy runner lease lost to another process")
+                    runner.close()
+                    runner = None
+            elif runner is not None or storage.count_live_strategies():
+                if runner is None:
+                    # Imported here so processes without live strategies never load pandas
+                    from utils.live_runner import LiveRunner
+                    from utils.services import get_data_fetcher, get_matching_engine
+                    runner = LiveRunner(get_data_fetcher(), get_matching_engine())
+                    logger.info(f"Live strategy runner started in process {os.getpid()}")
+                runner.step()
+        except Exception as e:
+            logger.error(f"Error running live strategies: {str(e)}")
+        time.sleep(interval)
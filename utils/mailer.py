@@ -0,0 +1,229 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import smtplib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds an idle SMTP connection is kept open before it is closed
+IDLE_TIMEOUT = 60
+
+# Connections idle longer than this are probed with NOOP before reuse
+PROBE_AFTER = 10
+
+
+class MailQueue:
+    """
+    Bounded outbound mail queue served by a background worker
+
+    The worker keeps one authenticated SMTP connection open and reuses it for
+    consecutive messages, reconnecting when the server drops it. Transient
+    failures (connection errors, 4xx replies) are retried with exponential
+    backoff; permanent ones (5xx replies, malformed messages) are dropped at
+    once so they do not hold up the queue.
+    """
+
+    def __init__(self, host, port, user=None, password=None, use_tls=True,
+                 maxsize=1000, max_retries=5, backoff=1.0, max_backoff=60.0):
+        """
+        Initialize the mail queue
+
+        Args:
+            host (str): SMTP server host
+            port (int): SMTP server port
+            user (str): SMTP login user, or None to skip authentication
+            password (str): SMTP login password
+            use_tls (bool): Upgrade the connection with STARTTLS
+            maxsize (int): Maximum number of queued messages
+            max_retries (int): Attempts per message before it is dropped
+            backoff (float): Initial retry delay in seconds
+            max_backoff (float): Maximum retry delay in seconds
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stats = {'queued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'rejected': 0, 'connections': 0}
+        self._connection = None
+        self._last_used = 0.0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, message):
+        """
+        Queue a message for delivery without blocking
+
+        Args:
+            message (email.message.Message): Message to send
+
+        Returns:
+            bool: False if the queue is full
+        """
+        self.start()
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.stats['rejected'] += 1
+            logger.warning(f"Mail queue full, rejecting message to {message['To']}")
+            return False
+        self.stats['queued'] += 1
+        return True
+
+    def start(self):
+        """Start the delivery worker for this process if it is not running"""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._connection = None
+            self._thread = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Deliver queued messages and stop the worker
+
+        Args:
+            timeout (float): Seconds to wait for the queue to drain
+        """
+        if self._thread is None or self._pid != os.getpid():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        """Worker loop: deliver messages, closing the connection when idle"""
+        while True:
+            try:
+                message = self.queue.get(timeout=IDLE_TIMEOUT)
+            except queue.Empty:
+                self._close()
+                continue
+            if message is None:
+                self._close()
+                return
+            self._deliver(message)
+
+    def _deliver(self, message):
+        """Send a message, retrying transient failures with exponential backoff"""
+        delay = self.backoff
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._get_connection().send_message(message)
+                self._last_used = time.time()
+                self.stats['sent'] += 1
+                return
+            except Exception as e:
+                if not _is_transient(e):
+                    # smtplib resets the transaction after a refusal, so the connection stays usable
+                    self.stats['failed'] += 1
+                    logger.error(f"Dropping email to {message['To']}, rejected permanently: {e}")
+                    return
+                # The connection may be in an unknown state; start fresh next time
+                self._close()
+                if attempt == self.max_retries:
+                    break
+                self.stats['retried'] += 1
+                logger.warning(f"Error sending email to {message['To']} (attempt {attempt}): {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+        self.stats['failed'] += 1
+        logger.error(f"Giving up on email to {message['To']} after {self.max_retries} attempts")
+
+    def _get_connection(self):
+        """Return an open, authenticated SMTP connection, reusing the current one when alive"""
+        if self._connection is not None and time.time() - self._last_used > PROBE_AFTER:
+            try:
+                status, _ = self._connection.noop()
+                if status != 250:
+                    self._close()
+            except (smtplib.SMTPException, OSError):
+                self._close()
+
+        if self._connection is None:
+            connection = smtplib.SMTP(self.host, self.port, timeout=30)
+            try:
+                if self.use_tls:
+                    connection.starttls()
+                if self.user:
+                    connection.login(self.user, self.password)
+            except BaseException:
+                # Not yet tracked in self._connection, so _close() would not release the socket
+                connection.close()
+                raise
+            self._connection = connection
+            self.stats['connections'] += 1
+        return self._connection
+
+    def _close(self):
+        """Close the current SMTP connection, if any"""
+        if self._connection is None:
+            return
+        try:
+            self._connection.quit()
+        except Exception:
+            pass
+        self._connection = None
+
+
+def _is_transient(error):
+    """
+    Check whether a send failure may succeed if retried
+
+    Args:
+        error (Exception): Error raised while sending
+
+    Returns:
+        bool: True for connection errors and 4xx replies, False for 5xx
+        replies and errors in the message itself
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # Raised only when every recipient was refused; retry if any refusal was temporary
+        return any(code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError))
+
+
+_mail_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_mail_queue():
+    """
+    Get the process-wide mail queue configured from the SMTP_* environment variables
+
+    Returns:
+        MailQueue: Shared queue, or None if SMTP credentials are not configured
+    """
+    global _mail_queue
+    if _mail_queue is not None:
+        return _mail_queue
+    if not os.getenv('SMTP_USER') or not os.getenv('SMTP_PASSWORD'):
+        return None
+
+    with _queue_lock:
+        if _mail_queue is None:
+            _mail_queue = MailQueue(
+                host=os.getenv('SMTP_SERVER', 'smtp.gmail.com'),
+                port=int(os.getenv('SMTP_PORT', 587)),
+                user=os.getenv('SMTP_USER'),
+                password=os.getenv('SMTP_PASSWORD'),
+                use_tls=os.getenv('SMTP_USE_TLS', '1') != '0',
+                maxsize=int(os.getenv('MAIL_QUEUE_SIZE', 1000))
+            )
+            atexit.register(_mail_queue.stop)
+    return _mail_queue
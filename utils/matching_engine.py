@@ -0,0 +1,404 @@
+import os
+import time
+import uuid
+import heapq
+import socket
+import logging
+import threading
+from datetime import datetime
+from utils import storage
+from utils.records import epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+# Share of a bar's volume that resting orders may fill against
+PARTICIPATION_RATE = float(os.getenv('PAPER_PARTICIPATION_RATE', 0.1))
+
+# Seconds between polls for new bars on symbols with resting orders
+MATCH_INTERVAL = int(os.getenv('PAPER_MATCH_INTERVAL', 15))
+
+# One process polls bars and matches resting orders; it must renew its lease
+# within this many seconds or another process takes over
+MATCHER_LEASE = 'order-matcher'
+MATCHER_LEASE_TTL = max(60, 4 * MATCH_INTERVAL)
+
+
+class OrderBook:
+    """Resting limit orders for one symbol, indexed by price"""
+
+    def __init__(self):
+        """Initialize empty bid and ask heaps"""
+        self.bids = []  # (-limit_price, seq, order_id): best (highest) bid first
+        self.asks = []  # (limit_price, seq, order_id): best (lowest) ask first
+        self.orders = {}  # order_id -> (seq, email, side, limit_price, placed)
+
+    def add(self, seq, email, order):
+        """Add a resting order to the book"""
+        order_id = order['id']
+        if order_id in self.orders:
+            return
+        # created_at is server-local wall-clock time
+        placed = datetime.strptime(order['created_at'], '%Y-%m-%d %H:%M:%S').timestamp()
+        self.orders[order_id] = (seq, email, order['side'], order['limit_price'], placed)
+        if order['side'] == 'buy':
+            heapq.heappush(self.bids, (-order['limit_price'], seq, order_id))
+        else:
+            heapq.heappush(self.asks, (order['limit_price'], seq, order_id))
+
+    def remove(self, order_id):
+        """Remove an order; its heap entry is discarded lazily when reached"""
+        self.orders.pop(order_id, None)
+
+    def pop_crossing(self, buy_at_or_below, sell_at_or_above, placed_by=None):
+        """
+        Remove and return the orders a price range can fill
+
+        Only the heap entries that cross are touched, so the cost is
+        proportional to the number of fillable orders, not the book size.
+        Crossing orders placed after placed_by stay in the book.
+
+        Args:
+            buy_at_or_below (float): Lowest traded/offered price; bids at or above it fill
+            sell_at_or_above (float): Highest traded/bid price; asks at or below it fill
+            placed_by (float): Epoch seconds; only orders placed at or before it fill
+
+        Returns:
+            list: (seq, email, side, limit_price, order_id) in price-time priority,
+            bids first
+        """
+        crossed = []
+        for heap, side in ((self.bids, 'buy'), (self.asks, 'sell')):
+            later = []
+            while heap:
+                key, seq, order_id = heap[0]
+                price = -key if side == 'buy' else key
+                if order_id not in self.orders:
+                    heapq.heappop(heap)
+                    continue
+                if side == 'buy' and price < buy_at_or_below:
+                    break
+                if side == 'sell' and price > sell_at_or_above:
+                    break
+                entry = heapq.heappop(heap)
+                if placed_by is not None and self.orders[order_id][4] > placed_by:
+                    later.append(entry)
+                    continue
+                _, email, _, _, _ = self.orders.pop(order_id)
+                crossed.append((seq, email, side, price, order_id))
+            for entry in later:
+                heapq.heappush(heap, entry)
+        return crossed
+
+    def __len__(self):
+        return len(self.orders)
+
+
+class MatchingEngine:
+    """Simulated matching engine for paper-trading orders"""
+
+    def __init__(self, data_fetcher):
+        """
+        Initialize the matching engine
+
+        Args:
+            data_fetcher: Instance of DataFetcher used for quotes and bars
+        """
+        self.data_fetcher = data_fetcher
+        self.books = {}  # symbol -> OrderBook
+        self._synced_seq = 0
+        self._lock = threading.Lock()
+        self._matcher_pid = None
+        self._leader = False
+
+    def submit_order(self, email, symbol, side, order_type, quantity, limit_price=None, notes=''):
+        """
+        Submit a paper-trading order
+
+        Market orders fill at once at the current quote. Limit orders fill at
+        once if the quote already crosses them, otherwise they rest until a
+        bar starting after they were placed trades through their price.
+
+        Args:
+            email (str): User email
+            symbol (str): Trading symbol
+            side (str): 'buy' or 'sell'
+            order_type (str): 'market' or 'limit'
+            quantity (int): Number of shares
+            limit_price (float): Limit price for limit orders
+            notes (str): Free-form notes
+
+        Returns:
+            tuple: (success, order dict or error message)
+        """
+        quote = self.data_fetcher.get_real_time_quote(symbol)
+        market_price = self._quote_price(quote, side)
+        if order_type == 'market' and market_price is None:
+            market_price = self._last_close(symbol)
+            if market_price is None:
+                return False, "No market price available"
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        order = {
+            'id': str(uuid.uuid4()),
+            'symbol': symbol,
+            'side': side,
+            'type': order_type,
+            'quantity': quantity,
+            'filled_quantity': 0,
+            'limit_price': limit_price,
+            'avg_fill_price': None,
+            'status': 'open',
+            'created_at': now,
+            'updated_at': now,
+            'notes': notes
+        }
+
+        with storage.transaction() as conn:
+            row = conn.execute('SELECT cash FROM users WHERE email = ?', (email,)).fetchone()
+            if row is None:
+                return False, "User not found"
+            if side == 'buy' and row['cash'] < quantity * (limit_price or market_price):
+                return False, "Insufficient funds"
+            storage.insert_order(conn, email, order)
+
+            if order_type == 'market':
+                self._fill(conn, order, email, quantity, market_price)
+                if order['status'] in storage.OPEN_ORDER_STATUSES:
+                    # Market orders never rest; cancel whatever could not be filled
+                    order['status'] = 'cancelled'
+                    storage.update_order(conn, order)
+            elif market_price is not None and self._crosses(side, limit_price, market_price):
+                self._fill(conn, order, email, quantity, market_price)
+
+        # Resting orders reach the matcher's book through sync()
+        return True, order
+
+    def cancel_order(self, email, order_id):
+        """
+        Cancel the unfilled part of an order
+
+        Args:
+            email (str): User email
+            order_id (str): Order id
+
+        Returns:
+            tuple: (success, order dict or error message)
+        """
+        with storage.transaction() as conn:
+            order = storage.get_order(order_id, conn=conn)
+            if order is None or order.pop('email') != email:
+                return False, "Order not found"
+            if order['status'] not in storage.OPEN_ORDER_STATUSES:
+                return False, f"Order is already {order['status']}"
+            order['status'] = 'cancelled'
+            order['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            storage.update_order(conn, order)
+
+        with self._lock:
+            book = self.books.get(order['symbol'])
+            if book:
+                book.remove(order_id)
+        return True, order
+
+    def on_bar(self, symbol, bar):
+        """
+        Match resting orders against a new bar
+
+        A bid fills if the bar traded at or below its limit, an ask if it
+        traded at or above. Fills are priced at the limit, or at the open when
+        the bar gapped through it, and each side may take at most
+        PARTICIPATION_RATE of the bar's volume. Orders placed after the bar
+        started wait for a later bar.
+
+        Args:
+            symbol (str): Trading symbol
+            bar (dict): Bar with time (exchange time), open, high, low, close and volume
+
+        Returns:
+            list: Orders that received fills
+        """
+        with self._lock:
+            book = self.books.get(symbol)
+            if not book:
+                return []
+            crossed = book.pop_crossing(bar['low'], bar['high'], epoch_seconds(bar['time']))
+        if not crossed:
+            return []
+
+        volume = bar.get('volume')
+        budget = {
+            'buy': int(volume * PARTICIPATION_RATE) if volume else None,
+            'sell': int(volume * PARTICIPATION_RATE) if volume else None
+        }
+        filled = []
+        requeue = []
+
+        for seq, email, side, limit_price, order_id in crossed:
+            if budget[side] == 0:
+                requeue.append((seq, email, order_id))
+                continue
+            if side == 'buy':
+                price = min(limit_price, bar['open'])
+            else:
+                price = max(limit_price, bar['open'])
+
+            with storage.transaction() as conn:
+                order = storage.get_order(order_id, conn=conn)
+                if order is None or order['status'] not in storage.OPEN_ORDER_STATUSES:
+                    continue
+                order.pop('email')
+                quantity = order['quantity'] - order['filled_quantity']
+                if budget[side] is not None:
+                    quantity = min(quantity, budget[side])
+                quantity = self._fill(conn, order, email, quantity, price)
+
+            if quantity > 0:
+                filled.append(order)
+                if budget[side] is not None:
+                    budget[side] -= quantity
+            if order['status'] in storage.OPEN_ORDER_STATUSES:
+                requeue.append((seq, email, order_id))
+
+        if requeue:
+            with self._lock:
+                for seq, email, order_id in requeue:
+                    order = storage.get_order(order_id)
+                    if order and order['status'] in storage.OPEN_ORDER_STATUSES:
+                        self.books.setdefault(symbol, OrderBook()).add(seq, email, order)
+        return filled
+
+    def sync(self):
+        """Load orders submitted since the last sync, in any worker process, into the book"""
+        orders = storage.list_open_orders(after_seq=self._synced_seq)
+        with self._lock:
+            for seq, email, order in orders:
+                if order['type'] == 'limit':
+                    self.books.setdefault(order['symbol'], OrderBook()).add(seq, email, order)
+                self._synced_seq = max(self._synced_seq, seq)
+
+    def match_latest_bars(self):
+        """
+        Poll the latest bar of every symbol with resting orders and match against it
+
+        Returns:
+            int: Number of orders that received fills
+        """
+        self.sync()
+        with self._lock:
+            symbols = [symbol for symbol, book in self.books.items() if len(book) > 0]
+        if not symbols:
+            return 0
+
+        filled = 0
+        for symbol, bar in self.data_fetcher.get_latest_bars(symbols).items():
+            if storage.claim_bar(symbol, bar['time']):
+                filled += len(self.on_bar(symbol, bar))
+        return filled
+
+    def start(self, interval=MATCH_INTERVAL):
+        """
+        Start the background matcher for this process
+
+        Every process runs the loop, but only the holder of the matcher lease
+        keeps a book and polls bars, so upstream requests do not grow with the
+        worker count. Orders from every process reach its book through sync().
+
+        Args:
+            interval (int): Seconds between bar polls
+        """
+        if self._matcher_pid == os.getpid():
+            return
+        self._matcher_pid = os.getpid()
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        thread = threading.Thread(target=self._match_loop, args=(interval, owner), name='order-matcher', daemon=True)
+        thread.start()
+
+    def _match_loop(self, interval, owner):
+        """Run match_latest_bars every interval seconds while holding the matcher lease"""
+        while True:
+            try:
+                leader = storage.acquire_lease(MATCHER_LEASE, owner, MATCHER_LEASE_TTL)
+                if leader != self._leader:
+                    # Another holder may have filled or cancelled orders meanwhile; reload from scratch
+                    with self._lock:
+                        self.books = {}
+                        self._synced_seq = 0
+                    self._leader = leader
+                if leader:
+                    self.match_latest_bars()
+            except Exception as e:
+                logger.error(f"Error matching paper orders: {str(e)}")
+            time.sleep(interval)
+
+    def _fill(self, conn, order, email, quantity, price):
+        """
+        Fill part of an order, journaling the fill as a trade
+
+        Buy fills are capped at what the user's cash can pay for; a buy order
+        that cannot afford a single share is cancelled.
+
+        Args:
+            conn: Storage connection inside an open transaction
+            order (dict): Order to fill, updated in place
+            email (str): User email
+            quantity (int): Shares to fill
+            price (float): Fill price
+
+        Returns:
+            int: Shares actually filled
+        """
+        cash = conn.execute('SELECT cash FROM users WHERE email = ?', (email,)).fetchone()['cash']
+        if order['side'] == 'buy':
+            quantity = min(quantity, int(cash // price)) if price > 0 else quantity
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        order['updated_at'] = now
+        if quantity <= 0:
+            order['status'] = 'cancelled'
+            order['notes'] = (order.get('notes') or '') + ' [cancelled: insufficient funds]'
+            storage.update_order(conn, order)
+            return 0
+
+        value = quantity * price
+        cash = cash - value if order['side'] == 'buy' else cash + value
+        conn.execute('UPDATE users SET cash = ? WHERE email = ?', (cash, email))
+        storage.insert_trade(conn, email, {
+            'timestamp': now,
+            'symbol': order['symbol'],
+            'quantity': quantity,
+            'side': order['side'],
+            'type': order['type'],
+            'price': price,
+            'status': 'executed',
+            'notes': order.get('notes', ''),
+            'order_id': order['id']
+        })
+
+        previous = order['filled_quantity']
+        order['filled_quantity'] = previous + quantity
+        order['avg_fill_price'] = ((order['avg_fill_price'] or 0) * previous + value) / order['filled_quantity']
+        order['status'] = 'filled' if order['filled_quantity'] >= order['quantity'] else 'partially_filled'
+        storage.update_order(conn, order)
+        return quantity
+
+    def _quote_price(self, quote, side):
+        """Get the price an order on the given side would trade at from a quote"""
+        if not quote:
+            return None
+        price = quote.get('ask') if side == 'buy' else quote.get('bid')
+        if not price:
+            price = quote.get('price')
+        return price or None
+
+    def _last_close(self, symbol):
+        """Get the latest bar's close as a fallback market price (None rather than sample data)"""
+        bar = self.data_fetcher.get_latest_bars([symbol]).get(symbol)
+        if bar and bar['close']:
+            return float(bar['close'])
+        return None
+
+    def _crosses(self, side, limit_price, price):
+        """Check whether a limit order is marketable at a price"""
+        if side == 'buy':
+            return price <= limit_price
+        return price >= limit_price
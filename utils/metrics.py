@@ -0,0 +1,509 @@
+import os
+import time
+import uuid
+import socket
+import random
+import logging
+import threading
+from types import GeneratorType
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram bucket bounds in seconds, shared by routes and Alpaca calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Each process saves its metrics every METRICS_FLUSH_INTERVAL seconds and a
+# scrape merges every process's snapshot. A snapshot not saved for
+# METRICS_STALE_SECONDS (longer than gunicorn's worker timeout, so a live
+# worker is never mistaken for an exited one) is folded into the archive.
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+METRICS_STALE_SECONDS = float(os.getenv('METRICS_STALE_SECONDS', 300))
+ARCHIVE_OWNER = 'exited'
+
+# Sampled profiling: a METRICS_PROFILE_RATE fraction of requests run under
+# cProfile, and those taking at least METRICS_PROFILE_THRESHOLD seconds are
+# saved to METRICS_PROFILE_DIR (the newest METRICS_PROFILE_KEEP are kept).
+# Off unless a rate is set.
+METRICS_PROFILE_RATE = float(os.getenv('METRICS_PROFILE_RATE', 0))
+METRICS_PROFILE_THRESHOLD = float(os.getenv('METRICS_PROFILE_THRESHOLD', 1.0))
+METRICS_PROFILE_DIR = os.getenv('METRICS_PROFILE_DIR', os.path.join('data', 'profiles'))
+METRICS_PROFILE_KEEP = int(os.getenv('METRICS_PROFILE_KEEP', 50))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric:
+    """
+    A named family of samples, one per combination of label values
+
+    Counters and gauges hold a number per sample; histograms hold per-bucket
+    counts followed by the sum and count of observations.
+    """
+
+    def __init__(self, kind, name, help_text, labels=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if buckets else None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        """Add to a counter or gauge sample"""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        """Subtract from a gauge sample"""
+        self.inc(*labels, amount=-amount)
+
+    def observe(self, *labels, value):
+        """Record one observation in a histogram sample"""
+        index = _bucket_index(self.buckets, value)
+        with self._lock:
+            sample = self._values.get(labels)
+            if sample is None:
+                sample = self._values[labels] = [0] * (len(self.buckets) + 3)
+            sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    def snapshot(self):
+        """Get the family as a JSON-serialisable dict"""
+        with self._lock:
+            samples = [[list(labels), list(value) if isinstance(value, list) else value]
+                       for labels, value in self._values.items()]
+        return _family(self.kind, self.help, self.labels, samples, self.buckets)
+
+
+def _bucket_index(buckets, value):
+    """Index of the first bucket bound at or above value; len(buckets) is +Inf"""
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return index
+    return len(buckets)
+
+
+def _family(kind, help_text, labels, samples, buckets=None):
+    family = {'type': kind, 'help': help_text, 'labels': list(labels), 'samples': samples}
+    if buckets:
+        family['buckets'] = list(buckets)
+    return family
+
+
+_metrics = []
+_collectors = []
+
+
+def counter(name, help_text, labels=()):
+    """Declare a counter"""
+    metric = Metric('counter', name, help_text, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def gauge(name, help_text, labels=()):
+    """Declare a gauge"""
+    metric = Metric('gauge', name, help_text, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    """Declare a histogram"""
+    metric = Metric('histogram', name, help_text, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collector):
+    """
+    Add a function called on every snapshot to report counters kept elsewhere
+
+    Args:
+        collector (callable): Returns a dict of metric name -> family dict
+            (see _family), for stats that already live on other objects
+    """
+    _collectors.append(collector)
+
+
+HTTP_REQUESTS = counter('algoblocks_http_requests_total', 'HTTP requests by route, method and status',
+                        ('route', 'method', 'status'))
+HTTP_LATENCY = histogram('algoblocks_http_request_duration_seconds', 'HTTP request latency by route',
+                         ('route', 'method'))
+HTTP_IN_FLIGHT = gauge('algoblocks_http_requests_in_flight', 'HTTP requests being served by route', ('route',))
+ALPACA_CALLS = counter('algoblocks_alpaca_calls_total', 'Alpaca API calls by method and outcome',
+                       ('method', 'outcome'))
+ALPACA_LATENCY = histogram('algoblocks_alpaca_call_duration_seconds', 'Alpaca API call latency by method',
+                           ('method',))
+PROFILES_SAVED = counter('algoblocks_profiles_saved_total', 'Slow request profiles saved by route', ('route',))
+
+
+def snapshot():
+    """
+    Get this process's metrics, including collected stats
+
+    Returns:
+        dict: Metric name -> family dict
+    """
+    families = {metric.name: metric.snapshot() for metric in _metrics}
+    for collector in _collectors:
+        try:
+            families.update(collector())
+        except Exception as e:
+            logger.error(f"Error collecting metrics from {collector.__name__}: {str(e)}")
+    return families
+
+
+def merge(snapshots, gauges=True):
+    """
+    Add up the samples of several snapshots
+
+    Args:
+        snapshots (list): Snapshot dicts
+        gauges (bool): Keep gauges; they are dropped for processes that exited
+
+    Returns:
+        dict: Merged snapshot
+    """
+    merged = {}
+    totals = {}
+    for snap in snapshots:
+        if not snap:
+            continue
+        for name, family in snap.items():
+            if family['type'] == 'gauge' and not gauges:
+                continue
+            if name not in merged:
+                merged[name] = dict(family, samples=[])
+                totals[name] = {}
+            values = totals[name]
+            for labels, value in family['samples']:
+                key = tuple(labels)
+                if key not in values:
+                    values[key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    values[key] = [a + b for a, b in zip(values[key], value)]
+                else:
+                    values[key] += value
+    for name, values in totals.items():
+        merged[name]['samples'] = [[list(labels), value] for labels, value in values.items()]
+    return merged
+
+
+def _fold(archive, snapshots):
+    """Fold exited processes' snapshots into the archive, keeping only counters and histograms"""
+    return merge([archive] + snapshots, gauges=False)
+
+
+_owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_owner_pid = os.getpid()
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def _process_owner():
+    """Identifier for this process's snapshot; forked workers get their own"""
+    global _owner, _owner_pid
+    if _owner_pid != os.getpid():
+        _owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        _owner_pid = os.getpid()
+        # Counts inherited from the parent were already reported by it
+        for metric in _metrics:
+            with metric._lock:
+                metric._values.clear()
+    return _owner
+
+
+def flush():
+    """Save this process's snapshot so scrapes served by other processes include it"""
+    from utils import storage
+    try:
+        storage.save_metric_snapshot(_process_owner(), snapshot())
+    except Exception as e:
+        logger.error(f"Error saving metrics: {str(e)}")
+
+
+def start_flusher(interval=METRICS_FLUSH_INTERVAL):
+    """Start the thread saving this process's metrics every interval seconds, once per process"""
+    global _flusher_pid
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    _process_owner()
+
+    def run():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    threading.Thread(target=run, name='metrics-flusher', daemon=True).start()
+
+
+def collect():
+    """
+    Get the metrics of every server process, merged
+
+    Saves this process's snapshot first so the scrape is current for it;
+    other processes' are at most METRICS_FLUSH_INTERVAL seconds old.
+
+    Returns:
+        dict: Merged snapshot
+    """
+    from utils import storage
+    flush()
+    snapshots = storage.collect_metric_snapshots(time.time() - METRICS_STALE_SECONDS, ARCHIVE_OWNER, _fold)
+    return merge(snapshots)
+
+
+def render(families):
+    """
+    Format a snapshot in the Prometheus text exposition format
+
+    Args:
+        families (dict): Metric name -> family dict
+
+    Returns:
+        str: Exposition text
+    """
+    families = dict(families)
+    families.update(_cache_ratios(families))
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        label_names = family['labels']
+        for labels, value in sorted(family['samples'], key=lambda sample: [str(v) for v in sample[0]]):
+            pairs = list(zip(label_names, labels))
+            if family['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(family['buckets'] + ['+Inf'], value[:-2]):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(pairs)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+def _cache_ratios(families):
+    """Derive hit ratio gauges from the merged data cache counters"""
+    family = families.get('algoblocks_data_cache_requests_total')
+    if not family:
+        return {}
+    counts = {}
+    for (cache, result), value in family['samples']:
+        hits, total = counts.get(cache, (0, 0))
+        counts[cache] = (hits + (value if result == 'hit' else 0), total + value)
+    samples = [[[cache], hits / total] for cache, (hits, total) in counts.items() if total]
+    return {'algoblocks_data_cache_hit_ratio': _family(
+        'gauge', 'Share of market data cache lookups served from the cache', ('cache',), samples)}
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class InstrumentedClient:
+    """
+    Proxy that counts and times every method call on an upstream API client
+
+    Calls are labelled by method name, so get_bars, get_clock, list_assets and
+    the rest each get their own call counts, error counts and latency
+    histogram. Methods returning generators (get_bars_iter) are timed until
+    the generator is consumed. Attributes that are not methods pass through
+    untouched.
+    """
+
+    def __init__(self, client):
+        object.__setattr__(self, '_client', client)
+        object.__setattr__(self, '_wrapped', {})
+
+    def __getattr__(self, name):
+        wrapped = self._wrapped.get(name)
+        if wrapped is not None:
+            return wrapped
+        attribute = getattr(self._client, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+            except Exception:
+                ALPACA_CALLS.inc(name, 'error')
+                ALPACA_LATENCY.observe(name, value=time.perf_counter() - start)
+                raise
+            if isinstance(result, GeneratorType):
+                return _timed_iteration(name, result, start)
+            ALPACA_CALLS.inc(name, 'ok')
+            ALPACA_LATENCY.observe(name, value=time.perf_counter() - start)
+            return result
+
+        self._wrapped[name] = call
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
+
+    def __repr__(self):
+        return f"<InstrumentedClient {self._client!r}>"
+
+
+def _timed_iteration(name, iterator, start):
+    """Yield from an upstream generator, recording the call once it is consumed or closed"""
+    outcome = 'error'
+    try:
+        yield from iterator
+        outcome = 'ok'
+    except GeneratorExit:
+        outcome = 'ok'
+        raise
+    finally:
+        ALPACA_CALLS.inc(name, outcome)
+        ALPACA_LATENCY.observe(name, value=time.perf_counter() - start)
+
+
+_profile_lock = threading.Lock()
+
+
+def init_app(app):
+    """
+    Record latency, status and in-flight counts for every request to an app
+
+    Requests are labelled by their URL rule (e.g. /api/orders/<order_id>),
+    not the raw path, so the number of series stays bounded; unmatched paths
+    share the 'unmatched' label.
+
+    Args:
+        app (Flask): App to instrument
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_request_metrics():
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.metrics_route = route
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(route)
+        if METRICS_PROFILE_RATE and random.random() < METRICS_PROFILE_RATE and _profile_lock.acquire(blocking=False):
+            # One profile at a time per process; cProfile only sees this request's thread
+            import cProfile
+            g.metrics_profile = cProfile.Profile()
+            g.metrics_profile.enable()
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        route = g.pop('metrics_route', None)
+        if route is None:
+            return
+        elapsed = time.perf_counter() - g.pop('metrics_start')
+        status = g.pop('metrics_status', 500)
+        HTTP_IN_FLIGHT.dec(route)
+        HTTP_REQUESTS.inc(route, request.method, str(status))
+        HTTP_LATENCY.observe(route, request.method, value=elapsed)
+        profile = g.pop('metrics_profile', None)
+        if profile is not None:
+            profile.disable()
+            _profile_lock.release()
+            if elapsed >= METRICS_PROFILE_THRESHOLD:
+                _save_profile(profile, route, request.method, elapsed)
+
+
+def _save_profile(profile, route, method, elapsed):
+    """Write a slow request's profile and drop the oldest beyond METRICS_PROFILE_KEEP"""
+    try:
+        os.makedirs(METRICS_PROFILE_DIR, exist_ok=True)
+        slug = ''.join(c if c.isalnum() else '_' for c in route).strip('_') or 'root'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{method}-{slug}-{int(elapsed * 1000)}ms.prof"
+        path = os.path.join(METRICS_PROFILE_DIR, name)
+        profile.dump_stats(path)
+        PROFILES_SAVED.inc(route)
+        logger.warning(f"Saved profile of {method} {route} ({elapsed:.2f}s) to {path}")
+        for old in list_profiles()[METRICS_PROFILE_KEEP:]:
+            os.remove(os.path.join(METRICS_PROFILE_DIR, old['name']))
+    except Exception as e:
+        logger.error(f"Error saving profile of {route}: {str(e)}")
+
+
+def list_profiles():
+    """
+    Get the saved slow request profiles, newest first
+
+    Returns:
+        list: Dicts with 'name', 'size' and 'saved_at' (epoch seconds)
+    """
+    if not os.path.isdir(METRICS_PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.scandir(METRICS_PROFILE_DIR):
+        if entry.is_file() and entry.name.endswith('.prof'):
+            stat = entry.stat()
+            profiles.append({'name': entry.name, 'size': stat.st_size, 'saved_at': stat.st_mtime})
+    return sorted(profiles, key=lambda profile: profile['saved_at'], reverse=True)
+
+
+def _collect_services():
+    """Report the stats already kept by the admission pools, caches and event broker"""
+    from utils import admission, event_broker, services
+    from utils.content_cache import get_content_cache
+
+    families = {}
+    pools = admission.get_stats()
+    outcomes = ('admitted', 'queued', 'completed', 'timed_out', 'rejected_rate', 'rejected_user', 'rejected_queue')
+    families['algoblocks_admission_requests_total'] = _family(
+        'counter', 'Capacity pool decisions by pool and outcome', ('pool', 'outcome'),
+        [[[pool, outcome], stats[outcome]] for pool, stats in pools.items() for outcome in outcomes])
+    for field, help_text in (('wait_seconds', 'Seconds requests spent queued'),
+                             ('service_seconds', 'Seconds requests held a slot')):
+        families[f'algoblocks_admission_{field}_total'] = _family(
+            'counter', f"{help_text} by pool", ('pool',), [[[pool], stats[field]] for pool, stats in pools.items()])
+    for field in ('active', 'waiting', 'capacity'):
+        families[f'algoblocks_admission_{field}'] = _family(
+            'gauge', f"Capacity pool {field.replace('_', ' ')} by pool", ('pool',),
+            [[[pool], stats[field]] for pool, stats in pools.items()])
+
+    content = dict(get_content_cache().stats)
+    families['algoblocks_content_cache_events_total'] = _family(
+        'counter', 'Tutorial content cache lookups by result', ('result',),
+        [[[result], count] for result, count in content.items()])
+
+    broker = dict(event_broker.get_broker().stats)
+    families['algoblocks_events_total'] = _family(
+        'counter', 'Event broker messages by outcome', ('outcome',),
+        [[[outcome], broker[outcome]] for outcome in ('published', 'delivered', 'dropped', 'rejected')])
+    families['algoblocks_event_streams'] = _family('gauge', 'Open event streams', (), [[[], broker['streams']]])
+
+    # The data fetcher is only reported once built, so a scrape never imports pandas
+    fetcher = services.peek('data_fetcher')
+    if fetcher is not None:
+        families['algoblocks_data_cache_requests_total'] = _family(
+            'counter', 'Market data cache lookups by cache and result', ('cache', 'result'),
+            [[[cache, result], count] for cache, counts in fetcher.cache_stats().items()
+             for result, count in counts.items()])
+    return families
+
+
+register_collector(_collect_services)
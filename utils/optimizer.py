@@ -0,0 +1,398 @@
+import copy
+import math
+import time
+import random
+import logging
+from utils import indicators
+from utils.strategy_compiler import rule_numbers, rewrite_rule
+
+logger = logging.getLogger(__name__)
+
+# Metrics a search can optimize, and whether larger values are better
+OBJECTIVES = {
+    'sharpe_ratio': True,
+    'total_return': True,
+    'final_equity': True,
+    'max_drawdown': False
+}
+
+# Default budget, in backtests over the full range (a backtest over a third of
+# the bars costs a third), and default wall-clock limit in seconds
+DEFAULT_MAX_EVALUATIONS = 60
+DEFAULT_TIME_BUDGET = 20.0
+
+# Each rung keeps the best 1/ETA candidates and tests them on ETA times more bars
+ETA = 3
+
+# Bounds on the number of rungs; the shortest window keeps at least MIN_WINDOW_BARS bars
+MAX_RUNGS = 4
+MIN_WINDOW_BARS = 40
+
+# Share of each bracket after the first spent refining the best candidates so far
+EXPLOIT_FRACTION = 0.5
+
+# Number of finished candidates kept in the leaderboard
+LEADERBOARD_SIZE = 10
+
+# Steps a float range is divided into when no step is given
+FLOAT_STEPS = 20
+
+RULE_SIDES = ('entry_rules', 'exit_rules')
+
+
+class Parameter:
+    """One tunable value: an integer or float range, or a list of choices"""
+
+    __slots__ = ('key', 'default', 'low', 'high', 'step', 'integer', 'values')
+
+    def __init__(self, key, default, low=None, high=None, step=None, values=None):
+        """
+        Initialize the parameter
+
+        Args:
+            key (str): Parameter key (see ParameterSpace)
+            default: Value in the original strategy
+            low, high: Range bounds, used when values is None
+            step: Grid spacing of the range (1 for integer ranges)
+            values (list): Explicit choices
+        """
+        self.key = key
+        self.default = default
+        self.values = list(values) if values is not None else None
+        if self.values is None:
+            if low is None or high is None or low > high:
+                raise ValueError(f"Parameter '{key}' needs min <= max")
+            self.integer = all(isinstance(bound, int) for bound in (low, high)) and (step is None or isinstance(step, int))
+            self.low = int(low) if self.integer else float(low)
+            self.high = int(high) if self.integer else float(high)
+            self.step = step or (1 if self.integer else (self.high - self.low) / FLOAT_STEPS or 1.0)
+        else:
+            if not self.values:
+                raise ValueError(f"Parameter '{key}' needs at least one value")
+            self.integer = False
+            self.low = self.high = self.step = None
+
+    @property
+    def count(self):
+        """Number of grid points"""
+        if self.values is not None:
+            return len(self.values)
+        return int(math.floor((self.high - self.low) / self.step + 1e-9)) + 1
+
+    def sample(self, rng):
+        """Draw a grid point uniformly"""
+        if self.values is not None:
+            return rng.choice(self.values)
+        return self._snap(self.low + rng.randrange(self.count) * self.step)
+
+    def neighbor(self, value, rng, scale):
+        """Draw a grid point near value, at a typical distance of scale times the range"""
+        if self.values is not None:
+            return rng.choice(self.values) if rng.random() < scale else value
+        moved = value + rng.gauss(0, scale * (self.high - self.low + self.step))
+        return self._snap(min(max(moved, self.low), self.high))
+
+    def describe(self):
+        """Get the parameter as a JSON-serializable dict"""
+        if self.values is not None:
+            return {'key': self.key, 'default': self.default, 'values': self.values}
+        return {'key': self.key, 'default': self.default, 'min': self.low, 'max': self.high, 'step': self.step}
+
+    def _snap(self, value):
+        steps = round((value - self.low) / self.step)
+        value = self.low + steps * self.step
+        return int(value) if self.integer else round(value, 10)
+
+
+class ParameterSpace:
+    """
+    The tunable parameters of a strategy and how to apply a choice of them
+
+    Keys are "indicators.<i>.<parameter>" for indicator parameters (e.g.
+    "indicators.0.period") and "<side>_rules.<j>.<k>" for the k-th numeric
+    constant of a rule (e.g. the 30 in "RSI_14 < 30", or a block condition's
+    value). Rules are rewritten to read the renamed indicator columns, so
+    tuning SMA 20 to 35 turns "close > SMA_20" into "close > SMA_35".
+
+    By default every numeric indicator parameter ranges from half to twice its
+    value (at least 2) and every nonzero rule constant from half to one and a
+    half times its value. Overrides map keys to {'min', 'max', 'step'},
+    {'values': [...]}, or None to keep the original value.
+    """
+
+    def __init__(self, strategy, overrides=None):
+        """
+        Build the space for a strategy
+
+        Args:
+            strategy (dict): Strategy configuration with indicators and rules
+            overrides (dict): Key -> range specification, see above
+
+        Raises:
+            ValueError: If an override names an unknown key or has an invalid range
+        """
+        self.strategy = strategy
+        candidates = {}
+        for i, config in enumerate(strategy.get('indicators') or []):
+            indicator = indicators.get_indicator(config.get('type'))
+            if indicator is None:
+                continue
+            for name, value in indicator.resolve(config.get('parameters')).items():
+                candidates[f"indicators.{i}.{name}"] = value
+        for side in RULE_SIDES:
+            for j, rule in enumerate(strategy.get(side) or []):
+                for k, value in enumerate(rule_numbers(rule)):
+                    candidates[f"{side}.{j}.{k}"] = int(value) if value.is_integer() else value
+
+        overrides = overrides or {}
+        unknown = [key for key in overrides if key not in candidates]
+        if unknown:
+            raise ValueError(f"Unknown parameter '{unknown[0]}'; tunable keys are {sorted(candidates)}")
+
+        self.parameters = []
+        for key, default in candidates.items():
+            if key in overrides:
+                spec = overrides[key]
+                if spec is None:
+                    continue
+                if not isinstance(spec, dict):
+                    raise ValueError(f"Parameter '{key}' must be an object with min/max or values")
+                self.parameters.append(Parameter(key, default, spec.get('min'), spec.get('max'),
+                                                 spec.get('step'), spec.get('values')))
+            else:
+                parameter = self._default_parameter(key, default)
+                if parameter is not None:
+                    self.parameters.append(parameter)
+
+    def _default_parameter(self, key, default):
+        if isinstance(default, bool) or not isinstance(default, (int, float)) or default == 0:
+            return None
+        if key.startswith('indicators.'):
+            if isinstance(default, int):
+                return Parameter(key, default, max(2, default // 2), max(2, default * 2))
+            return Parameter(key, default, default / 2, default * 2)
+        low, high = sorted((default * 0.5, default * 1.5))
+        if isinstance(default, int):
+            return Parameter(key, default, int(round(low)), int(round(high)))
+        return Parameter(key, default, low, high)
+
+    @property
+    def grid_size(self):
+        """Number of points an exhaustive grid over the space would test"""
+        size = 1
+        for parameter in self.parameters:
+            size *= parameter.count
+        return size
+
+    def defaults(self):
+        """Get the original strategy's values"""
+        return {parameter.key: parameter.default for parameter in self.parameters}
+
+    def upper_bounds(self):
+        """Get every range at its maximum, which needs the longest warmup"""
+        return {parameter.key: (parameter.high if parameter.values is None else parameter.default)
+                for parameter in self.parameters}
+
+    def sample(self, rng):
+        """Draw a random valid point, or None if none was found"""
+        for _ in range(20):
+            values = {parameter.key: parameter.sample(rng) for parameter in self.parameters}
+            if self.is_valid(values):
+                return values
+        return None
+
+    def neighbor(self, values, rng, scale=0.15):
+        """Draw a valid point near values, or None if none was found"""
+        for _ in range(20):
+            moved = dict(values)
+            for parameter in self.parameters:
+                if rng.random() < 0.5:
+                    moved[parameter.key] = parameter.neighbor(values[parameter.key], rng, scale)
+            if moved != values and self.is_valid(moved):
+                return moved
+        return None
+
+    def is_valid(self, values):
+        """Check that every indicator accepts its parameters (e.g. MACD fast < slow)"""
+        for config in self.apply(self.strategy, values).get('indicators') or []:
+            indicator = indicators.get_indicator(config.get('type'))
+            if indicator is not None and not indicator.is_valid(indicator.resolve(config.get('parameters'))):
+                return False
+        return True
+
+    def apply(self, strategy, values):
+        """
+        Get a copy of a strategy with parameter values filled in
+
+        Args:
+            strategy (dict): Strategy the space was built from
+            values (dict): Key -> value
+
+        Returns:
+            dict: Concrete strategy configuration
+        """
+        concrete = copy.deepcopy(strategy)
+        names = {}
+        by_indicator = {}
+        by_rule = {}
+        for key, value in values.items():
+            section, index, name = key.split('.', 2)
+            if section == 'indicators':
+                by_indicator.setdefault(int(index), {})[name] = value
+            else:
+                by_rule.setdefault((section, int(index)), {})[int(name)] = value
+
+        for i, updates in by_indicator.items():
+            config = concrete['indicators'][i]
+            before = indicators.output_columns(config)
+            config['parameters'] = dict(config.get('parameters') or {}, **updates)
+            names.update({old: new for old, new in zip(before, indicators.output_columns(config)) if old != new})
+
+        for side in RULE_SIDES:
+            rules = concrete.get(side) or []
+            for j, rule in enumerate(rules):
+                numbers = by_rule.get((side, j))
+                if names or numbers:
+                    rules[j] = rewrite_rule(rule, names, numbers)
+        return concrete
+
+    def describe(self):
+        """Get the space as a list of JSON-serializable dicts"""
+        return [parameter.describe() for parameter in self.parameters]
+
+
+class SuccessiveHalving:
+    """
+    Budgeted search for the best parameters by successive halving
+
+    Each bracket draws a batch of candidates and tests them on the shortest
+    bar window, keeps the best 1/eta, tests those on a window eta times
+    longer, and so on until the survivors run on the full range. Most
+    candidates are dropped after a cheap test on a small share of the bars.
+    The first bracket samples at random; later ones split their candidates
+    between fresh random points and neighbors of the best full-range results
+    so far. The search stops when the evaluation or time budget is spent or
+    no untested candidates remain.
+    """
+
+    def __init__(self, space, evaluate, costs, objective='sharpe_ratio', eta=ETA,
+                 max_evaluations=DEFAULT_MAX_EVALUATIONS, time_budget=DEFAULT_TIME_BUDGET, seed=None):
+        """
+        Initialize the search
+
+        Args:
+            space (ParameterSpace): Space to search
+            evaluate (callable): (list of value dicts, rung) -> list of results, each
+                with the objective as an attribute and an 'error' attribute (None if it ran)
+            costs (list): Share of the full range each rung's window covers, ending with 1
+            objective (str): Result attribute to optimize, one of OBJECTIVES
+            eta (int): Reduction factor between rungs
+            max_evaluations (float): Budget in full-range evaluations
+            time_budget (float): Seconds the search may run
+            seed (int): Random seed for reproducible searches
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Objective must be one of {sorted(OBJECTIVES)}")
+        self.space = space
+        self.evaluate = evaluate
+        self.costs = costs
+        self.objective = objective
+        self.eta = eta
+        self.max_evaluations = max_evaluations
+        self.time_budget = time_budget
+        self.rng = random.Random(seed)
+        self.bracket_size = eta ** len(costs)
+        self.stats = {'evaluations': 0, 'cost': 0.0, 'brackets': 0, 'stopped': None}
+        self.leaderboard = []  # (score, values, result) of full-range evaluations, best first
+        self._seen = set()
+
+    def score(self, result):
+        """Score a result, larger is better; None for results that did not run"""
+        if result is None or result.error:
+            return None
+        value = getattr(result, self.objective)
+        return value if OBJECTIVES[self.objective] else -value
+
+    def run(self):
+        """
+        Search until a budget is spent
+
+        Returns:
+            list: Leaderboard of (score, values, result), best first
+        """
+        started = time.monotonic()
+        best_partial = None
+        while self.stats['stopped'] is None:
+            candidates = self._propose()
+            if not candidates:
+                self.stats['stopped'] = 'exhausted'
+                break
+            self.stats['brackets'] += 1
+            for rung, cost in enumerate(self.costs):
+                if time.monotonic() - started >= self.time_budget:
+                    self.stats['stopped'] = 'time'
+                    break
+                affordable = int((self.max_evaluations - self.stats['cost']) / cost + 1e-9)
+                if affordable <= 0:
+                    self.stats['stopped'] = 'budget'
+                    break
+                candidates = candidates[:affordable]
+                scored = self._evaluate(candidates, rung)
+                if not scored:
+                    break
+                if rung == len(self.costs) - 1:
+                    self._record(scored)
+                else:
+                    if best_partial is None or rung > best_partial[3] or \
+                            (rung == best_partial[3] and scored[0][0] > best_partial[0]):
+                        best_partial = scored[0] + (rung,)
+                    candidates = [values for _, values, _ in scored[:max(1, len(scored) // self.eta)]]
+
+        # Always report a full-range result, for the best candidate seen or the original strategy
+        if not self.leaderboard:
+            values = best_partial[1] if best_partial is not None else self.space.defaults()
+            self._record(self._evaluate([values], len(self.costs) - 1))
+        self.stats['elapsed'] = round(time.monotonic() - started, 3)
+        logger.info(f"Parameter search finished ({self.stats['stopped']}): {self.stats['evaluations']} evaluations "
+                    f"costing {self.stats['cost']:.1f} full runs in {self.stats['elapsed']}s")
+        return self.leaderboard
+
+    def _evaluate(self, candidates, rung):
+        """Evaluate candidates on a rung's window; return (score, values, result) best first"""
+        results = self.evaluate(candidates, rung)
+        self.stats['evaluations'] += len(candidates)
+        self.stats['cost'] += len(candidates) * self.costs[rung]
+        scored = [(self.score(result), values, result) for values, result in zip(candidates, results)]
+        scored = [entry for entry in scored if entry[0] is not None]
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        return scored
+
+    def _record(self, scored):
+        self.leaderboard.extend(scored)
+        self.leaderboard.sort(key=lambda entry: entry[0], reverse=True)
+        del self.leaderboard[LEADERBOARD_SIZE:]
+
+    def _propose(self):
+        """Draw the next bracket's untested candidates"""
+        candidates = []
+        if not self._seen:
+            # Start from the strategy as written
+            candidates.append(self.space.defaults())
+            self._seen.add(tuple(sorted(candidates[0].items())))
+        exploit = int(self.bracket_size * EXPLOIT_FRACTION) if self.leaderboard else 0
+        attempts = 0
+        while len(candidates) < self.bracket_size and attempts < 20 * self.bracket_size:
+            attempts += 1
+            if len(candidates) < exploit:
+                _, parent, _ = self.leaderboard[self.rng.randrange(min(len(self.leaderboard), self.eta))]
+                values = self.space.neighbor(parent, self.rng)
+            else:
+                values = self.space.sample(self.rng)
+            if values is None:
+                continue
+            key = tuple(sorted(values.items()))
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            candidates.append(values)
+        return candidates
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+# One OHLCV bar per row (48 bytes, against several hundred for a dict with a
+# formatted time string). Times are epoch seconds of the bar's start (true UTC
+# instants). Naive times on either side of them -- date strings, frame indexes,
+# formatted API times -- are exchange wall-clock: a daily bar formats as its
+# date at 00:00 and a date string compares as midnight in New York.
+BAR_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8')
+])
+
+# One simulated trade per row; side is BUY or SELL
+TRADE_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('side', 'i1'),
+    ('price', '<f8'),
+    ('shares', '<i8'),
+    ('value', '<f8')
+])
+
+BUY = 1
+SELL = -1
+SIDE_NAMES = {BUY: 'BUY', SELL: 'SELL'}
+
+BAR_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+TRADE_TIME_FORMAT = '%Y-%m-%d'
+
+EXCHANGE_TZ = 'America/New_York'
+
+
+def epoch_seconds(value):
+    """Convert a date string, datetime or Timestamp to epoch seconds, taking naive values as exchange time"""
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        # Ambiguous fall-back wall-clock times are read as standard time
+        timestamp = timestamp.tz_localize(EXCHANGE_TZ, ambiguous=False, nonexistent='shift_forward')
+    return timestamp.value // 10**9
+
+
+def index_seconds(index):
+    """Convert a DatetimeIndex to an array of epoch seconds, taking naive values as exchange time"""
+    if index.tz is None:
+        index = index.tz_localize(EXCHANGE_TZ, ambiguous=np.zeros(len(index), dtype=bool), nonexistent='shift_forward')
+    return index.tz_convert('UTC').tz_localize(None).values.astype('datetime64[s]').astype(np.int64)
+
+
+def exchange_index(times):
+    """Convert an array of epoch seconds to a naive DatetimeIndex of exchange wall-clock times"""
+    return pd.to_datetime(times, unit='s', utc=True).tz_convert(EXCHANGE_TZ).tz_localize(None)
+
+
+def format_time(seconds, time_format=BAR_TIME_FORMAT):
+    """Format one epoch second count as an exchange time string"""
+    return pd.Timestamp(int(seconds), unit='s', tz='UTC').tz_convert(EXCHANGE_TZ).strftime(time_format)
+
+
+def format_times(times, time_format=BAR_TIME_FORMAT):
+    """Format an array of epoch seconds as exchange time strings"""
+    return exchange_index(times).strftime(time_format).tolist()
+
+
+def bars_from_frame(df):
+    """
+    Pack a bar frame into a bar array
+
+    Args:
+        df (DataFrame): Bars with open/high/low/close/volume columns, indexed by time
+
+    Returns:
+        ndarray: Bars as BAR_DTYPE records
+    """
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    bars['time'] = index_seconds(df.index)
+    for field in ('open', 'high', 'low', 'close', 'volume'):
+        bars[field] = df[field].to_numpy()
+    return bars
+
+
+def bars_to_frame(bars):
+    """
+    Unpack a bar array into a frame for indicator and resampling work
+
+    Args:
+        bars (ndarray): Bars as BAR_DTYPE records
+
+    Returns:
+        DataFrame: Bars indexed by naive wall-clock time
+    """
+    index = pd.DatetimeIndex(exchange_index(bars['time']), name='time')
+    return pd.DataFrame({field: bars[field] for field in ('open', 'high', 'low', 'close', 'volume')}, index=index)
+
+
+def bars_to_records(bars):
+    """
+    Convert a bar array to the list-of-dicts format returned by the API routes
+
+    Only call this at the JSON boundary; everything else works on the array.
+
+    Args:
+        bars (ndarray): Bars as BAR_DTYPE records
+
+    Returns:
+        list: Bar dictionaries with formatted times
+    """
+    columns = [format_times(bars['time'])] + [bars[field].tolist() for field in ('open', 'high', 'low', 'close', 'volume')]
+    keys = ('time', 'open', 'high', 'low', 'close', 'volume')
+    return [dict(zip(keys, row)) for row in zip(*columns)]
+
+
+def trades_to_records(trades):
+    """
+    Convert a trade array to the trade dictionaries returned by the backtest API
+
+    Args:
+        trades (ndarray): Trades as TRADE_DTYPE records
+
+    Returns:
+        list: Trade dictionaries with 'date', 'type', 'price', 'shares' and 'value'
+    """
+    dates = format_times(trades['time'], TRADE_TIME_FORMAT)
+    sides = [SIDE_NAMES[side] for side in trades['side'].tolist()]
+    return [
+        {'date': date, 'type': side, 'price': price, 'shares': shares, 'value': value}
+        for date, side, price, shares, value
+        in zip(dates, sides, trades['price'].tolist(), trades['shares'].tolist(), trades['value'].tolist())
+    ]
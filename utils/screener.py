@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from utils import indicators, storage
+from utils.data_fetcher import TRADING_DAYS_PER_YEAR, WARMUP_SLACK_DAYS
+from utils.records import format_time
+from utils.strategy_compiler import StrategyCompileError, compile_strategy
+
+logger = logging.getLogger(__name__)
+
+# Daily bars kept per symbol: enough for a 200-day average with its rules,
+# or a MACD with its full warmup
+SCREENER_HISTORY_BARS = int(os.getenv('SCREENER_HISTORY_BARS', 300))
+
+# The store is refreshed in the background once it is older than this
+SCREENER_REFRESH_SECONDS = int(os.getenv('SCREENER_REFRESH_SECONDS', 900))
+
+# Calendar days re-fetched before the latest stored session on each refresh,
+# covering long weekends and replacing a session bar that was still forming
+SCREENER_OVERLAP_DAYS = 7
+
+# Symbols per multi-symbol bar request, and requests in flight at once
+SCREENER_BATCH_SIZE = int(os.getenv('SCREENER_BATCH_SIZE', 200))
+SCREENER_FETCH_WORKERS = int(os.getenv('SCREENER_FETCH_WORKERS', 4))
+
+SCREENER_STORE_DIR = os.getenv('SCREENER_STORE_DIR', os.path.join('data', 'universe'))
+
+# Matches returned by one scan
+SCREENER_MAX_MATCHES = 1000
+
+# One process refreshes the store at a time; the others pick up its files
+REFRESH_LEASE = 'screener-refresh'
+REFRESH_LEASE_TTL = 1800
+
+# Seconds a client is asked to wait while the first refresh fills the store
+WARMUP_RETRY_AFTER = 30
+
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class UniverseNotReady(Exception):
+    """Raised while the store has no bars yet because its first refresh is still running"""
+
+    def __init__(self, retry_after=WARMUP_RETRY_AFTER):
+        super().__init__("The screener is still loading market data, try again shortly")
+        self.retry_after = retry_after
+
+
+class Universe:
+    """
+    One version of the universe store
+
+    Rows are symbols and columns are daily bars, right-aligned so every row
+    ends with its symbol's latest bar; rows with a shorter history are NaN
+    at the front, which the kernels treat as missing bars.
+    """
+
+    def __init__(self, symbols, last_time, counts, columns, updated_at):
+        """
+        Initialize the universe
+
+        Args:
+            symbols (ndarray): Symbol per row, sorted
+            last_time (ndarray): Epoch seconds of each row's latest bar
+            counts (ndarray): Bars held per row
+            columns (ndarray): open/high/low/close/volume x symbols x bars (memory-mapped, read-only)
+            updated_at (float): Epoch seconds of the refresh that wrote this version
+        """
+        self.symbols = symbols
+        self.last_time = last_time
+        self.counts = counts
+        self.columns = columns
+        self.updated_at = updated_at
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @property
+    def history(self):
+        """Bars per row"""
+        return self.columns.shape[2]
+
+    @property
+    def as_of(self):
+        """Epoch seconds of the latest session in the store"""
+        return int(self.last_time.max()) if len(self) else None
+
+    def column(self, field):
+        """Get one bar field as a symbols x bars matrix"""
+        return self.columns[BAR_FIELDS.index(field)]
+
+
+class UniverseStore:
+    """
+    Daily bars of the whole universe kept on disk as memory-mapped matrices
+
+    A refresh writes a new data file and then swaps in the small metadata file
+    naming it, so readers in every process always see a complete version.
+    Mapped files live in the page cache, so all workers share one copy.
+    """
+
+    # Data files kept, so a reader that has just read the metadata can still open the file it names
+    KEEP_VERSIONS = 2
+
+    def __init__(self, directory=SCREENER_STORE_DIR):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, 'universe.json')
+        self._loaded = None  # (metadata mtime, Universe)
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Get the current universe, remapping it when another process has refreshed it
+
+        Returns:
+            Universe: Current version, or None if nothing has been stored yet
+        """
+        try:
+            stamp = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if self._loaded is not None and self._loaded[0] == stamp:
+                return self._loaded[1]
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            universe = Universe(
+                np.array(meta['symbols']),
+                np.array(meta['last_time'], dtype=np.int64),
+                np.array(meta['counts'], dtype=np.int64),
+                np.load(os.path.join(self.directory, meta['data']), mmap_mode='r'),
+                meta['updated_at']
+            )
+            self._loaded = (stamp, universe)
+            return universe
+
+    def save(self, symbols, last_time, counts, columns):
+        """
+        Store a new version of the universe
+
+        Args:
+            symbols (list): Symbol per row
+            last_time (ndarray): Epoch seconds of each row's latest bar
+            counts (ndarray): Bars held per row
+            columns (ndarray): open/high/low/close/volume x symbols x bars
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"universe-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.npy"
+        temp = os.path.join(self.directory, f"{name}.tmp")
+        with open(temp, 'wb') as f:
+            np.save(f, columns)
+        os.replace(temp, os.path.join(self.directory, name))
+
+        meta = {'data': name, 'updated_at': time.time(), 'symbols': list(symbols),
+                'last_time': last_time.tolist(), 'counts': counts.tolist()}
+        temp = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(temp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp, self.meta_path)
+
+        versions = sorted(entry for entry in os.listdir(self.directory)
+                          if entry.startswith('universe-') and entry.endswith('.npy'))
+        for old in versions[:-self.KEEP_VERSIONS]:
+            try:
+                # Processes still mapping it keep reading their copy
+                os.remove(os.path.join(self.directory, old))
+            except OSError as e:
+                logger.warning(f"Could not remove old screener data {old}: {str(e)}")
+
+
+class Screener:
+    """
+    Evaluates a strategy's entry rules on the latest daily bar of every tradable symbol
+
+    Bars come from a local store refreshed in the background with batched
+    multi-symbol requests. A scan stacks every symbol's bars into one matrix
+    per field, computes each indicator across all symbols at once
+    (Indicator.compute_many) and evaluates the rules in one pass of the
+    expression graph, instead of a backtest per symbol.
+    """
+
+    def __init__(self, api, data_fetcher, store=None, refresh_seconds=SCREENER_REFRESH_SECONDS,
+                 history=SCREENER_HISTORY_BARS):
+        """
+        Initialize the screener
+
+        Args:
+            api: Alpaca REST client, for the asset list
+            data_fetcher: DataFetcher used for bulk bar requests
+            store (UniverseStore): Bar store, or None for the default location
+            refresh_seconds (int): Age at which the store is refreshed
+            history (int): Daily bars kept per symbol
+        """
+        self.api = api
+        self.data_fetcher = data_fetcher
+        self.store = store or UniverseStore()
+        self.refresh_seconds = refresh_seconds
+        self.history = history
+        self._refreshing = threading.Lock()
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def scan(self, strategy, limit=SCREENER_MAX_MATCHES):
+        """
+        Find the symbols whose latest daily bar meets a strategy's entry rules
+
+        Only symbols with a bar in the latest session and enough history for
+        every indicator the rules read are evaluated.
+
+        Args:
+            strategy (dict): Strategy configuration with indicators and entry_rules
+            limit (int): Maximum number of matches returned
+
+        Returns:
+            dict: Scan summary with 'matches' (symbol, close, volume and the indicator values the rules read)
+
+        Raises:
+            StrategyCompileError: If the rules are invalid or need more history than the store keeps
+            UniverseNotReady: If the store has not been filled yet
+        """
+        if not strategy.get('entry_rules'):
+            raise StrategyCompileError("Strategy has no entry rules")
+        started = time.perf_counter()
+        universe = self.current()
+
+        configs = [config for config in strategy.get('indicators') or [] if indicators.get_indicator(config.get('type'))]
+        available = set(BAR_FIELDS)
+        for config in configs:
+            available.update(indicators.output_columns(config))
+        compiled = compile_strategy({'entry_rules': strategy['entry_rules']}, columns=available)
+        needed = set(compiled.columns)
+        # Indicators the rules never read are not computed
+        configs = [config for config in configs if needed & set(indicators.output_columns(config))]
+        warmup = indicators.required_lookback(configs) + compiled.lookback + 1
+        if warmup > universe.history:
+            raise StrategyCompileError(f"Entry rules need {warmup} daily bars of history, the screener keeps {universe.history}")
+
+        fresh = universe.last_time == universe.as_of
+        enough = universe.counts >= warmup
+        rows = np.flatnonzero(fresh & enough)
+        # Fancy indexing copies the selected rows out of the mapped file
+        bars = {field: np.asarray(universe.column(field)[rows]) for field in BAR_FIELDS}
+        depth = compiled.lookback + 1
+        if len(rows):
+            for config in configs:
+                indicator = indicators.get_indicator(config['type'])
+                bars.update(indicator.compute_many(bars, indicator.resolve(config.get('parameters'))))
+            window = {name: np.asarray(bars[name])[:, -depth:] for name in needed}
+            signal = compiled.graph.evaluate(window, {'entry': compiled.entry}, length=depth)['entry']
+            hits = np.flatnonzero(np.broadcast_to(signal, (len(rows), depth))[:, -1].astype(bool))
+        else:
+            hits = np.array([], dtype=np.int64)
+
+        reported = sorted(needed - set(BAR_FIELDS))
+        matches = []
+        for position in hits[:limit].tolist():
+            values = {name: float(bars[name][position, -1]) for name in reported}
+            matches.append({
+                'symbol': str(universe.symbols[rows[position]]),
+                'close': float(bars['close'][position, -1]),
+                'volume': int(bars['volume'][position, -1]),
+                'values': {name: (None if np.isnan(value) else value) for name, value in values.items()}
+            })
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Screened {len(rows)} of {len(universe)} symbols in {elapsed * 1000:.0f} ms: {len(hits)} matches")
+        return {
+            'as_of': format_time(universe.as_of, '%Y-%m-%d') if len(universe) else None,
+            'updated_at': datetime.fromtimestamp(universe.updated_at).strftime('%Y-%m-%d %H:%M:%S'),
+            'universe': len(universe),
+            'evaluated': len(rows),
+            'insufficient_history': int((fresh & ~enough).sum()),
+            'stale': int((~fresh).sum()),
+            'matched': len(hits),
+            'truncated': len(hits) > limit,
+            'matches': matches,
+            'elapsed_ms': round(elapsed * 1000, 1)
+        }
+
+    def current(self):
+        """
+        Get the stored universe, starting a background refresh when it is old
+
+        Returns:
+            Universe: Current version, possibly up to one refresh behind
+
+        Raises:
+            UniverseNotReady: If nothing has been stored yet
+        """
+        universe = self.store.load()
+        if universe is None or time.time() - universe.updated_at > self.refresh_seconds:
+            self.refresh_async()
+        if universe is None:
+            raise UniverseNotReady()
+        return universe
+
+    def refresh_async(self):
+        """Refresh the store on a background thread unless this process already is"""
+        if not self._refreshing.acquire(blocking=False):
+            return
+        thread = threading.Thread(target=self._refresh_in_background, name='screener-refresh', daemon=True)
+        thread.start()
+
+    def _refresh_in_background(self):
+        """Refresh while holding the refresh lease, unless another process just did"""
+        try:
+            if not storage.acquire_lease(REFRESH_LEASE, self._owner, REFRESH_LEASE_TTL):
+                return
+            try:
+                universe = self.store.load()
+                if universe is None or time.time() - universe.updated_at > self.refresh_seconds:
+                    self.refresh()
+            finally:
+                storage.release_lease(REFRESH_LEASE, self._owner)
+        except Exception as e:
+            logger.error(f"Error refreshing screener universe: {str(e)}", exc_info=True)
+        finally:
+            self._refreshing.release()
+
+    def refresh(self):
+        """
+        Bring the store up to date with the tradable universe
+
+        Symbols already stored only fetch the bars since shortly before the
+        latest stored session; new symbols, and ones whose latest bar is older
+        than that, fetch their full history.
+
+        Returns:
+            Universe: The new version
+        """
+        started = time.perf_counter()
+        assets = self.api.list_assets(status='active')
+        symbols = sorted({asset.symbol for asset in assets
+                          if asset.tradable and getattr(asset, 'class', None) == 'us_equity'})
+        previous = self.store.load()
+        rows = {symbol: row for row, symbol in enumerate(previous.symbols.tolist())} if previous else {}
+
+        now = datetime.now()
+        history_days = int(self.history * 365 / TRADING_DAYS_PER_YEAR) + WARMUP_SLACK_DAYS
+        history_start = (now - timedelta(days=history_days)).strftime('%Y-%m-%d')
+        end = now.strftime('%Y-%m-%d')
+        overlap = None
+        if previous is not None and len(previous):
+            overlap = datetime.fromtimestamp(previous.as_of, timezone.utc) - timedelta(days=SCREENER_OVERLAP_DAYS)
+        incremental = [symbol for symbol in symbols if symbol in rows and overlap is not None
+                       and previous.last_time[rows[symbol]] >= overlap.timestamp()
+                       and previous.columns.shape[2] == self.history]
+        known = set(incremental)
+        fetched = self._fetch([symbol for symbol in symbols if symbol not in known], history_start, end)
+        if incremental:
+            fetched.update(self._fetch(incremental, overlap.strftime('%Y-%m-%d'), end))
+
+        columns = np.full((len(BAR_FIELDS), len(symbols), self.history), np.nan)
+        last_time = np.zeros(len(symbols), dtype=np.int64)
+        counts = np.zeros(len(symbols), dtype=np.int64)
+        for i, symbol in enumerate(symbols):
+            bars = fetched.get(symbol)
+            if symbol in known:
+                row = rows[symbol]
+                held_until = previous.last_time[row]
+                values = previous.columns[:, row, self.history - previous.counts[row]:]
+                if bars is not None:
+                    bars = bars[bars['time'] >= held_until]
+                    if len(bars) and bars['time'][0] == held_until:
+                        # The stored bar may have been taken while its session was still trading
+                        values = values[:, :-1]
+                    values = np.concatenate([values, _stack(bars)], axis=1)
+                    held_until = bars['time'][-1] if len(bars) else held_until
+            elif bars is not None and len(bars):
+                values, held_until = _stack(bars), bars['time'][-1]
+            else:
+                continue
+            values = values[:, -self.history:]
+            columns[:, i, self.history - values.shape[1]:] = values
+            last_time[i] = held_until
+            counts[i] = values.shape[1]
+
+        held = counts > 0
+        self.store.save([symbol for symbol, keep in zip(symbols, held) if keep], last_time[held], counts[held], columns[:, held])
+        logger.info(f"Refreshed screener universe: {int(held.sum())} of {len(symbols)} symbols with bars, "
+                    f"{len(symbols) - len(known)} full and {len(known)} incremental fetches in {time.perf_counter() - started:.1f}s")
+        return self.store.load()
+
+    def _fetch(self, symbols, start, end):
+        """Fetch daily bars for symbols in multi-symbol batches, a few batches at a time"""
+        if not symbols:
+            return {}
+        batches = [symbols[i:i + SCREENER_BATCH_SIZE] for i in range(0, len(symbols), SCREENER_BATCH_SIZE)]
+        fetched = {}
+        with ThreadPoolExecutor(max_workers=SCREENER_FETCH_WORKERS) as pool:
+            for bars in pool.map(lambda batch: self.data_fetcher.get_bars_bulk(batch, start, end, batch_size=len(batch)), batches):
+                fetched.update(bars)
+        return fetched
+
+
+def _stack(bars):
+    """Turn a bar array into a fields x bars float matrix"""
+    return np.vstack([bars[field].astype(float) for field in BAR_FIELDS]) if len(bars) else np.empty((len(BAR_FIELDS), 0))
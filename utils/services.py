@@ -0,0 +1,103 @@
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_instances = {}
+
+
+def _get_or_create(name, factory):
+    """Build a shared service the first time it is asked for"""
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        if name not in _instances:
+            _instances[name] = factory()
+            logger.info(f"Initialized {name}")
+        return _instances[name]
+
+
+def peek(name):
+    """Get a shared service if it has already been built, without building it"""
+    return _instances.get(name)
+
+
+def get_api():
+    """
+    Get the Alpaca REST client, importing alpaca_trade_api (and pandas) on first use
+
+    Every method call is counted and timed for /metrics.
+
+    Returns:
+        InstrumentedClient: alpaca_trade_api.REST client configured from the APCA_* environment variables
+    """
+    def create():
+        import alpaca_trade_api as tradeapi
+        from utils.metrics import InstrumentedClient
+        # The market data URL is read by the client from APCA_API_DATA_URL
+        return InstrumentedClient(tradeapi.REST(
+            os.getenv('APCA_API_KEY_ID'),
+            os.getenv('APCA_API_SECRET_KEY'),
+            base_url=os.getenv('APCA_API_BASE_URL', 'https://paper-api.alpaca.markets')
+        ))
+    return _get_or_create('api', create)
+
+
+def get_data_fetcher():
+    """Get the shared DataFetcher"""
+    def create():
+        from utils.data_fetcher import DataFetcher
+        return DataFetcher(get_api())
+    return _get_or_create('data_fetcher', create)
+
+
+def get_backtest_engine():
+    """Get the shared BacktestEngine"""
+    def create():
+        from utils.backtest_engine import BacktestEngine
+        return BacktestEngine(get_data_fetcher())
+    return _get_or_create('backtest_engine', create)
+
+
+def get_matching_engine():
+    """Get the shared MatchingEngine; its data fetcher is only built once it needs market data"""
+    def create():
+        from utils.matching_engine import MatchingEngine
+        return MatchingEngine(data_fetcher)
+    return _get_or_create('matching_engine', create)
+
+
+def get_screener():
+    """Get the shared universe Screener"""
+    def create():
+        from utils.screener import Screener
+        return Screener(get_api(), get_data_fetcher())
+    return _get_or_create('screener', create)
+
+
+class LazyService:
+    """
+    Stand-in for a service that is built on first attribute access
+
+    Lets module-level names like `api` and `data_fetcher` be handed around at
+    startup without importing pandas or connecting anything until used.
+    """
+
+    def __init__(self, getter):
+        object.__setattr__(self, '_getter', getter)
+
+    def __getattr__(self, name):
+        return getattr(self._getter(), name)
+
+    def __repr__(self):
+        return f"<LazyService {self._getter.__name__}>"
+
+
+api = LazyService(get_api)
+data_fetcher = LazyService(get_data_fetcher)
+backtest_engine = LazyService(get_backtest_engine)
+matching_engine = LazyService(get_matching_engine)
+screener = LazyService(get_screener)
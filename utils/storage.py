@@ -0,0 +1,1080 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv('ALGOBLOCKS_DB', 'data/algoblocks.db')
+LEGACY_USER_DATA_FILE = 'data/users.json'
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        email TEXT PRIMARY KEY,
+        username TEXT NOT NULL,
+        password TEXT NOT NULL,
+        verified INTEGER NOT NULL DEFAULT 0,
+        cash REAL NOT NULL DEFAULT 10000.0
+    );
+    CREATE TABLE IF NOT EXISTS trades (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL REFERENCES users(email),
+        trade_id TEXT,
+        timestamp TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        side TEXT NOT NULL,
+        type TEXT,
+        price REAL NOT NULL,
+        status TEXT NOT NULL,
+        strategy_id TEXT,
+        notes TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_trades_email ON trades(email, seq);
+    """,
+    # Materialized portfolio snapshot; snapshot_seq is the last trade folded in,
+    # so existing histories are folded on first read after upgrading
+    """
+    ALTER TABLE users ADD COLUMN realized_pl REAL NOT NULL DEFAULT 0;
+    ALTER TABLE users ADD COLUMN profitable_trades INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE users ADD COLUMN trade_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE users ADD COLUMN snapshot_seq INTEGER NOT NULL DEFAULT 0;
+    CREATE TABLE IF NOT EXISTS positions (
+        email TEXT NOT NULL REFERENCES users(email),
+        symbol TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        avg_price REAL NOT NULL,
+        total_cost REAL NOT NULL,
+        PRIMARY KEY (email, symbol)
+    ) WITHOUT ROWID;
+    """,
+    # The trades table doubles as an append-only journal; journal_seq is the
+    # last entry appended for a user, snapshots lagging behind it are compacted
+    """
+    ALTER TABLE users ADD COLUMN journal_seq INTEGER NOT NULL DEFAULT 0;
+    UPDATE users SET journal_seq = (SELECT COALESCE(MAX(seq), 0) FROM trades WHERE trades.email = users.email);
+    """,
+    # Paper-trading orders; fills are journaled as trades linked by order_id.
+    # matched_bars records the last bar matched per symbol across workers.
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id TEXT NOT NULL UNIQUE,
+        email TEXT NOT NULL REFERENCES users(email),
+        symbol TEXT NOT NULL,
+        side TEXT NOT NULL,
+        type TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        filled_quantity INTEGER NOT NULL DEFAULT 0,
+        limit_price REAL,
+        avg_fill_price REAL,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        notes TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_orders_email ON orders(email, seq);
+    CREATE INDEX IF NOT EXISTS idx_orders_open ON orders(seq) WHERE status IN ('open', 'partially_filled');
+    CREATE TABLE IF NOT EXISTS matched_bars (
+        symbol TEXT PRIMARY KEY,
+        bar_time TEXT NOT NULL
+    ) WITHOUT ROWID;
+    ALTER TABLE trades ADD COLUMN order_id TEXT;
+    """,
+    # Precomputed cross-user leaderboard and the latest mark price per held symbol
+    """
+    CREATE TABLE IF NOT EXISTS leaderboard (
+        email TEXT PRIMARY KEY REFERENCES users(email),
+        realized_pl REAL NOT NULL DEFAULT 0,
+        win_rate REAL NOT NULL DEFAULT 0,
+        trade_count INTEGER NOT NULL DEFAULT 0,
+        equity REAL NOT NULL DEFAULT 10000.0,
+        total_return REAL NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_leaderboard_return ON leaderboard(total_return);
+    CREATE INDEX IF NOT EXISTS idx_leaderboard_pl ON leaderboard(realized_pl);
+    CREATE INDEX IF NOT EXISTS idx_leaderboard_win_rate ON leaderboard(win_rate);
+    CREATE TABLE IF NOT EXISTS marks (
+        symbol TEXT PRIMARY KEY,
+        price REAL NOT NULL,
+        updated_at TEXT NOT NULL
+    ) WITHOUT ROWID;
+    INSERT OR IGNORE INTO leaderboard (email, realized_pl, win_rate, trade_count)
+        SELECT email, realized_pl, profitable_trades * 100.0 / trade_count, trade_count
+        FROM users WHERE trade_count > 0;
+    """,
+    # Version counter for account data, bumped by triggers on any account change
+    # so per-process user directory caches can tell when they are stale
+    """
+    CREATE TABLE IF NOT EXISTS directory_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO directory_version (id, version) VALUES (1, 0);
+    CREATE TRIGGER IF NOT EXISTS users_directory_insert AFTER INSERT ON users BEGIN
+        UPDATE directory_version SET version = version + 1 WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS users_directory_update AFTER UPDATE OF username, password, verified ON users BEGIN
+        UPDATE directory_version SET version = version + 1 WHERE id = 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS users_directory_delete AFTER DELETE ON users BEGIN
+        UPDATE directory_version SET version = version + 1 WHERE id = 1;
+    END;
+    """,
+    # Email verification codes, shared by all workers and expired by time
+    """
+    CREATE TABLE IF NOT EXISTS verification_codes (
+        email TEXT PRIMARY KEY,
+        code TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_verification_codes_expiry ON verification_codes(expires_at);
+    """,
+    # Catalog of saved strategy files, so listings never open strategy bodies;
+    # legacy files saved without an owner have a NULL email and are shared
+    """
+    CREATE TABLE IF NOT EXISTS strategies (
+        name TEXT PRIMARY KEY,
+        email TEXT,
+        symbol TEXT,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_strategies_email ON strategies(email, name);
+    """,
+    # Strategies running live against paper accounts, and leases electing the
+    # one process that runs a singleton background service. Every user change
+    # to a live strategy takes the next version, so the runner can load only
+    # what changed since its last sync.
+    """
+    CREATE TABLE IF NOT EXISTS live_strategies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL REFERENCES users(email),
+        name TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        strategy TEXT NOT NULL,
+        active INTEGER NOT NULL DEFAULT 1,
+        position INTEGER NOT NULL DEFAULT 0,
+        last_bar TEXT,
+        last_signal TEXT,
+        status TEXT,
+        version INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        UNIQUE (email, name)
+    );
+    CREATE INDEX IF NOT EXISTS idx_live_strategies_version ON live_strategies(version);
+    CREATE INDEX IF NOT EXISTS idx_live_strategies_active ON live_strategies(symbol) WHERE active = 1;
+    CREATE TABLE IF NOT EXISTS service_leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    """,
+    # Metric snapshots saved by each server process, merged on every scrape.
+    # Snapshots of processes that stopped saving are folded into one archive
+    # row so their counts survive worker restarts.
+    """
+    CREATE TABLE IF NOT EXISTS metric_snapshots (
+        owner TEXT PRIMARY KEY,
+        snapshot TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    """,
+    # Upstream state polled by one lease holder (e.g. the market clock) and
+    # read by every other process instead of polling it again
+    """
+    CREATE TABLE IF NOT EXISTS shared_state (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    """,
+]
+
+# Cash every new paper-trading account starts with
+STARTING_CASH = 10000.0
+
+# Order states that can still be filled
+OPEN_ORDER_STATUSES = ('open', 'partially_filled')
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def get_connection():
+    """
+    Get the SQLite connection for the current thread
+
+    Connections are opened lazily per thread and per process (so forked
+    workers never share a handle) in WAL mode, which lets readers proceed
+    while another process is writing.
+
+    Returns:
+        sqlite3.Connection: Connection in autocommit mode with Row factory
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    db_dir = os.path.dirname(DB_PATH)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+
+    # isolation_level=None leaves transaction control to transaction()
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.execute('PRAGMA busy_timeout=30000')
+
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _ensure_schema(conn)
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Run a block of statements in a single write transaction
+
+    BEGIN IMMEDIATE takes the write lock up front, so read-modify-write
+    sequences (e.g. checking cash before a trade) cannot interleave with
+    writers in other workers.
+
+    Yields:
+        sqlite3.Connection: Connection to execute statements on
+    """
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
+
+
+@contextmanager
+def read_transaction():
+    """
+    Run a block of reads against one consistent view of the database
+
+    A deferred transaction pins its WAL snapshot at the first read, so
+    commits made by other workers in the meantime (e.g. a compaction) are
+    not seen halfway through the block.
+
+    Yields:
+        sqlite3.Connection: Connection to execute statements on
+    """
+    conn = get_connection()
+    conn.execute('BEGIN')
+    try:
+        yield conn
+    finally:
+        conn.execute('COMMIT')
+
+
+def _ensure_schema(conn):
+    """Apply pending migrations and import legacy JSON data once per process"""
+    key = (os.getpid(), DB_PATH)
+    if key in _initialized:
+        return
+    with _init_lock:
+        if key in _initialized:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for index in range(version, len(MIGRATIONS)):
+                for statement in _split_statements(MIGRATIONS[index]):
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {index + 1}')
+                logger.info(f"Applied storage migration {index + 1}")
+            if version == 0:
+                _import_legacy_users(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        _initialized.add(key)
+
+
+def _split_statements(script):
+    """Split an SQL script into complete statements (trigger bodies contain semicolons)"""
+    statements = []
+    pending = ''
+    for line in script.splitlines(keepends=True):
+        pending += line
+        if sqlite3.complete_statement(pending):
+            statements.append(pending.strip())
+            pending = ''
+    if pending.strip():
+        statements.append(pending.strip())
+    return statements
+
+
+def _import_legacy_users(conn):
+    """Import users and trades from the old users.json file into a fresh database"""
+    if not os.path.exists(LEGACY_USER_DATA_FILE):
+        return
+    try:
+        with open(LEGACY_USER_DATA_FILE, 'r') as f:
+            users = json.load(f)
+    except Exception as e:
+        logger.error(f"Error reading legacy users file: {str(e)}")
+        return
+
+    for email, user in users.items():
+        portfolio = user.get('portfolio', {})
+        conn.execute(
+            'INSERT OR IGNORE INTO users (email, username, password, verified, cash) VALUES (?, ?, ?, ?, ?)',
+            (email, user.get('username', ''), user.get('password', ''),
+             int(bool(user.get('verified'))), portfolio.get('cash', STARTING_CASH))
+        )
+        for trade in portfolio.get('trades', []):
+            insert_trade(conn, email, trade)
+    logger.info(f"Imported {len(users)} users from {LEGACY_USER_DATA_FILE}")
+
+
+def get_user(email):
+    """
+    Get a user's account record
+
+    Args:
+        email (str): User email
+
+    Returns:
+        dict: User fields (email, username, password, verified, cash) or None
+    """
+    row = get_connection().execute(
+        'SELECT email, username, password, verified, cash FROM users WHERE email = ?',
+        (email,)
+    ).fetchone()
+    if row is None:
+        return None
+    user = dict(row)
+    user['verified'] = bool(user['verified'])
+    return user
+
+
+def get_directory_version():
+    """
+    Get the account data version, which changes whenever any user account changes
+
+    Returns:
+        int: Version counter shared by all processes using the database
+    """
+    return get_connection().execute('SELECT version FROM directory_version WHERE id = 1').fetchone()[0]
+
+
+def create_user(email, username, password, cash=STARTING_CASH):
+    """
+    Create a new unverified user
+
+    Returns:
+        bool: False if the email is already registered
+    """
+    with transaction() as conn:
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO users (email, username, password, verified, cash) VALUES (?, ?, ?, 0, ?)',
+            (email, username, password, cash)
+        )
+        return cursor.rowcount == 1
+
+
+def delete_unverified_user(email):
+    """
+    Remove a user that never verified their email, e.g. when their registration could not complete
+
+    Returns:
+        bool: False if there is no such unverified user
+    """
+    with transaction() as conn:
+        cursor = conn.execute('DELETE FROM users WHERE email = ? AND verified = 0', (email,))
+        return cursor.rowcount == 1
+
+
+def set_verified(email):
+    """
+    Mark a user's email as verified
+
+    Returns:
+        bool: False if the user does not exist
+    """
+    with transaction() as conn:
+        cursor = conn.execute('UPDATE users SET verified = 1 WHERE email = ?', (email,))
+        return cursor.rowcount == 1
+
+
+def save_verification_code(email, code, ttl):
+    """
+    Store a verification code, replacing any earlier code for the email
+
+    Args:
+        email (str): User email
+        code (str): Verification code
+        ttl (int): Seconds until the code expires
+    """
+    with transaction() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO verification_codes (email, code, expires_at) VALUES (?, ?, ?)',
+            (email, code, time.time() + ttl)
+        )
+
+
+def get_verification_code(email):
+    """
+    Get the unexpired verification code for an email
+
+    Returns:
+        str: The code, or None if there is none or it has expired
+    """
+    row = get_connection().execute(
+        'SELECT code FROM verification_codes WHERE email = ? AND expires_at > ?',
+        (email, time.time())
+    ).fetchone()
+    return None if row is None else row['code']
+
+
+def delete_verification_code(email):
+    """Remove the verification code for an email once it has been used"""
+    with transaction() as conn:
+        conn.execute('DELETE FROM verification_codes WHERE email = ?', (email,))
+
+
+def sweep_verification_codes():
+    """
+    Delete all expired verification codes
+
+    Returns:
+        int: Number of codes deleted
+    """
+    with transaction() as conn:
+        cursor = conn.execute('DELETE FROM verification_codes WHERE expires_at <= ?', (time.time(),))
+        return cursor.rowcount
+
+
+def insert_trade(conn, email, trade):
+    """
+    Append a trade record to a user's journal
+
+    Args:
+        conn (sqlite3.Connection): Connection inside an open transaction
+        email (str): User email
+        trade (dict): Trade record
+
+    Returns:
+        int: Sequence number of the inserted trade
+    """
+    cursor = conn.execute(
+        '''INSERT INTO trades (email, trade_id, timestamp, symbol, quantity, side, type, price, status, strategy_id, notes, order_id)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (email, trade.get('id'), trade['timestamp'], trade['symbol'], trade['quantity'],
+         trade['side'], trade.get('type'), trade['price'], trade['status'],
+         trade.get('strategy_id'), trade.get('notes', ''), trade.get('order_id'))
+    )
+    conn.execute('UPDATE users SET journal_seq = ? WHERE email = ?', (cursor.lastrowid, email))
+    return cursor.lastrowid
+
+
+def list_trades(email, after_seq=0, conn=None, limit=None):
+    """
+    Get a user's trades in execution order
+
+    Args:
+        email (str): User email
+        after_seq (int): Only return trades with a sequence number above this
+        conn (sqlite3.Connection): Connection to use, e.g. inside a transaction
+        limit (int): Maximum number of trades to return, or None for all
+
+    Returns:
+        list: Trade dictionaries
+    """
+    conn = conn or get_connection()
+    rows = conn.execute(
+        'SELECT * FROM trades WHERE email = ? AND seq > ? ORDER BY seq LIMIT ?',
+        (email, after_seq, -1 if limit is None else limit)
+    ).fetchall()
+    return [trade_to_dict(row) for row in rows]
+
+
+def get_journal_seq(email):
+    """
+    Get the sequence number of a user's latest trade, which versions their portfolio
+
+    Returns:
+        int: Sequence number (0 if the user has no trades), or None if the user does not exist
+    """
+    row = get_connection().execute('SELECT journal_seq FROM users WHERE email = ?', (email,)).fetchone()
+    return None if row is None else row['journal_seq']
+
+
+def get_journal_seqs(emails):
+    """
+    Get the portfolio versions of several users at once
+
+    Returns:
+        dict: email -> sequence number of the user's latest trade, for users that exist
+    """
+    emails = list(emails)
+    if not emails:
+        return {}
+    placeholders = ','.join('?' * len(emails))
+    rows = get_connection().execute(
+        f'SELECT email, journal_seq FROM users WHERE email IN ({placeholders})', emails
+    ).fetchall()
+    return {row['email']: row['journal_seq'] for row in rows}
+
+
+def get_latest_seq():
+    """
+    Get the sequence number of the most recent trade by any user
+
+    Cheap enough to poll: it only changes when some portfolio changes.
+
+    Returns:
+        int: Sequence number, or 0 if there are no trades
+    """
+    row = get_connection().execute('SELECT MAX(seq) AS seq FROM trades').fetchone()
+    return row['seq'] or 0
+
+
+def get_snapshot(email, conn=None):
+    """
+    Get a user's materialized portfolio snapshot
+
+    The users row and positions must come from the same transaction; without
+    a connection one is opened for just these reads.
+
+    Args:
+        email (str): User email
+        conn (sqlite3.Connection): Connection inside a transaction, also used
+            by the caller for reads that must agree with the snapshot
+
+    Returns:
+        dict: Snapshot with stats, snapshot_seq, last_seq and positions keyed
+        by symbol, or None if the user does not exist
+    """
+    if conn is None:
+        with read_transaction() as conn:
+            return get_snapshot(email, conn)
+    row = conn.execute(
+        """SELECT cash, realized_pl, profitable_trades, trade_count, snapshot_seq,
+                  (SELECT COALESCE(MAX(seq), 0) FROM trades WHERE email = users.email) AS last_seq
+           FROM users WHERE email = ?""",
+        (email,)
+    ).fetchone()
+    if row is None:
+        return None
+    snapshot = dict(row)
+    snapshot['positions'] = {
+        position['symbol']: {
+            'quantity': position['quantity'],
+            'avg_price': position['avg_price'],
+            'total_cost': position['total_cost']
+        }
+        for position in conn.execute(
+            'SELECT symbol, quantity, avg_price, total_cost FROM positions WHERE email = ? ORDER BY symbol',
+            (email,)
+        )
+    }
+    return snapshot
+
+
+def save_snapshot(conn, email, snapshot, symbols):
+    """
+    Write back a user's snapshot stats and the given positions
+
+    Args:
+        conn (sqlite3.Connection): Connection inside an open transaction
+        email (str): User email
+        snapshot (dict): Snapshot as returned by get_snapshot
+        symbols (iterable): Symbols whose positions changed
+    """
+    conn.execute(
+        """UPDATE users SET realized_pl = ?, profitable_trades = ?, trade_count = ?, snapshot_seq = ?
+           WHERE email = ?""",
+        (snapshot['realized_pl'], snapshot['profitable_trades'], snapshot['trade_count'],
+         snapshot['snapshot_seq'], email)
+    )
+    for symbol in symbols:
+        position = snapshot['positions'].get(symbol)
+        if position and position['quantity'] > 0:
+            conn.execute(
+                """INSERT OR REPLACE INTO positions (email, symbol, quantity, avg_price, total_cost)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (email, symbol, position['quantity'], position['avg_price'], position['total_cost'])
+            )
+        else:
+            conn.execute('DELETE FROM positions WHERE email = ? AND symbol = ?', (email, symbol))
+
+
+def list_stale_snapshots(limit=500):
+    """
+    Get users whose snapshot lags behind their trade journal
+
+    Args:
+        limit (int): Maximum number of users to return
+
+    Returns:
+        list: User emails
+    """
+    rows = get_connection().execute(
+        'SELECT email FROM users WHERE journal_seq > snapshot_seq LIMIT ?', (limit,)
+    ).fetchall()
+    return [row['email'] for row in rows]
+
+
+def iter_journal(email, after_seq=0):
+    """
+    Iterate over a user's journal entries as JSON lines, e.g. for auditing
+
+    Args:
+        email (str): User email
+        after_seq (int): Only return entries with a sequence number above this
+
+    Yields:
+        str: One JSON-encoded trade per entry
+    """
+    cursor = get_connection().execute(
+        'SELECT * FROM trades WHERE email = ? AND seq > ? ORDER BY seq', (email, after_seq)
+    )
+    for row in cursor:
+        yield json.dumps(trade_to_dict(row))
+
+
+def checkpoint():
+    """Copy the write-ahead log back into the database file and truncate it"""
+    get_connection().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def reset_snapshot(conn, email):
+    """Clear a user's snapshot so the next fold replays the full trade history"""
+    conn.execute(
+        """UPDATE users SET realized_pl = 0, profitable_trades = 0, trade_count = 0, snapshot_seq = 0
+           WHERE email = ?""",
+        (email,)
+    )
+    conn.execute('DELETE FROM positions WHERE email = ?', (email,))
+
+
+def trade_to_dict(row):
+    """Convert a trades row to the trade dictionary format used by the API"""
+    trade = {
+        'seq': row['seq'],
+        'timestamp': row['timestamp'],
+        'symbol': row['symbol'],
+        'quantity': row['quantity'],
+        'side': row['side'],
+        'type': row['type'],
+        'price': row['price'],
+        'status': row['status'],
+        'notes': row['notes'] or ''
+    }
+    if row['trade_id']:
+        trade['id'] = row['trade_id']
+    if row['strategy_id']:
+        trade['strategy_id'] = row['strategy_id']
+    if row['order_id']:
+        trade['order_id'] = row['order_id']
+    return trade
+
+
+def insert_order(conn, email, order):
+    """
+    Record a new order
+
+    Args:
+        conn (sqlite3.Connection): Connection inside an open transaction
+        email (str): User email
+        order (dict): Order as produced by order_to_dict
+
+    Returns:
+        int: Sequence number of the order
+    """
+    cursor = conn.execute(
+        """INSERT INTO orders (order_id, email, symbol, side, type, quantity, filled_quantity,
+                               limit_price, avg_fill_price, status, created_at, updated_at, notes)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (order['id'], email, order['symbol'], order['side'], order['type'], order['quantity'],
+         order['filled_quantity'], order['limit_price'], order['avg_fill_price'], order['status'],
+         order['created_at'], order['updated_at'], order.get('notes', ''))
+    )
+    return cursor.lastrowid
+
+
+def update_order(conn, order):
+    """Write back an order's fill progress and status"""
+    conn.execute(
+        """UPDATE orders SET filled_quantity = ?, avg_fill_price = ?, status = ?, updated_at = ?, notes = ?
+           WHERE order_id = ?""",
+        (order['filled_quantity'], order['avg_fill_price'], order['status'], order['updated_at'],
+         order.get('notes', ''), order['id'])
+    )
+
+
+def get_order(order_id, conn=None):
+    """
+    Get an order by id
+
+    Returns:
+        dict: Order with its owner's email under 'email', or None
+    """
+    conn = conn or get_connection()
+    row = conn.execute('SELECT * FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+    if row is None:
+        return None
+    return dict(order_to_dict(row), email=row['email'])
+
+
+def list_orders(email, status=None, limit=100):
+    """
+    Get a user's most recent orders
+
+    Args:
+        email (str): User email
+        status (str): Only return orders in this state ('open' includes partially filled)
+        limit (int): Maximum number of orders to return
+
+    Returns:
+        list: Order dictionaries, newest first
+    """
+    if status == 'open':
+        rows = get_connection().execute(
+            """SELECT * FROM orders WHERE email = ? AND status IN (?, ?) ORDER BY seq DESC LIMIT ?""",
+            (email, *OPEN_ORDER_STATUSES, limit)
+        ).fetchall()
+    elif status:
+        rows = get_connection().execute(
+            'SELECT * FROM orders WHERE email = ? AND status = ? ORDER BY seq DESC LIMIT ?',
+            (email, status, limit)
+        ).fetchall()
+    else:
+        rows = get_connection().execute(
+            'SELECT * FROM orders WHERE email = ? ORDER BY seq DESC LIMIT ?', (email, limit)
+        ).fetchall()
+    return [order_to_dict(row) for row in rows]
+
+
+def list_open_orders(after_seq=0):
+    """
+    Get all fillable orders across users, e.g. to load a matching engine's book
+
+    Args:
+        after_seq (int): Only return orders with a sequence number above this
+
+    Returns:
+        list: (seq, email, order) tuples in submission order
+    """
+    rows = get_connection().execute(
+        """SELECT * FROM orders WHERE status IN (?, ?) AND seq > ? ORDER BY seq""",
+        (*OPEN_ORDER_STATUSES, after_seq)
+    ).fetchall()
+    return [(row['seq'], row['email'], order_to_dict(row)) for row in rows]
+
+
+def claim_bar(symbol, bar_time):
+    """
+    Claim the right to match orders against a bar
+
+    Each bar is matched by exactly one worker process, so bar volume is not
+    handed out twice when several workers poll the same market data.
+
+    Returns:
+        bool: True if this caller should match the bar
+    """
+    with transaction() as conn:
+        cursor = conn.execute(
+            """INSERT INTO matched_bars (symbol, bar_time) VALUES (?, ?)
+               ON CONFLICT(symbol) DO UPDATE SET bar_time = excluded.bar_time
+               WHERE excluded.bar_time > matched_bars.bar_time""",
+            (symbol, bar_time)
+        )
+        return cursor.rowcount == 1
+
+
+def upsert_strategy(conn, entry):
+    """
+    Add or replace a strategy catalog entry
+
+    Args:
+        conn: Storage connection inside an open transaction
+        entry (dict): Catalog fields (name, email, symbol, size, mtime)
+    """
+    conn.execute(
+        'INSERT OR REPLACE INTO strategies (name, email, symbol, size, mtime) VALUES (?, ?, ?, ?, ?)',
+        (entry['name'], entry['email'], entry['symbol'], entry['size'], entry['mtime'])
+    )
+
+
+def get_strategy_entry(name):
+    """
+    Get a strategy's catalog entry
+
+    Returns:
+        dict: Catalog fields (name, email, symbol, size, mtime) or None
+    """
+    row = get_connection().execute('SELECT * FROM strategies WHERE name = ?', (name,)).fetchone()
+    return None if row is None else dict(row)
+
+
+def list_strategy_entries(email):
+    """
+    Get the catalog entries of the strategies a user can load
+
+    Args:
+        email (str): User email
+
+    Returns:
+        list: Catalog entries owned by the user or unowned, ordered by name
+    """
+    rows = get_connection().execute(
+        """SELECT * FROM strategies WHERE email = ?
+           UNION ALL
+           SELECT * FROM strategies WHERE email IS NULL
+           ORDER BY name""",
+        (email,)
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def count_strategies():
+    """Get the number of catalogued strategies"""
+    return get_connection().execute('SELECT COUNT(*) FROM strategies').fetchone()[0]
+
+
+def acquire_lease(name, owner, ttl):
+    """
+    Take or renew the lease on a singleton service
+
+    A lease held by another owner can only be taken once it has expired, so
+    exactly one process runs the service and a crashed holder is replaced
+    within ttl seconds.
+
+    Args:
+        name (str): Service name
+        owner (str): Identifier of the calling process
+        ttl (float): Seconds the lease stays valid unless renewed
+
+    Returns:
+        bool: True if the caller holds the lease
+    """
+    now = time.time()
+    with transaction() as conn:
+        cursor = conn.execute(
+            """INSERT INTO service_leases (name, owner, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+               WHERE service_leases.owner = excluded.owner OR service_leases.expires_at < ?""",
+            (name, owner, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+
+def release_lease(name, owner):
+    """Give up a lease so another process can take it at once"""
+    with transaction() as conn:
+        conn.execute('DELETE FROM service_leases WHERE name = ? AND owner = ?', (name, owner))
+
+
+def save_shared_state(name, value):
+    """Store a JSON-serialisable value for the other server processes to read"""
+    get_connection().execute(
+        'INSERT OR REPLACE INTO shared_state (name, value, updated_at) VALUES (?, ?, ?)',
+        (name, json.dumps(value), time.time())
+    )
+
+
+def get_shared_state(name):
+    """
+    Get a value stored with save_shared_state
+
+    Returns:
+        tuple: (value, epoch seconds it was stored), or None if it was never stored
+    """
+    row = get_connection().execute('SELECT value, updated_at FROM shared_state WHERE name = ?', (name,)).fetchone()
+    return None if row is None else (json.loads(row['value']), row['updated_at'])
+
+
+def save_metric_snapshot(owner, snapshot):
+    """Store the latest metric snapshot of a server process"""
+    get_connection().execute(
+        'INSERT OR REPLACE INTO metric_snapshots (owner, snapshot, updated_at) VALUES (?, ?, ?)',
+        (owner, json.dumps(snapshot), time.time())
+    )
+
+
+def collect_metric_snapshots(stale_before, archive_owner, fold):
+    """
+    Get every process's metric snapshot, folding those of exited processes into the archive
+
+    Args:
+        stale_before (float): Snapshots last saved before this time belong to exited processes
+        archive_owner (str): Owner of the row accumulating exited processes' snapshots
+        fold (callable): fold(archive, snapshots) -> new archive; archive is None the first time
+
+    Returns:
+        list: Snapshots of running processes, then the archive if there is one
+    """
+    with transaction() as conn:
+        archive = None
+        live, stale = [], []
+        for row in conn.execute('SELECT owner, snapshot, updated_at FROM metric_snapshots'):
+            snapshot = json.loads(row['snapshot'])
+            if row['owner'] == archive_owner:
+                archive = snapshot
+            elif row['updated_at'] < stale_before:
+                stale.append((row['owner'], snapshot))
+            else:
+                live.append(snapshot)
+        if stale:
+            archive = fold(archive, [snapshot for _, snapshot in stale])
+            conn.execute(
+                'INSERT OR REPLACE INTO metric_snapshots (owner, snapshot, updated_at) VALUES (?, ?, ?)',
+                (archive_owner, json.dumps(archive), time.time())
+            )
+            conn.executemany('DELETE FROM metric_snapshots WHERE owner = ?', [(owner,) for owner, _ in stale])
+    return live + ([archive] if archive is not None else [])
+
+
+def save_live_strategy(email, entry):
+    """
+    Start running a strategy live, or replace a live strategy of the same name
+
+    The position a strategy already holds is kept when it is replaced, so
+    reactivating an edited strategy can still exit its open trade.
+
+    Args:
+        email (str): User email
+        entry (dict): Live strategy fields (name, symbol, timeframe, quantity, strategy)
+
+    Returns:
+        dict: The saved live strategy
+    """
+    now = time.strftime('%Y-%m-%d %H:%M:%S')
+    with transaction() as conn:
+        conn.execute(
+            """INSERT INTO live_strategies
+                   (email, name, symbol, timeframe, quantity, strategy, active, status, version, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, 1, NULL, (SELECT COALESCE(MAX(version), 0) + 1 FROM live_strategies), ?, ?)
+               ON CONFLICT(email, name) DO UPDATE SET
+                   symbol = excluded.symbol, timeframe = excluded.timeframe, quantity = excluded.quantity,
+                   strategy = excluded.strategy, active = 1, status = NULL,
+                   version = excluded.version, updated_at = excluded.updated_at""",
+            (email, entry['name'], entry['symbol'], entry['timeframe'], entry['quantity'],
+             json.dumps(entry['strategy']), now, now)
+        )
+        row = conn.execute('SELECT * FROM live_strategies WHERE email = ? AND name = ?',
+                           (email, entry['name'])).fetchone()
+    return live_strategy_to_dict(row)
+
+
+def stop_live_strategy(email, name):
+    """
+    Stop running a strategy live
+
+    Returns:
+        dict: The stopped live strategy, or None if the user has none by that name
+    """
+    now = time.strftime('%Y-%m-%d %H:%M:%S')
+    with transaction() as conn:
+        cursor = conn.execute(
+            """UPDATE live_strategies
+               SET active = 0, version = (SELECT MAX(version) + 1 FROM live_strategies), updated_at = ?
+               WHERE email = ? AND name = ?""",
+            (now, email, name)
+        )
+        if cursor.rowcount == 0:
+            return None
+        row = conn.execute('SELECT * FROM live_strategies WHERE email = ? AND name = ?', (email, name)).fetchone()
+    return live_strategy_to_dict(row)
+
+
+def list_live_strategies(email):
+    """Get a user's live strategies, ordered by name"""
+    rows = get_connection().execute(
+        'SELECT * FROM live_strategies WHERE email = ? ORDER BY name', (email,)
+    ).fetchall()
+    return [live_strategy_to_dict(row) for row in rows]
+
+
+def count_live_strategies(email=None):
+    """Get the number of active live strategies, overall or for one user"""
+    if email is None:
+        return get_connection().execute('SELECT COUNT(*) FROM live_strategies WHERE active = 1').fetchone()[0]
+    return get_connection().execute(
+        'SELECT COUNT(*) FROM live_strategies WHERE email = ? AND active = 1', (email,)
+    ).fetchone()[0]
+
+
+def list_changed_live_strategies(after_version=0):
+    """
+    Get the live strategies started, replaced or stopped since a version
+
+    Returns:
+        list: Live strategy dicts (including the parsed strategy), ordered by version
+    """
+    rows = get_connection().execute(
+        'SELECT * FROM live_strategies WHERE version > ? ORDER BY version', (after_version,)
+    ).fetchall()
+    return [live_strategy_to_dict(row, with_strategy=True) for row in rows]
+
+
+def record_live_signals(updates):
+    """
+    Record what live strategies did on their latest bars, in one transaction
+
+    Runner updates leave the version alone; they are not changes the runner
+    needs to reload.
+
+    Args:
+        updates (list): (live strategy id, bar time or None, 'entry'/'exit' or None,
+            shares held afterwards, error or note to show the user or None) tuples
+    """
+    with transaction() as conn:
+        conn.executemany(
+            """UPDATE live_strategies
+               SET last_bar = COALESCE(?, last_bar), last_signal = COALESCE(?, last_signal), position = ?, status = ?
+               WHERE id = ?""",
+            [(bar_time, signal, position, status, strategy_id)
+             for strategy_id, bar_time, signal, position, status in updates]
+        )
+
+
+def live_strategy_to_dict(row, with_strategy=False):
+    """Convert a live_strategies row to the format used by the API and the runner"""
+    entry = dict(row)
+    strategy = entry.pop('strategy')
+    if with_strategy:
+        entry['strategy'] = json.loads(strategy)
+    entry['active'] = bool(entry['active'])
+    return entry
+
+
+def order_to_dict(row):
+    """Convert an orders row to the order dictionary format used by the API"""
+    return {
+        'id': row['order_id'],
+        'symbol': row['symbol'],
+        'side': row['side'],
+        'type': row['type'],
+        'quantity': row['quantity'],
+        'filled_quantity': row['filled_quantity'],
+        'limit_price': row['limit_price'],
+        'avg_fill_price': row['avg_fill_price'],
+        'status': row['status'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+        'notes': row['notes'] or ''
+    }
@@ -0,0 +1,658 @@
+import re
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class StrategyCompileError(ValueError):
+    """Raised when a strategy rule cannot be compiled"""
+
+
+# Vectorized implementations of the binary operators
+_ARITHMETIC = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+_COMPARISONS = {
+    '>': np.greater, '<': np.less, '>=': np.greater_equal,
+    '<=': np.less_equal, '==': np.equal, '!=': np.not_equal
+}
+_LOGICAL = {'and': np.logical_and, 'or': np.logical_or}
+_CROSSES = ('crosses_above', 'crosses_below')
+
+# Operators whose operands can be reordered without changing the result
+_COMMUTATIVE = {'+', '*', '==', '!=', 'and', 'or'}
+
+# Comparisons written with their operands swapped, normalized so a < b and b > a share a node
+_MIRRORED = {'<': '>', '<=': '>='}
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d*)?|\.\d+)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>>=|<=|==|!=|&&|\|\||[-+*/()<>\[\]!])
+    )""", re.VERBOSE)
+
+_KEYWORDS = {'and': 'and', 'or': 'or', 'not': 'not', '&&': 'and', '||': 'or', '!': 'not',
+             'crosses_above': 'crosses_above', 'crosses_below': 'crosses_below'}
+
+
+class ExpressionGraph:
+    """
+    Deduplicated expression DAG for one or more strategies
+
+    Every node is hash-consed: adding an expression that already exists
+    (including operands in a different order for commutative operators, or
+    shifted columns reached through different crossovers) returns the existing
+    node, so each distinct subexpression is evaluated once per run however
+    many rules refer to it.
+
+    Nodes are stored in creation order, which is also a valid evaluation
+    order because operands are always created before the nodes using them.
+    """
+
+    def __init__(self):
+        """Initialize an empty graph"""
+        self.nodes = []  # (op, args, kind) with args as node ids or constants
+        self._index = {}
+
+    @property
+    def columns(self):
+        """Names of the bar and indicator columns the graph reads"""
+        return sorted({args[0] for op, args, _ in self.nodes if op == 'column'})
+
+    def column(self, name):
+        """Add a reference to a bar or indicator column"""
+        return self._add('column', (name,), 'num')
+
+    def constant(self, value):
+        """Add a constant (a float, or a bool for conditions)"""
+        kind = 'bool' if isinstance(value, (bool, np.bool_)) else 'num'
+        return self._add('const', (bool(value) if kind == 'bool' else float(value),), kind)
+
+    def shift(self, node, lag):
+        """
+        Refer to a node's value lag bars ago (x[-lag])
+
+        Args:
+            node (int): Node id
+            lag (int): Number of bars back, >= 0
+
+        Returns:
+            int: Node id
+        """
+        if lag < 0:
+            raise StrategyCompileError("Lookback references must point to past bars, e.g. close[-1]")
+        if lag == 0 or self.nodes[node][0] == 'const':
+            return node
+        op, args, kind = self.nodes[node]
+        if op == 'shift':
+            # x[-a][-b] is x[-(a + b)]
+            node, lag = args[0], args[1] + lag
+        return self._add('shift', (node, lag), kind)
+
+    def unary(self, op, node):
+        """Add a 'not' or unary minus node"""
+        if op == 'not':
+            self._expect(node, 'bool', 'not')
+            if self.nodes[node][0] == 'not':
+                return self.nodes[node][1][0]
+            if self.nodes[node][0] == 'const':
+                return self.constant(not self.nodes[node][1][0])
+            return self._add('not', (node,), 'bool')
+        return self.binary('*', self.constant(-1.0), node)
+
+    def binary(self, op, left, right):
+        """
+        Add a binary operation, lowering crossovers to comparisons and shifts
+
+        Args:
+            op (str): Arithmetic, comparison, logical or crossover operator
+            left (int): Left operand node id
+            right (int): Right operand node id
+
+        Returns:
+            int: Node id
+        """
+        if op in _CROSSES:
+            # a crosses above b: a > b now, a <= b on the previous bar
+            above = op == 'crosses_above'
+            now = self.binary('>' if above else '<', left, right)
+            before = self.binary('<=' if above else '>=', self.shift(left, 1), self.shift(right, 1))
+            return self.binary('and', now, before)
+
+        if op in _LOGICAL:
+            self._expect(left, 'bool', op)
+            self._expect(right, 'bool', op)
+            kind = 'bool'
+        elif op in _COMPARISONS:
+            self._expect(left, 'num', op)
+            self._expect(right, 'num', op)
+            kind = 'bool'
+        elif op in _ARITHMETIC:
+            self._expect(left, 'num', op)
+            self._expect(right, 'num', op)
+            kind = 'num'
+        else:
+            raise StrategyCompileError(f"Unsupported operator: {op}")
+
+        if op in _MIRRORED:
+            op, left, right = _MIRRORED[op], right, left
+        if op in _COMMUTATIVE and left > right:
+            left, right = right, left
+        if op in _LOGICAL and left == right:
+            return left
+
+        left_node, right_node = self.nodes[left], self.nodes[right]
+        if left_node[0] == 'const' and right_node[0] == 'const':
+            with np.errstate(all='ignore'):
+                func = _LOGICAL.get(op) or _COMPARISONS.get(op) or _ARITHMETIC[op]
+                return self.constant(func(left_node[1][0], right_node[1][0]))
+        return self._add(op, (left, right), kind)
+
+    def all_of(self, nodes):
+        """AND together a list of condition nodes (False when empty)"""
+        if not nodes:
+            return self.constant(False)
+        result = nodes[0]
+        for node in nodes[1:]:
+            result = self.binary('and', result, node)
+        return result
+
+    def parse(self, expression):
+        """
+        Add a rule written as an expression string
+
+        Supports and/or/not (also &&, ||, !), comparisons, crosses_above and
+        crosses_below, + - * /, parentheses and lookbacks such as close[-1].
+
+        Args:
+            expression (str): Expression, e.g. "SMA_20 crosses_above SMA_50 and RSI_14 < 70"
+
+        Returns:
+            int: Node id
+        """
+        return _Parser(self, expression).parse()
+
+    def evaluate(self, bars, roots, length=None):
+        """
+        Evaluate root nodes over arrays of bars in one vectorized pass
+
+        Arrays may have any shape; time runs along the last axis, so a
+        (symbols, bars) matrix evaluates every symbol at once. Intermediate
+        results are released as soon as their last consumer has run.
+
+        Args:
+            bars (dict): Column name -> numpy array (or anything np.asarray accepts)
+            roots (dict): Output name -> node id
+            length (int): Number of bars, only needed when no columns are read
+
+        Returns:
+            dict: Output name -> boolean (or float) array per bar
+        """
+        needed = self._reachable(roots.values())
+        last_use = {}
+        for node_id in needed:
+            op, args, _ = self.nodes[node_id]
+            for arg in self._operands(op, args):
+                last_use[arg] = node_id
+        for node_id in roots.values():
+            last_use[node_id] = len(self.nodes)
+
+        shape = None
+        values = {}
+        for node_id in needed:
+            op, args, kind = self.nodes[node_id]
+            if op == 'column':
+                if args[0] not in bars:
+                    raise StrategyCompileError(f"Column '{args[0]}' not found in data")
+                value = np.asarray(bars[args[0]], dtype=float)
+                shape = value.shape if shape is None else np.broadcast_shapes(shape, value.shape)
+            elif op == 'const':
+                value = args[0]
+            elif op == 'shift':
+                value = _shift(values[args[0]], args[1], kind)
+            elif op == 'not':
+                value = np.logical_not(values[args[0]])
+            else:
+                func = _LOGICAL.get(op) or _COMPARISONS.get(op) or _ARITHMETIC[op]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    value = func(values[args[0]], values[args[1]])
+            values[node_id] = value
+            for arg in self._operands(op, args):
+                if last_use.get(arg) == node_id:
+                    values.pop(arg, None)
+
+        if shape is None:
+            shape = (length or 0,)
+        return {name: np.broadcast_to(values[node_id], shape) for name, node_id in roots.items()}
+
+    def lookback(self, roots):
+        """
+        Get how many past bars the roots read through lookbacks and crossovers
+
+        Args:
+            roots: Node ids
+
+        Returns:
+            int: Deepest chain of shifts below any root
+        """
+        roots = list(roots)
+        depth = {}
+        for node_id in self._reachable(roots):
+            op, args, _ = self.nodes[node_id]
+            deepest = max((depth[arg] for arg in self._operands(op, args)), default=0)
+            depth[node_id] = deepest + (args[1] if op == 'shift' else 0)
+        return max((depth[node_id] for node_id in roots), default=0)
+
+    def _add(self, op, args, kind):
+        """Return the id of an identical node, adding it if it is new"""
+        key = (op, args)
+        node_id = self._index.get(key)
+        if node_id is None:
+            node_id = len(self.nodes)
+            self.nodes.append((op, args, kind))
+            self._index[key] = node_id
+        return node_id
+
+    def _expect(self, node, kind, op):
+        """Check an operand produces the kind of value an operator needs"""
+        if self.nodes[node][2] != kind:
+            wanted = 'a condition' if kind == 'bool' else 'a number'
+            raise StrategyCompileError(f"Operand of '{op}' must be {wanted}")
+
+    def _operands(self, op, args):
+        """Node ids an operation reads"""
+        if op in ('column', 'const'):
+            return ()
+        if op == 'shift':
+            return (args[0],)
+        return args
+
+    def _reachable(self, roots):
+        """Ids of the nodes the roots depend on, in evaluation order"""
+        seen = set()
+        stack = list(roots)
+        while stack:
+            node_id = stack.pop()
+            if node_id in seen:
+                continue
+            seen.add(node_id)
+            op, args, _ = self.nodes[node_id]
+            stack.extend(self._operands(op, args))
+        return sorted(seen)
+
+
+def _shift(value, lag, kind):
+    """Shift an array lag steps later along its last axis, padding with NaN/False"""
+    value = np.asarray(value)
+    if value.ndim == 0:
+        return value
+    fill = False if kind == 'bool' else np.nan
+    result = np.empty(value.shape, dtype=bool if kind == 'bool' else float)
+    result[..., :lag] = fill
+    result[..., lag:] = value[..., :-lag] if lag < value.shape[-1] else fill
+    return result
+
+
+class _Parser:
+    """Recursive-descent parser from expression strings to graph nodes"""
+
+    def __init__(self, graph, text):
+        self.graph = graph
+        self.text = text
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+
+    def parse(self):
+        node = self._or()
+        if self.pos != len(self.tokens):
+            raise StrategyCompileError(f"Unexpected '{self.tokens[self.pos][1]}' in expression: {self.text}")
+        return node
+
+    def _tokenize(self, text):
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = _TOKEN_RE.match(text, pos)
+            if not match:
+                raise StrategyCompileError(f"Invalid character at position {pos} in expression: {text}")
+            pos = match.end()
+            if match.group('number'):
+                tokens.append(('number', float(match.group('number'))))
+            elif match.group('name'):
+                name = match.group('name')
+                keyword = _KEYWORDS.get(name.lower())
+                tokens.append(('op', keyword) if keyword else ('name', name))
+            else:
+                op = match.group('op')
+                tokens.append(('op', _KEYWORDS.get(op, op)))
+        return tokens
+
+    def _peek(self, *ops):
+        if self.pos < len(self.tokens) and self.tokens[self.pos][0] == 'op' and self.tokens[self.pos][1] in ops:
+            return self.tokens[self.pos][1]
+        return None
+
+    def _take(self, op):
+        if not self._peek(op):
+            found = self.tokens[self.pos][1] if self.pos < len(self.tokens) else 'end of expression'
+            raise StrategyCompileError(f"Expected '{op}' but found '{found}' in expression: {self.text}")
+        self.pos += 1
+
+    def _or(self):
+        node = self._and()
+        while self._peek('or'):
+            self.pos += 1
+            node = self.graph.binary('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self._peek('and'):
+            self.pos += 1
+            node = self.graph.binary('and', node, self._not())
+        return node
+
+    def _not(self):
+        if self._peek('not'):
+            self.pos += 1
+            return self.graph.unary('not', self._not())
+        return self._comparison()
+
+    def _comparison(self):
+        node = self._sum()
+        op = self._peek(*_COMPARISONS, *_CROSSES)
+        if op:
+            self.pos += 1
+            node = self.graph.binary(op, node, self._sum())
+        return node
+
+    def _sum(self):
+        node = self._product()
+        while True:
+            op = self._peek('+', '-')
+            if not op:
+                return node
+            self.pos += 1
+            node = self.graph.binary(op, node, self._product())
+
+    def _product(self):
+        node = self._unary()
+        while True:
+            op = self._peek('*', '/')
+            if not op:
+                return node
+            self.pos += 1
+            node = self.graph.binary(op, node, self._unary())
+
+    def _unary(self):
+        if self._peek('-'):
+            self.pos += 1
+            return self.graph.unary('-', self._unary())
+        return self._postfix()
+
+    def _postfix(self):
+        node = self._atom()
+        while self._peek('['):
+            self.pos += 1
+            negative = bool(self._peek('-'))
+            if negative:
+                self.pos += 1
+            if self.pos >= len(self.tokens) or self.tokens[self.pos][0] != 'number':
+                raise StrategyCompileError(f"Lookback must be a whole number of bars in expression: {self.text}")
+            lag = self.tokens[self.pos][1]
+            if lag != int(lag) or (lag and not negative):
+                raise StrategyCompileError(f"Lookback must be a past bar such as [-1] in expression: {self.text}")
+            self.pos += 1
+            self._take(']')
+            node = self.graph.shift(node, int(lag))
+        return node
+
+    def _atom(self):
+        if self.pos >= len(self.tokens):
+            raise StrategyCompileError(f"Unexpected end of expression: {self.text}")
+        kind, value = self.tokens[self.pos]
+        if kind == 'number':
+            self.pos += 1
+            return self.graph.constant(value)
+        if kind == 'name':
+            self.pos += 1
+            return self.graph.column(value)
+        if value == '(':
+            self.pos += 1
+            node = self._or()
+            self._take(')')
+            return node
+        raise StrategyCompileError(f"Unexpected '{value}' in expression: {self.text}")
+
+
+class CompiledStrategy:
+    """Entry and exit conditions of a strategy compiled into one shared graph"""
+
+    def __init__(self, graph, entry, exit):
+        """
+        Initialize the compiled strategy
+
+        Args:
+            graph (ExpressionGraph): Graph holding the rule nodes
+            entry (int): Node id of the combined entry condition
+            exit (int): Node id of the combined exit condition
+        """
+        self.graph = graph
+        self.entry = entry
+        self.exit = exit
+
+    @property
+    def columns(self):
+        """Names of the bar and indicator columns the rules read"""
+        nodes = self.graph._reachable((self.entry, self.exit))
+        return sorted({self.graph.nodes[node][1][0] for node in nodes if self.graph.nodes[node][0] == 'column'})
+
+    @property
+    def lookback(self):
+        """Bars of history the rules read beyond the current bar"""
+        return self.graph.lookback((self.entry, self.exit))
+
+    def evaluate(self, bars, length=None):
+        """
+        Evaluate the entry and exit signals for every bar
+
+        Args:
+            bars (dict): Column name -> array, time along the last axis
+            length (int): Number of bars, only needed when no columns are read
+
+        Returns:
+            dict: 'entry' and 'exit' boolean arrays
+        """
+        signals = self.graph.evaluate(bars, {'entry': self.entry, 'exit': self.exit}, length=length)
+        return {name: signal.astype(bool) for name, signal in signals.items()}
+
+
+def _literals(expression):
+    """
+    Scan an expression for names and tunable numbers
+
+    Yields:
+        tuple: (kind, start, end, text, index) for each name and each number
+            outside a lookback subscript, where index counts those numbers
+    """
+    depth = 0
+    index = 0
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+        match = _TOKEN_RE.match(expression, pos)
+        if not match:
+            raise StrategyCompileError(f"Invalid character at position {pos} in expression: {expression}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'op':
+            depth += {'[': 1, ']': -1}.get(match.group('op'), 0)
+        elif kind == 'name':
+            yield kind, match.start(kind), match.end(kind), match.group(kind), None
+        elif depth == 0:
+            yield kind, match.start(kind), match.end(kind), match.group(kind), index
+            index += 1
+
+
+def expression_numbers(expression):
+    """
+    Get the numeric constants of an expression rule, e.g. the 30 in "RSI_14 < 30"
+
+    Lookback offsets such as the 1 in close[-1] are not included.
+
+    Args:
+        expression (str): Rule expression
+
+    Returns:
+        list: Constants in the order they appear
+    """
+    return [float(text) for kind, _, _, text, _ in _literals(expression) if kind == 'number']
+
+
+def rewrite_expression(expression, names=None, numbers=None):
+    """
+    Rename columns and replace numeric constants in an expression rule
+
+    Args:
+        expression (str): Rule expression
+        names (dict): Column name -> replacement name
+        numbers (dict): Position in expression_numbers() -> replacement value
+
+    Returns:
+        str: Rewritten expression
+    """
+    names = names or {}
+    numbers = numbers or {}
+    parts = []
+    last = 0
+    for kind, start, end, text, index in _literals(expression):
+        if kind == 'name' and text in names:
+            replacement = names[text]
+        elif kind == 'number' and index in numbers:
+            value = numbers[index]
+            replacement = repr(value) if value >= 0 else f"({value!r})"
+        else:
+            continue
+        parts.append(expression[last:start])
+        parts.append(str(replacement))
+        last = end
+    parts.append(expression[last:])
+    return ''.join(parts)
+
+
+def rule_numbers(rule):
+    """
+    Get the numeric constants of an entry or exit rule
+
+    Args:
+        rule (dict): Expression rule or block condition
+
+    Returns:
+        list: The expression's constants (see expression_numbers), or the
+            block condition's value if it is a number
+    """
+    if 'expression' in rule:
+        return expression_numbers(str(rule['expression']))
+    try:
+        return [float(rule.get('value', 0))]
+    except (TypeError, ValueError):
+        return []
+
+
+def rewrite_rule(rule, names=None, numbers=None):
+    """
+    Copy a rule with columns renamed and numeric constants replaced
+
+    Args:
+        rule (dict): Expression rule or block condition
+        names (dict): Column name -> replacement name
+        numbers (dict): Position in rule_numbers() -> replacement value
+
+    Returns:
+        dict: Rewritten rule
+    """
+    names = names or {}
+    rule = dict(rule)
+    if 'expression' in rule:
+        rule['expression'] = rewrite_expression(str(rule['expression']), names, numbers)
+        return rule
+    if rule.get('indicator') in names:
+        rule['indicator'] = names[rule['indicator']]
+    if numbers and 0 in numbers:
+        rule['value'] = numbers[0]
+    elif isinstance(rule.get('value'), str) and rule['value'] in names:
+        rule['value'] = names[rule['value']]
+    return rule
+
+
+def compile_rule(graph, rule, columns=None):
+    """
+    Add one entry or exit rule to a graph
+
+    Rules are either expression rules ({'expression': "..."}) or the block
+    editor's {indicator, operator, value} conditions, where value may be a
+    number or a column name.
+
+    Args:
+        graph (ExpressionGraph): Graph to add the rule to
+        rule (dict): Rule configuration
+        columns: Available column names; block conditions on other columns are skipped
+
+    Returns:
+        int: Node id of the condition, or None if the rule was skipped
+    """
+    if 'expression' in rule:
+        return graph.parse(str(rule['expression']))
+
+    indicator = rule.get('indicator')
+    operator = rule.get('operator', '>')
+    value = rule.get('value', 0)
+    if columns is not None and indicator not in columns:
+        logger.warning(f"Indicator '{indicator}' not found in data. Available: {list(columns)}")
+        return None
+    if operator not in _COMPARISONS and operator not in _CROSSES:
+        logger.warning(f"Unsupported operator: {operator}")
+        return None
+
+    if isinstance(value, str) and (columns is None or value in columns):
+        try:
+            compare = graph.constant(float(value))
+        except ValueError:
+            compare = graph.column(value)
+    else:
+        try:
+            compare = graph.constant(float(value))
+        except (ValueError, TypeError):
+            logger.warning(f"Could not convert value '{value}' to a number")
+            return None
+    return graph.binary(operator, graph.column(indicator), compare)
+
+
+def compile_strategy(strategy, columns=None, graph=None):
+    """
+    Compile a strategy's entry and exit rules into a single evaluation graph
+
+    Rules within each list are ANDed together, as before. Passing the same
+    graph for several strategies shares their common subexpressions.
+
+    Args:
+        strategy (dict): Strategy configuration with entry_rules and exit_rules
+        columns: Available column names, used to skip block conditions on missing data
+        graph (ExpressionGraph): Graph to add to, or None for a new one
+
+    Returns:
+        CompiledStrategy: Compiled strategy
+    """
+    graph = graph or ExpressionGraph()
+    roots = {}
+    for side in ('entry', 'exit'):
+        nodes = []
+        for rule in strategy.get(f'{side}_rules') or []:
+            node = compile_rule(graph, rule, columns)
+            if node is not None:
+                graph._expect(node, 'bool', f'{side} rule')
+                nodes.append(node)
+        roots[side] = graph.all_of(nodes)
+    logger.info(f"Compiled strategy into {len(graph.nodes)} expression nodes over {len(graph.columns)} columns")
+    return CompiledStrategy(graph, roots['entry'], roots['exit'])
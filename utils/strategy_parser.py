@@ -107,7 +107,11 @@ class StrategyParser:
             logger.info("No exit rules found, adding default rule")
             
             # Mirror the first entry rule with opposite condition
-            if self.entry_rules:
+            if self.entry_rules and 'expression' in self.entry_rules[0]:
+                self.exit_rules.append({
+                    'expression': f"not ({self.entry_rules[0]['expression']})"
+                })
+            elif self.entry_rules:
                 entry_rule = self.entry_rules[0]
                 exit_rule = entry_rule.copy()
                 
@@ -206,6 +210,49 @@ class StrategyParser:
             })
             logger.info(f"Added MACD indicator with parameters: fast={fast_period}, slow={slow_period}, signal={signal_period}")
         
+        elif indicator_type in ('BBANDS', 'BOLLINGER'):
+            period = int(block.get('period', 20))
+            std_dev = float(block.get('stdDev', 2.0))
+            self.indicators.append({
+                'type': 'BBANDS',
+                'parameters': {
+                    'period': period,
+                    'std_dev': std_dev,
+                    'price': 'close'
+                }
+            })
+            logger.info(f"Added Bollinger Bands indicator with period {period} and {std_dev} standard deviations")
+        
+        elif indicator_type == 'STOCH':
+            k_period = int(block.get('kPeriod', block.get('period', 14)))
+            d_period = int(block.get('dPeriod', 3))
+            self.indicators.append({
+                'type': 'STOCH',
+                'parameters': {
+                    'k_period': k_period,
+                    'd_period': d_period
+                }
+            })
+            logger.info(f"Added Stochastic indicator with parameters: k={k_period}, d={d_period}")
+        
+        elif indicator_type in ('ATR', 'VWAP', 'DONCHIAN'):
+            default_period = 14 if indicator_type == 'ATR' else 20
+            period = int(block.get('period', default_period))
+            self.indicators.append({
+                'type': indicator_type,
+                'parameters': {
+                    'period': period
+                }
+            })
+            logger.info(f"Added {indicator_type} indicator with period {period}")
+        
+        elif indicator_type == 'OBV':
+            self.indicators.append({
+                'type': 'OBV',
+                'parameters': {}
+            })
+            logger.info("Added OBV indicator")
+        
         else:
             logger.warning(f"Unsupported indicator type: {indicator_type}")
     
@@ -231,6 +278,18 @@ class StrategyParser:
                 logger.warning(f"Skipping non-dict condition: {condition}")
                 continue
             
+            # Expression conditions are compiled as written, e.g.
+            # "SMA_20 crosses_above SMA_50 and not (RSI_14 > 70)"
+            expression = condition.get('expression')
+            if expression:
+                rule = {'expression': str(expression)}
+                if is_entry:
+                    self.entry_rules.append(rule)
+                else:
+                    self.exit_rules.append(rule)
+                logger.info(f"Added {rule_type} rule: {expression}")
+                continue
+            
             # Extract condition parameters
             indicator = condition.get('indicator', '')
             operator = condition.get('operator', '>')
@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from utils import storage
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_DIR = 'data/saved_strategies'
+
+_catalog_lock = threading.Lock()
+_catalog_checked = set()
+
+
+def sanitize_name(name):
+    """Strip a strategy name down to characters that are safe in a filename"""
+    return ''.join(c for c in name if c.isalnum() or c in '._- ')
+
+
+def strategy_path(name):
+    """Get the file a strategy is stored in"""
+    return os.path.join(STRATEGY_DIR, f"{name}.json")
+
+
+def save_strategy(name, strategy_data):
+    """
+    Save a strategy file and its catalog entry together
+
+    The body is written to a temporary file that is renamed over the old one
+    inside the catalog transaction, so readers see either the old strategy and
+    entry or the new ones, never a partial file or a stale entry.
+
+    Args:
+        name (str): Sanitized strategy name
+        strategy_data (dict): Strategy body, including user_email
+
+    Returns:
+        dict: The new catalog entry
+
+    Raises:
+        PermissionError, IOError: If the file cannot be written
+    """
+    _ensure_catalog()
+    os.makedirs(STRATEGY_DIR, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=STRATEGY_DIR, prefix=f".{name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(strategy_data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        stat = os.stat(tmp_path)
+        entry = {
+            'name': name,
+            'email': strategy_data.get('user_email'),
+            'symbol': strategy_data.get('symbol'),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime
+        }
+        with storage.transaction() as conn:
+            storage.upsert_strategy(conn, entry)
+            os.replace(tmp_path, strategy_path(name))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return entry
+
+
+def list_strategies(email):
+    """
+    List the strategies a user can load, from the catalog only
+
+    Args:
+        email (str): User email
+
+    Returns:
+        list: Catalog entries (name, symbol, size, mtime) ordered by name
+    """
+    _ensure_catalog()
+    return [
+        {'name': entry['name'], 'symbol': entry['symbol'], 'size': entry['size'], 'mtime': entry['mtime']}
+        for entry in storage.list_strategy_entries(email)
+    ]
+
+
+def get_strategy_entry(name):
+    """
+    Get a strategy's catalog entry
+
+    Returns:
+        dict: Catalog fields (name, email, symbol, size, mtime) or None
+    """
+    _ensure_catalog()
+    return storage.get_strategy_entry(name)
+
+
+def reindex():
+    """
+    Rebuild the catalog by reading every strategy file
+
+    Only needed for files written outside save_strategy (e.g. copied in by
+    hand or saved before the catalog existed).
+
+    Returns:
+        int: Number of strategies catalogued
+    """
+    if not os.path.isdir(STRATEGY_DIR):
+        return 0
+
+    # Scan inside the write transaction so concurrent saves cannot be lost
+    count = 0
+    with storage.transaction() as conn:
+        conn.execute('DELETE FROM strategies')
+        with os.scandir(STRATEGY_DIR) as it:
+            for dir_entry in it:
+                if not dir_entry.name.endswith('.json') or dir_entry.name.startswith('.'):
+                    continue
+                try:
+                    with open(dir_entry.path, 'r') as f:
+                        strategy_data = json.load(f)
+                    stat = dir_entry.stat()
+                except Exception as e:
+                    logger.error(f"Error indexing strategy file {dir_entry.name}: {str(e)}")
+                    continue
+                storage.upsert_strategy(conn, {
+                    'name': dir_entry.name[:-len('.json')],
+                    'email': strategy_data.get('user_email'),
+                    'symbol': strategy_data.get('symbol'),
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime
+                })
+                count += 1
+    logger.info(f"Indexed {count} saved strategies")
+    return count
+
+
+def _ensure_catalog():
+    """Index existing strategy files once if the catalog has never been populated"""
+    key = (os.getpid(), storage.DB_PATH)
+    if key in _catalog_checked:
+        return
+    with _catalog_lock:
+        if key in _catalog_checked:
+            return
+        if storage.count_strategies() == 0:
+            reindex()
+        _catalog_checked.add(key)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(f"Indexed {reindex()} strategies from {STRATEGY_DIR}")
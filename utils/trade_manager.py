@@ -1,48 +1,30 @@
 import os
-import json
+import time
 import logging
-from datetime import datetime
-from flask import session
+import threading
+from utils import storage, leaderboard
+from utils.user_directory import account_exists
 
 logger = logging.getLogger(__name__)
-USER_DATA_FILE = 'data/users.json'
 
-def load_users():
-    """Load users from JSON file"""
-    try:
-        with open(USER_DATA_FILE, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading users: {str(e)}")
-        return {}
+# Seconds between background folds of journal tails into portfolio snapshots
+COMPACTION_INTERVAL = int(os.getenv('JOURNAL_COMPACTION_INTERVAL', 30))
 
-def save_users(users):
-    """Save users to JSON file"""
-    try:
-        with open(USER_DATA_FILE, 'w') as f:
-            json.dump(users, f, indent=4)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving users: {str(e)}")
-        return False
+_compactor_pid = None
 
-def save_paper_trade(email, trade_data):
+def save_paper_trade(email, trade_data, matching_engine):
     """
-    Save a paper trade for a user
+    Submit a paper-trading order for a user
     
     Args:
         email (str): User email
         trade_data (dict): Trade data
+        matching_engine (MatchingEngine): Engine that fills or rests the order
         
     Returns:
         tuple: (success, result)
     """
     try:
-        users = load_users()
-        
-        if email not in users:
-            return False, "User not found"
-        
         # Extract trade details
         symbol = trade_data.get('symbol')
         quantity = int(trade_data.get('quantity', 0))
@@ -67,159 +49,304 @@ def save_paper_trade(email, trade_data):
         if order_type == 'limit' and (price is None or price <= 0):
             return False, "Valid price is required for limit orders"
         
-        # Get user portfolio
-        portfolio = users[email]['portfolio']
-        cash = portfolio.get('cash', 10000.0)
-        
-        # Process the trade
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Create trade record
-        trade = {
-            'timestamp': timestamp,
-            'symbol': symbol,
-            'quantity': quantity,
-            'side': side,
-            'type': order_type,
-            'price': price if price else 100.0,  # Mock price for demo
-            'status': 'executed',
-            'notes': notes
-        }
-        
-        # Update portfolio cash (simplified)
-        if side == 'buy':
-            trade_value = quantity * trade['price']
-            if cash < trade_value:
-                return False, "Insufficient funds"
-            portfolio['cash'] = cash - trade_value
-        else:  # sell
-            trade_value = quantity * trade['price']
-            portfolio['cash'] = cash + trade_value
-        
-        # Add trade to history
-        if 'trades' not in portfolio:
-            portfolio['trades'] = []
-        
-        portfolio['trades'].append(trade)
-        
-        # Save updated user data
-        success = save_users(users)
-        if not success:
-            return False, "Failed to save trade"
+        if not account_exists(email):
+            return False, "User not found"
         
-        return True, trade
+        return matching_engine.submit_order(
+            email,
+            symbol=symbol,
+            side=side,
+            order_type=order_type,
+            quantity=quantity,
+            limit_price=price,
+            notes=notes
+        )
         
     except Exception as e:
         logger.error(f"Error saving paper trade: {str(e)}")
         return False, str(e)
 
-def get_user_portfolio(email):
+def get_order(email, order_id):
     """
-    Get a user's portfolio data
+    Get one of a user's orders
     
     Args:
         email (str): User email
+        order_id (str): Order id
         
     Returns:
-        dict: Portfolio data
+        dict: Order data, or None if the user has no such order
     """
-    try:
-        users = load_users()
-        
-        if email not in users:
-            return None
-        
-        portfolio = users[email].get('portfolio', {})
+    order = storage.get_order(order_id)
+    if order is None or order.pop('email') != email:
+        return None
+    return order
+
+def list_orders(email, status=None):
+    """
+    Get a user's most recent orders
+    
+    Args:
+        email (str): User email
+        status (str): Optional status filter ('open', 'filled', 'cancelled', ...)
         
-        # Calculate portfolio statistics
-        trades = portfolio.get('trades', [])
+    Returns:
+        list: Orders, newest first
+    """
+    return storage.list_orders(email, status=status)
+
+def apply_trade(snapshot, trade):
+    """
+    Fold a single trade into a portfolio snapshot
+    
+    Args:
+        snapshot (dict): Snapshot with positions, realized_pl, profitable_trades and trade_count
+        trade (dict): Trade record
+    """
+    symbol = trade['symbol']
+    side = trade['side']
+    quantity = trade['quantity']
+    price = trade['price']
+    positions = snapshot['positions']
+    
+    snapshot['trade_count'] += 1
+    
+    # Track positions
+    if side == 'buy':
+        current = positions.get(symbol, {'quantity': 0, 'avg_price': 0, 'total_cost': 0})
+        new_quantity = current['quantity'] + quantity
+        total_cost = current['total_cost'] + (quantity * price)
         
-        # Base stats
-        stats = {
-            'total_trades': len(trades),
-            'win_rate': 0.0,
-            'profit_loss': 0.0,
-            'active_positions': []
+        positions[symbol] = {
+            'quantity': new_quantity,
+            'avg_price': total_cost / new_quantity if new_quantity > 0 else 0,
+            'total_cost': total_cost
         }
         
-        # Calculate profit/loss and track positions
-        position_tracker = {}
-        profitable_trades = 0
-        
-        for trade in trades:
-            symbol = trade['symbol']
-            side = trade['side']
-            quantity = trade['quantity']
-            price = trade['price']
+    elif side == 'sell':
+        if symbol in positions:
+            current = positions[symbol]
             
-            # Track positions
-            if side == 'buy':
-                if symbol not in position_tracker:
-                    position_tracker[symbol] = {
-                        'quantity': 0,
-                        'avg_price': 0,
-                        'total_cost': 0
-                    }
-                
-                current = position_tracker[symbol]
-                new_quantity = current['quantity'] + quantity
-                total_cost = current['total_cost'] + (quantity * price)
+            # Calculate P/L for this sale
+            if current['quantity'] > 0:
+                sell_value = quantity * price
+                avg_cost = quantity * current['avg_price']
+                trade_pl = sell_value - avg_cost
+                snapshot['realized_pl'] += trade_pl
                 
-                position_tracker[symbol] = {
+                if trade_pl > 0:
+                    snapshot['profitable_trades'] += 1
+            
+            # Update position
+            new_quantity = current['quantity'] - quantity
+            if new_quantity <= 0:
+                del positions[symbol]
+            else:
+                # Proportionally reduce total cost
+                remaining_ratio = new_quantity / current['quantity']
+                positions[symbol] = {
                     'quantity': new_quantity,
-                    'avg_price': total_cost / new_quantity if new_quantity > 0 else 0,
-                    'total_cost': total_cost
+                    'avg_price': current['avg_price'],
+                    'total_cost': current['total_cost'] * remaining_ratio
                 }
-                
-            elif side == 'sell':
-                if symbol in position_tracker:
-                    current = position_tracker[symbol]
-                    
-                    # Calculate P/L for this sale
-                    if current['quantity'] > 0:
-                        sell_value = quantity * price
-                        avg_cost = quantity * current['avg_price']
-                        trade_pl = sell_value - avg_cost
-                        stats['profit_loss'] += trade_pl
-                        
-                        if trade_pl > 0:
-                            profitable_trades += 1
-                    
-                    # Update position
-                    new_quantity = current['quantity'] - quantity
-                    if new_quantity <= 0:
-                        position_tracker[symbol] = {
-                            'quantity': 0,
-                            'avg_price': 0,
-                            'total_cost': 0
-                        }
-                    else:
-                        # Proportionally reduce total cost
-                        remaining_ratio = new_quantity / current['quantity']
-                        position_tracker[symbol] = {
-                            'quantity': new_quantity,
-                            'avg_price': current['avg_price'],
-                            'total_cost': current['total_cost'] * remaining_ratio
-                        }
-        
-        # Calculate win rate
-        if len(trades) > 0:
-            stats['win_rate'] = (profitable_trades / len(trades)) * 100
-        
-        # Format active positions
-        for symbol, position in position_tracker.items():
-            if position['quantity'] > 0:
-                stats['active_positions'].append({
+
+def _fold_trades(conn, email, snapshot):
+    """
+    Bring a snapshot up to date with the trades recorded after it and persist it
+    
+    Args:
+        conn: Storage connection inside an open transaction
+        email (str): User email
+        snapshot (dict): Snapshot as returned by storage.get_snapshot
+        
+    Returns:
+        dict: The updated snapshot
+    """
+    if snapshot['snapshot_seq'] >= snapshot['last_seq']:
+        return snapshot
+    
+    changed = set()
+    for trade in storage.list_trades(email, after_seq=snapshot['snapshot_seq'], conn=conn):
+        apply_trade(snapshot, trade)
+        changed.add(trade['symbol'])
+    
+    snapshot['snapshot_seq'] = snapshot['last_seq']
+    storage.save_snapshot(conn, email, snapshot, changed)
+    leaderboard.update_entry(conn, email, snapshot)
+    return snapshot
+
+def compact_portfolios(limit=500):
+    """
+    Fold journal tails into the snapshots of users that have traded since the last run
+    
+    Args:
+        limit (int): Maximum number of users to compact in one run
+        
+    Returns:
+        int: Number of users compacted
+    """
+    emails = storage.list_stale_snapshots(limit)
+    for email in emails:
+        with storage.transaction() as conn:
+            snapshot = storage.get_snapshot(email, conn=conn)
+            if snapshot is not None:
+                _fold_trades(conn, email, snapshot)
+    
+    if emails:
+        storage.checkpoint()
+        logger.info(f"Compacted portfolio snapshots for {len(emails)} users")
+    return len(emails)
+
+def _compaction_loop(interval):
+    """Run compact_portfolios forever, every interval seconds"""
+    while True:
+        try:
+            while compact_portfolios() > 0:
+                pass
+        except Exception as e:
+            logger.error(f"Error compacting portfolios: {str(e)}")
+        time.sleep(interval)
+
+def start_compactor(interval=COMPACTION_INTERVAL):
+    """
+    Start the background journal compactor for this process
+    
+    Safe to call more than once; each worker process runs one compactor and
+    concurrent runs are serialized by the storage write lock.
+    
+    Args:
+        interval (int): Seconds between compaction runs
+    """
+    global _compactor_pid
+    if _compactor_pid == os.getpid():
+        return
+    _compactor_pid = os.getpid()
+    thread = threading.Thread(target=_compaction_loop, args=(interval,), name='journal-compactor', daemon=True)
+    thread.start()
+
+def rebuild_portfolio(email):
+    """
+    Rebuild a user's snapshot by replaying their full trade history
+    
+    Args:
+        email (str): User email
+        
+    Returns:
+        bool: False if the user does not exist
+    """
+    with storage.transaction() as conn:
+        storage.reset_snapshot(conn, email)
+        snapshot = storage.get_snapshot(email, conn=conn)
+        if snapshot is None:
+            return False
+        _fold_trades(conn, email, snapshot)
+    return True
+
+def check_portfolio(email):
+    """
+    Check that a user's snapshot plus journal tail matches a full replay of their trades
+    
+    Args:
+        email (str): User email
+        
+    Returns:
+        bool: True if the snapshot is consistent with the trade history
+    """
+    with storage.read_transaction() as conn:
+        snapshot = storage.get_snapshot(email, conn=conn)
+        if snapshot is None:
+            return False
+        
+        replayed = {'positions': {}, 'realized_pl': 0.0, 'profitable_trades': 0, 'trade_count': 0}
+        for trade in storage.list_trades(email, after_seq=0, conn=conn):
+            apply_trade(replayed, trade)
+        
+        for trade in storage.list_trades(email, after_seq=snapshot['snapshot_seq'], conn=conn):
+            apply_trade(snapshot, trade)
+    
+    if snapshot['trade_count'] != replayed['trade_count'] or snapshot['profitable_trades'] != replayed['profitable_trades']:
+        return False
+    if abs(snapshot['realized_pl'] - replayed['realized_pl']) > 1e-6:
+        return False
+    if set(snapshot['positions']) != set(replayed['positions']):
+        return False
+    return all(
+        snapshot['positions'][symbol]['quantity'] == position['quantity'] and
+        abs(snapshot['positions'][symbol]['total_cost'] - position['total_cost']) <= 1e-6
+        for symbol, position in replayed['positions'].items()
+    )
+
+def get_portfolio_version(email):
+    """
+    Get the current version of a user's portfolio
+    
+    The version is the sequence number of the user's latest journal entry, so
+    it changes exactly when cash, positions or trade history change.
+    
+    Args:
+        email (str): User email
+        
+    Returns:
+        int: Portfolio version, or None if the user does not exist
+    """
+    return storage.get_journal_seq(email)
+
+def get_user_portfolio(email, after_seq=0, limit=None):
+    """
+    Get a user's portfolio data
+    
+    Stats and positions come from the latest compacted snapshot; only the
+    journal tail recorded since the last compaction is replayed.
+    
+    Args:
+        email (str): User email
+        after_seq (int): Cursor; only trades recorded after it are returned
+        limit (int): Maximum number of trades to return, or None for all
+        
+    Returns:
+        dict: Portfolio data, with 'cursor' set to the last trade returned
+        and 'version' to the portfolio version the data reflects
+    """
+    try:
+        # One read transaction, so a compaction committed between these reads
+        # cannot fold the tail into the snapshot after it has been read
+        with storage.read_transaction() as conn:
+            snapshot = storage.get_snapshot(email, conn=conn)
+            
+            if snapshot is None:
+                return None
+            
+            # Replay the journal tail in memory; compaction persists it later
+            for trade in storage.list_trades(email, after_seq=snapshot['snapshot_seq'], conn=conn):
+                apply_trade(snapshot, trade)
+            
+            trades = storage.list_trades(email, after_seq=after_seq, conn=conn, limit=limit)
+        
+        trade_count = snapshot['trade_count']
+        stats = {
+            'total_trades': trade_count,
+            'win_rate': (snapshot['profitable_trades'] / trade_count) * 100 if trade_count > 0 else 0.0,
+            'profit_loss': snapshot['realized_pl'],
+            'active_positions': [
+                {
                     'symbol': symbol,
                     'quantity': position['quantity'],
                     'avg_price': position['avg_price'],
                     'total_cost': position['total_cost']
-                })
+                }
+                for symbol, position in snapshot['positions'].items()
+            ]
+        }
+        
+        cursor = trades[-1]['seq'] if trades else after_seq
         
         return {
-            'cash': portfolio.get('cash', 10000.0),
+            'cash': snapshot['cash'],
             'trades': trades,
-            'stats': stats
+            'stats': stats,
+            'cursor': cursor,
+            'has_more': cursor < snapshot['last_seq'],
+            'version': snapshot['last_seq']
         }
         
     except Exception as e:
@@ -0,0 +1,111 @@
+import time
+import threading
+from collections import OrderedDict
+from utils import storage
+
+# Maximum number of accounts kept in memory per process
+MAX_CACHED_ACCOUNTS = 10000
+
+# Seconds between checks of the account version, so a cache hit costs no query
+VERSION_CHECK_INTERVAL = 1.0
+
+
+class UserDirectory:
+    """
+    In-memory index of user accounts keyed by email
+
+    Entries are dropped whenever the database's account version changes,
+    which any process bumps (via triggers) when it creates or updates an
+    account. The version is read at most once per check interval, so an
+    update made by another worker can take that long to show up. Unknown
+    and unverified accounts are never cached: registrations and
+    verifications made elsewhere are seen on the very next lookup.
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_ACCOUNTS, check_interval=VERSION_CHECK_INTERVAL):
+        """
+        Initialize an empty directory
+
+        Args:
+            max_entries (int): Maximum number of cached accounts
+            check_interval (float): Seconds between account version checks
+        """
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._accounts = OrderedDict()
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _current_version(self):
+        """Get the account version, reading it from the database at most once per check interval"""
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return self._version
+        version = storage.get_directory_version()
+        with self._lock:
+            if version != self._version:
+                self._accounts.clear()
+                self._version = version
+            self._checked_at = now
+        return version
+
+    def get(self, email):
+        """
+        Look up a user account
+
+        Args:
+            email (str): User email
+
+        Returns:
+            dict: Account fields (email, username, password, verified) or None
+        """
+        version = self._current_version()
+        with self._lock:
+            account = self._accounts.get(email)
+            if account is not None:
+                self._accounts.move_to_end(email)
+                return dict(account)
+
+        user = storage.get_user(email)
+        if user is None:
+            return None
+        account = {
+            'email': user['email'],
+            'username': user['username'],
+            'password': user['password'],
+            'verified': user['verified']
+        }
+
+        with self._lock:
+            if account['verified'] and self._version == version:
+                self._accounts[email] = account
+                if len(self._accounts) > self.max_entries:
+                    self._accounts.popitem(last=False)
+        return dict(account)
+
+    def exists(self, email):
+        """Check whether an account is registered for an email"""
+        return self.get(email) is not None
+
+    def invalidate(self):
+        """Drop every cached account"""
+        with self._lock:
+            self._accounts.clear()
+            self._version = None
+            self._checked_at = None
+
+
+# Directory shared by the auth and trading modules of this process
+directory = UserDirectory()
+
+
+def get_account(email):
+    """Look up a user account in the shared directory"""
+    return directory.get(email)
+
+
+def account_exists(email):
+    """Check whether an account is registered in the shared directory"""
+    return directory.exists(email)